@@ -33,6 +33,11 @@ class VMARM(azure_vm.BaseVM):
     This class handles all basic VM operations for ARM.
     """
 
+    RUNNING_STATES = ["PowerState/running"]
+    STOPPED_STATES = ["PowerState/stopped"]
+    DEALLOCATED_STATES = ["PowerState/deallocated"]
+    FAILED_STATES = ["ProvisioningState/failed"]
+
     def __init__(self, name, size, params):
         """
         Initialize the object and set a few attributes.
@@ -47,100 +52,166 @@ class VMARM(azure_vm.BaseVM):
         super(VMARM, self).__init__(name, size, params)
         logging.info("Azure VM '%s'", self.name)
 
-    def vm_create(self, options=''):
+    def vm_create(self, options='', deadline=None):
         """
         This helps to create a VM
 
         :param options: extra options
+        :param deadline: utils_misc.Deadline of the calling operation
         :return: Zero if success to create VM
         """
-        if not self.exists():
-            return azure_cli_arm.vm_create(self.params, options).exit_status
+        if not self.exists(deadline=deadline):
+            return azure_cli_arm.vm_create(self.params, options,
+                                           deadline=deadline).exit_status
 
-    def vm_update(self, params):
+    def vm_update(self, params, deadline=None):
         """
         This helps to update VM info
 
         :param params: A dict containing VM params
+        :param deadline: utils_misc.Deadline of the calling operation
         """
         if params is None:
-            self.params = azure_cli_arm.vm_show(self.params["name"]).stdout
+            self.params = azure_cli_arm.vm_show(self.params["name"],
+                                                deadline=deadline).stdout
         else:
             self.params = params
 
-    def verify_alive(self):
+    def _vm_state(self, vm):
+        """
+        Get the state of the VM from its properties.
+
+        :param vm: The VM properties given by vm show or vm list, with the
+                   power state of the cli (e.g. "VM running") or the
+                   instance view of the API
+        :return: The power state code of the VM (e.g. PowerState/running),
+                 ProvisioningState/failed if its provisioning failed, None
+                 if it does not exist
+        """
+        if not isinstance(vm, dict):
+            return None
+        properties = vm.get("properties", vm)
+        view = properties.get("instanceView") or vm.get("instanceView") or {}
+        codes = [status.get("code", "") for status in
+                 view.get("statuses", [])]
+        provisioning = properties.get("provisioningState") or ""
+        if provisioning.lower() == "failed" or \
+           [code for code in codes
+            if code.startswith("ProvisioningState/failed")]:
+            return "ProvisioningState/failed"
+        for code in codes:
+            if code.startswith("PowerState/"):
+                return code
+        if vm.get("powerState"):
+            return "PowerState/%s" % vm["powerState"].split()[-1].lower()
+        return None
+
+    def get_state(self, deadline=None):
+        """
+        Get the state of the VM, e.g. PowerState/running.
+
+        :param deadline: utils_misc.Deadline of the calling operation
+        :return: The state, None if the VM does not exist
+        """
+        return self._vm_state(azure_cli_arm.vm_show(
+            self.name, deadline=deadline).stdout)
+
+    def verify_alive(self, deadline=None):
         """
         Make sure the VM is alive.
 
+        :param deadline: utils_misc.Deadline of the calling operation
         :raise VMDeadError: If the VM is dead
         """
-        raise NotImplementedError
+        state = self.get_state(deadline=deadline)
+        if state not in self.RUNNING_STATES:
+            raise azure_vm.VMDeadError(self.name, state)
 
-    def is_running(self):
+    def is_running(self, deadline=None):
         """
         Return True if VM is running.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        raise NotImplementedError
+        return self.get_state(deadline=deadline) in self.RUNNING_STATES
 
-    def is_stopped(self):
+    def is_stopped(self, deadline=None):
         """
         Return True if VM is stopped.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        raise NotImplementedError
+        return self.get_state(deadline=deadline) in self.STOPPED_STATES
 
-    def is_deallocated(self):
+    def is_deallocated(self, deadline=None):
         """
         Return True if VM is deallocated.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        raise NotImplementedError
+        return self.get_state(deadline=deadline) in self.DEALLOCATED_STATES
 
-    def exists(self):
+    def exists(self, deadline=None):
         """
         Return True if VM exists.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        ret = azure_cli_arm.vm_show(self.name)
+        ret = azure_cli_arm.vm_show(self.name, deadline=deadline)
         if not isinstance(ret.stdout, dict) and \
            ret.stdout.strip() == "No VMs found":
             return False
         else:
             return True
 
-    def restart(self, timeout=azure_vm.BaseVM.RESTART_TIMEOUT):
+    def restart(self, timeout=azure_vm.BaseVM.RESTART_TIMEOUT, deadline=None):
         """
         Reboot the VM and wait for it to come back up by trying to log in until
         timeout expires.
 
         :param timeout: Time to wait for login to succeed (after rebooting).
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        return azure_cli_arm.vm_restart(self.name, timeout=timeout).exit_status
+        return azure_cli_arm.vm_restart(self.name, timeout=timeout,
+                                        deadline=deadline).exit_status
 
-    def start(self):
+    def start(self, deadline=None):
         """
         Starts this VM.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        return azure_cli_arm.vm_start(self.name).exit_status
+        return azure_cli_arm.vm_start(self.name, deadline=deadline).exit_status
 
-    def shutdown(self):
+    def shutdown(self, deadline=None):
         """
         Shuts down this VM.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        return azure_cli_arm.vm_shutdown(self.name).exit_status
+        return azure_cli_arm.vm_shutdown(self.name,
+                                         deadline=deadline).exit_status
 
-    def delete(self, timeout=azure_vm.BaseVM.DELETE_TIMEOUT):
+    def delete(self, timeout=azure_vm.BaseVM.DELETE_TIMEOUT, deadline=None):
         """
         Delete this VM.
 
         :param timeout: Time to wait for deleting the VM.
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        return azure_cli_arm.vm_delete(self.name, timeout=timeout).exit_status
+        return azure_cli_arm.vm_delete(self.name, timeout=timeout,
+                                       deadline=deadline).exit_status
 
     def capture(self, vm_image_name, cmd_params=None,
-                timeout=azure_vm.BaseVM.DEFAULT_TIMEOUT):
+                timeout=azure_vm.BaseVM.DEFAULT_TIMEOUT, deadline=None):
         """
         Capture this VM.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
         return azure_cli_arm.vm_capture(self.name, vm_image_name, cmd_params,
-                                        timeout=timeout).exit_status
+                                        timeout=timeout,
+                                        deadline=deadline).exit_status
 
     def get_public_address(self):
         """
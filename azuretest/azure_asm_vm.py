@@ -23,6 +23,7 @@ from avocado.core import exceptions
 from . import azure_vm
 from . import azure_cli_asm
 from . import azure_cli_common
+from . import azure_tracker
 from . import remote
 from . import data_dir
 from . import utils_misc
@@ -33,6 +34,12 @@ class VMASM(azure_vm.BaseVM):
     This class handles all basic VM operations for ASM.
     """
 
+    RUNNING_STATES = ["ReadyRole"]
+    STOPPED_STATES = ["StoppedVM"]
+    DEALLOCATED_STATES = ["StoppedDeallocated"]
+    FAILED_STATES = ["ProvisioningFailed", "ProvisioningTimeout",
+                     "FailedStartingRole", "FailedStartingVM"]
+
     def __init__(self, name, size, params):
         """
         Initialize the object and set a few attributes.
@@ -112,100 +119,148 @@ class VMASM(azure_vm.BaseVM):
         super(VMASM, self).__init__(name, size, params)
         logging.info("Azure VM '%s'", self.name)
 
-    def vm_create(self, options=''):
+    def vm_create(self, options='', deadline=None):
         """
         This helps to create a VM
 
         :param options: extra options
+        :param deadline: utils_misc.Deadline of the calling operation
         :return: Zero if success to create VM
         """
-        if not self.exists():
-            return azure_cli_asm.vm_create(self.params, options).exit_status
+        if not self.exists(deadline=deadline):
+            return azure_cli_asm.vm_create(self.params, options,
+                                           deadline=deadline).exit_status
 
-    def vm_update(self, params):
+    def vm_update(self, params, deadline=None):
         """
         This helps to update VM info
 
         :param params: A dict containing VM params
+        :param deadline: utils_misc.Deadline of the calling operation
         """
         if params is None:
-            self.params = azure_cli_asm.vm_show(self.params["name"]).stdout
+            self.params = azure_cli_asm.vm_show(self.params["name"],
+                                                deadline=deadline).stdout
         else:
             self.params = params
 
-    def verify_alive(self):
+    def _vm_state(self, vm):
+        """
+        Get the state of the VM from its properties.
+
+        :param vm: The VM properties given by vm show or vm list
+        :return: The InstanceStatus of the VM, None if it does not exist
+        """
+        if not isinstance(vm, dict):
+            return None
+        return vm.get("InstanceStatus")
+
+    def get_state(self, deadline=None):
+        """
+        Get the state of the VM, e.g. ReadyRole.
+
+        :param deadline: utils_misc.Deadline of the calling operation
+        :return: The state, None if the VM does not exist
+        """
+        return self._vm_state(azure_cli_asm.vm_show(
+            self.name, deadline=deadline).stdout)
+
+    def verify_alive(self, deadline=None):
         """
         Make sure the VM is alive.
 
+        :param deadline: utils_misc.Deadline of the calling operation
         :raise VMDeadError: If the VM is dead
         """
-        raise NotImplementedError
+        state = self.get_state(deadline=deadline)
+        if state not in self.RUNNING_STATES:
+            raise azure_vm.VMDeadError(self.name, state)
 
-    def is_running(self):
+    def is_running(self, deadline=None):
         """
         Return True if VM is running.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        raise NotImplementedError
+        return self.get_state(deadline=deadline) in self.RUNNING_STATES
 
-    def is_stopped(self):
+    def is_stopped(self, deadline=None):
         """
         Return True if VM is stopped.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        raise NotImplementedError
+        return self.get_state(deadline=deadline) in self.STOPPED_STATES
 
-    def is_deallocated(self):
+    def is_deallocated(self, deadline=None):
         """
         Return True if VM is deallocated.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        raise NotImplementedError
+        return self.get_state(deadline=deadline) in self.DEALLOCATED_STATES
 
-    def exists(self):
+    def exists(self, deadline=None):
         """
         Return True if VM exists.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        ret = azure_cli_asm.vm_show(self.name)
+        ret = azure_cli_asm.vm_show(self.name, deadline=deadline)
         if not isinstance(ret.stdout, dict) and \
            ret.stdout.strip() == "No VMs found":
             return False
         else:
             return True
 
-    def restart(self, timeout=azure_vm.BaseVM.RESTART_TIMEOUT):
+    def restart(self, timeout=azure_vm.BaseVM.RESTART_TIMEOUT, deadline=None):
         """
         Reboot the VM and wait for it to come back up by trying to log in until
         timeout expires.
 
         :param timeout: Time to wait for login to succeed (after rebooting).
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        return azure_cli_asm.vm_restart(self.name, timeout=timeout).exit_status
+        return azure_cli_asm.vm_restart(self.name, timeout=timeout,
+                                        deadline=deadline).exit_status
 
-    def start(self):
+    def start(self, deadline=None):
         """
         Starts this VM.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        return azure_cli_asm.vm_start(self.name).exit_status
+        return azure_cli_asm.vm_start(self.name, deadline=deadline).exit_status
 
-    def shutdown(self):
+    def shutdown(self, deadline=None):
         """
         Shuts down this VM.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        return azure_cli_asm.vm_shutdown(self.name).exit_status
+        return azure_cli_asm.vm_shutdown(self.name,
+                                         deadline=deadline).exit_status
 
-    def delete(self, timeout=azure_vm.BaseVM.DELETE_TIMEOUT):
+    def delete(self, timeout=azure_vm.BaseVM.DELETE_TIMEOUT, deadline=None):
         """
         Delete this VM.
 
         :param timeout: Time to wait for deleting the VM.
+        :param deadline: utils_misc.Deadline of the calling operation
         """
-        return azure_cli_asm.vm_delete(self.name, timeout=timeout).exit_status
+        return azure_cli_asm.vm_delete(self.name, timeout=timeout,
+                                       deadline=deadline).exit_status
 
     def capture(self, vm_image_name, cmd_params=None,
-                timeout=azure_vm.BaseVM.DEFAULT_TIMEOUT):
+                timeout=azure_vm.BaseVM.DEFAULT_TIMEOUT, deadline=None):
         """
         Capture this VM.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
         return azure_cli_asm.vm_capture(self.name, vm_image_name, cmd_params,
-                                        timeout=timeout).exit_status
+                                        timeout=timeout,
+                                        deadline=deadline).exit_status
 
     def get_public_address(self):
         """
@@ -287,22 +342,27 @@ class Blob(object):
             self.update()
         logging.info("Azure Storage Blob '%s'", self.name)
 
-    def copy(self, params, options='--quiet', timeout=COPY_TIMEOUT):
+    def copy(self, params, options='--quiet', timeout=COPY_TIMEOUT,
+             deadline=None):
         """
         Start to copy the resource to the specified storage blob which
-        completes asynchronously
+        completes asynchronously, and wait for the copy (polled by the
+        azure_tracker if it is enabled)
 
         :param options: extra options
         :param params: A dict containing dest blob params
         :param timeout: Copy timeout
+        :param deadline: utils_misc.Deadline of the calling operation, the
+                         copy is given up when it passes
         :return:
         """
+        deadline = utils_misc.Deadline.within(deadline, timeout,
+                                              "copy to %s" %
+                                              params.get("dest_blob"))
         params["source_container"] = self.params["container"]
         params["source_blob"] = self.params["blob"]
         params["source_blob"] = self.params["blob"]
-        azure_cli_asm.blob_copy_start(params, options)
-        start_time = time.time()
-        end_time = start_time + timeout
+        azure_cli_asm.blob_copy_start(params, options, deadline=deadline)
 
         show_params = dict()
         show_params["connection_string"] = \
@@ -311,36 +371,57 @@ class Blob(object):
         show_params["container"] = params.get("dest_container", None)
         show_params["blob"] = params.get("dest_blob", None)
         show_params["sas"] = params.get("dest_sas", None)
-        rt = azure_cli_asm.blob_copy_show(show_params).stdout
-        while time.time() < end_time:
-            rt = azure_cli_asm.blob_copy_show(show_params).stdout
+        tracker = azure_tracker.get_tracker()
+        if tracker is not None:
+            operation = tracker.track_blob_copy(
+                show_params["blob"], show_params["container"],
+                show_params["connection_string"], show_params["sas"],
+                timeout=deadline.remaining())
+            try:
+                operation.result(deadline.remaining())
+            except utils_misc.DeadlineExceededError:
+                return False
+            except azure_tracker.OperationFailedError, e:
+                logging.error(e)
+                return None
+            return True
+        rt = {}
+        while not deadline.expired():
+            try:
+                rt = azure_cli_asm.blob_copy_show(show_params,
+                                                  deadline=deadline).stdout
+            except utils_misc.DeadlineExceededError:
+                break
             if rt["copyStatus"] == "success":
                 return True
             else:
-                time.sleep(10)
-        if rt["copyStatus"] == "pending":
+                deadline.sleep(10)
+        if rt.get("copyStatus") == "pending":
             return False
 
-    def show(self, params=None, options=''):
+    def show(self, params=None, options='', deadline=None):
         """
         Show details of the specified storage blob
 
         :param params: Command properties
         :param options: extra options
+        :param deadline: utils_misc.Deadline of the calling operation
         :return: params - A dict containing blob params
         """
         show_params = params.copy()
         show_params["container"] = self.container
         show_params["connection_string"] = self.connection_string
-        return azure_cli_asm.blob_show(self.name, show_params, options).stdout
+        return azure_cli_asm.blob_show(self.name, show_params, options,
+                                       deadline=deadline).stdout
 
-    def update(self):
+    def update(self, deadline=None):
         """
         Update details of the specified storage container
 
+        :param deadline: utils_misc.Deadline of the calling operation
         :return:
         """
-        self.params = self.show()
+        self.params = self.show(deadline=deadline)
 
 
 class Container(object):
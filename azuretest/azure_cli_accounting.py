@@ -0,0 +1,182 @@
+"""
+Per-test accounting and budgets of the Azure cli calls.
+
+A test opens an account in setUp() and closes it in tearDown().  Meanwhile
+command() in azure_cli_asm and azure_cli_arm charges every cli call to the
+account under its verb, with the time spent in it:
+
+    azure_cli_accounting.start({"vm_show": 50})
+    ...
+    report = azure_cli_accounting.stop()
+
+A budget caps the number of calls of a verb (or of a wrapper, vm_show is
+the same as "vm show").  The call over the budget raises
+BudgetExceededError, which fails the test, so a polling loop that
+multiplies the API traffic is caught instead of going unnoticed.
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import json
+import logging
+import threading
+
+from avocado.core import exceptions
+
+
+class BudgetExceededError(exceptions.TestFail):
+
+    def __init__(self, verb, budget):
+        exceptions.TestFail.__init__(self, verb, budget)
+        self.verb = verb
+        self.budget = budget
+
+    def __str__(self):
+        return ("More than %d '%s' cli calls in the test, over its budget" %
+                (self.budget, self.verb))
+
+
+def parse_budgets(text):
+    """
+    Parse the budgets of a test parameter.
+
+    :param text: Comma separated "verb:max_calls", e.g.
+                 "vm_show:50,storage blob copy show:100"
+    :return: A dict of the max number of calls per verb or wrapper
+    """
+    budgets = {}
+    for item in (text or "").split(","):
+        if item.strip():
+            name, count = item.rsplit(":", 1)
+            budgets[name.strip()] = int(count)
+    return budgets
+
+
+def _verb(name):
+    # Budgets may name a wrapper (vm_show) instead of a verb (vm show)
+    if " " in name:
+        return name
+    from . import azure_cli_spec
+    for spec in azure_cli_spec.SPECS:
+        if spec.name == name:
+            return spec.verb
+    return name.replace("_", " ")
+
+
+class CallAccount(object):
+
+    """
+    Cli calls of a test, per verb.
+    """
+
+    def __init__(self, name=None, budgets=None):
+        """
+        :param name: Name of the test
+        :param budgets: A dict of the max number of calls per verb or wrapper
+        """
+        self.name = name
+        self.budgets = dict((_verb(key), value) for key, value in
+                            (budgets or {}).items())
+        self.calls = {}
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def charge(self, verb):
+        """
+        Count a call before running it.
+
+        :param verb: Verb of the call
+        :raise BudgetExceededError: If the call is over the budget of the
+                                    verb
+        """
+        with self._lock:
+            count = self.calls.get(verb, 0) + 1
+            self.calls[verb] = count
+        budget = self.budgets.get(verb)
+        if budget is not None and count > budget:
+            raise BudgetExceededError(verb, budget)
+
+    def record(self, verb, duration):
+        """
+        Add the time spent in a call.
+
+        :param verb: Verb of the call
+        :param duration: Wall time (seconds) of the call
+        """
+        with self._lock:
+            self.durations[verb] = self.durations.get(verb, 0) + duration
+
+    def report(self):
+        """
+        :return: A dict with the total number of calls and time, and the
+                 ones of every verb
+        """
+        with self._lock:
+            verbs = dict((verb, {"calls": count,
+                                 "duration": self.durations.get(verb, 0),
+                                 "budget": self.budgets.get(verb)})
+                         for verb, count in self.calls.items())
+        return {"test": self.name,
+                "calls": sum(v["calls"] for v in verbs.values()),
+                "duration": sum(v["duration"] for v in verbs.values()),
+                "verbs": verbs}
+
+    def log(self):
+        """
+        Log the report, the busiest verbs first.
+        """
+        report = self.report()
+        logging.info("%d cli calls in %.1fs", report["calls"],
+                     report["duration"])
+        for verb, data in sorted(report["verbs"].items(),
+                                 key=lambda item: -item[1]["calls"]):
+            budget = ""
+            if data["budget"] is not None:
+                budget = " (budget %d)" % data["budget"]
+            logging.info("  %-32s %5d calls %8.1fs%s", verb, data["calls"],
+                         data["duration"], budget)
+
+
+_account = None
+
+
+def start(budgets=None, name=None):
+    """
+    Open the account of a test.
+
+    :param budgets: A dict of the max number of calls per verb or wrapper,
+                    or a string for parse_budgets()
+    :param name: Name of the test
+    :return: The CallAccount object
+    """
+    global _account
+    if isinstance(budgets, basestring):
+        budgets = parse_budgets(budgets)
+    _account = CallAccount(name, budgets)
+    return _account
+
+
+def stop(path=None):
+    """
+    Close the account of the test and log its report.
+
+    :param path: Path of a JSON file to write the report to
+    :return: The report, None if no account is open
+    """
+    global _account
+    account, _account = _account, None
+    if account is None:
+        return None
+    account.log()
+    report = account.report()
+    if path:
+        with open(path, "w") as report_file:
+            json.dump(report, report_file, indent=2, sort_keys=True)
+    return report
+
+
+def get_account():
+    """
+    :return: The open CallAccount object, None if none
+    """
+    return _account
@@ -0,0 +1,174 @@
+"""
+Coroutine versions of the Azure cli wrappers in both arm and asm mode.
+
+The commands are built by the blocking wrappers in azure_cli_asm and
+azure_cli_arm (called with dry_run=True), and then run in asyncio
+subprocesses, so one event loop can drive many Azure operations at once:
+
+    cli = azure_cli_async.AsyncCLI(azure_cli_asm, limit=20)
+    loop.run_until_complete(asyncio.gather(cli.vm_show("vm1"),
+                                           cli.vm_show("vm2")))
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import os
+import json
+import time
+import signal
+import logging
+import inspect
+
+import trollius as asyncio
+from trollius import From, Return
+from avocado.utils import process
+
+from . import utils_misc
+from . import azure_cli_hooks
+from . import azure_cli_common
+from . import azure_cli_limiter
+from . import azure_cli_priority
+
+
+@asyncio.coroutine
+def command(cmd, **kwargs):
+    """
+    Coroutine version of the cli modules' command().
+
+    :param cmd: List of the program and its arguments, run without a
+                shell, or a command line run by the shell
+    :param kwargs: Additional args for running the command
+    :return: CmdResult object
+    :raise: CmdError if non-zero exit status and ignore_status=False
+    :raise CircuitOpenError: If the circuit of the command is open
+    :raise BudgetExceededError: If the command is over the budget of the test
+    """
+    azure_json = kwargs.get('azure_json', False)
+    debug = kwargs.get('debug', False)
+    ignore_status = kwargs.get('ignore_status', False)
+    timeout = kwargs.get('timeout', None)
+    if azure_json:
+        if isinstance(cmd, basestring):
+            cmd += " --json"
+        else:
+            cmd = cmd + ["--json"]
+    if debug:
+        logging.debug("command: %s", utils_misc.cmdline(cmd))
+    if timeout:
+        try:
+            timeout = int(timeout)
+        except ValueError:
+            logging.error("Ignore the invalid timeout value: %s", timeout)
+            timeout = None
+    deadline = kwargs.get('deadline', None)
+    if deadline is not None:
+        timeout = deadline.get_timeout(timeout)
+    mode = kwargs.get('mode', None)
+
+    env = None
+    profile = azure_cli_common.get_profile(mode)
+    if profile is not None:
+        env = dict(os.environ, **profile.env())
+
+    # Paced below without blocking the event loop
+    azure_cli_hooks.admit(cmd, mode, pace=False)
+    limiter = azure_cli_limiter.get_limiter()
+    priority = kwargs.get('priority', azure_cli_priority.current())
+    if limiter is not None and priority == azure_cli_priority.FOREGROUND:
+        wait = limiter.reserve()
+        if wait > 0:
+            yield From(asyncio.sleep(wait))
+    elif limiter is not None:
+        wait = limiter.reserve_background()
+        while wait > 0:
+            yield From(asyncio.sleep(wait))
+            wait = limiter.reserve_background()
+    ret = yield From(_run(cmd, timeout, env))
+    azure_cli_hooks.record(cmd, ret, mode, timeout)
+    # Logged before failing, the sync commands log their output as they run
+    if debug:
+        logging.debug("status: %s", ret.exit_status)
+        logging.debug("stdout: %s", ret.stdout.strip())
+        logging.debug("stderr: %s", ret.stderr.strip())
+    if ret.exit_status and not ignore_status:
+        raise process.CmdError(ret.command, ret)
+
+    if azure_json and not ret.exit_status:
+        try:
+            ret.stdout = json.loads(ret.stdout)
+        except ValueError as e:
+            logging.warn(e)
+    raise Return(ret)
+
+
+@asyncio.coroutine
+def _run(cmd, timeout=None, env=None):
+    start_time = time.time()
+    popen_kwargs = {"stdout": asyncio.subprocess.PIPE,
+                    "stderr": asyncio.subprocess.PIPE, "env": env}
+    if isinstance(cmd, basestring):
+        create = asyncio.create_subprocess_shell(cmd, **popen_kwargs)
+    else:
+        create = asyncio.create_subprocess_exec(*cmd, **popen_kwargs)
+    proc = yield From(create)
+    cmd = utils_misc.cmdline(cmd)
+    interrupted = False
+    try:
+        stdout, stderr = yield From(asyncio.wait_for(proc.communicate(),
+                                                     timeout))
+    except asyncio.TimeoutError:
+        logging.error("Command '%s' timed out after %ss", cmd, timeout)
+        proc.kill()
+        yield From(proc.wait())
+        stdout, stderr = "", ""
+        interrupted = True
+    status = proc.returncode
+    if interrupted:
+        status = -signal.SIGKILL
+    ret = process.CmdResult(cmd, stdout, stderr, status,
+                            time.time() - start_time)
+    ret.interrupted = interrupted
+    raise Return(ret)
+
+
+class AsyncCLI(object):
+
+    """
+    Coroutine versions of all the wrappers of a cli module.
+
+    Every wrapper of the module (vm_create, vm_show, blob_copy_show, ...) is
+    available as an attribute with the same arguments, returning a coroutine.
+    """
+
+    def __init__(self, module, limit=None):
+        """
+        :param module: azure_cli_asm or azure_cli_arm
+        :param limit: Max number of the cli commands running at the same time
+        """
+        self.module = module
+        self.limit = limit
+        self._semaphore = None
+        if limit:
+            self._semaphore = asyncio.Semaphore(limit)
+        for name, func in inspect.getmembers(module, inspect.isfunction):
+            if func.__module__ != module.__name__ or name == "command":
+                continue
+            setattr(self, name, self._make_coroutine(func))
+
+    def _make_coroutine(self, func):
+        @asyncio.coroutine
+        def wrapper(*args, **kwargs):
+            built = func(*args, dry_run=True, **kwargs)
+            if built is None:
+                raise Return(None)
+            cmd, run_kwargs = built
+            del run_kwargs["dry_run"]
+            if self._semaphore is None:
+                ret = yield From(command(cmd, **run_kwargs))
+            else:
+                with (yield From(self._semaphore)):
+                    ret = yield From(command(cmd, **run_kwargs))
+            raise Return(ret)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
@@ -0,0 +1,195 @@
+"""
+Run batches of Azure cli wrapper calls with an adaptive concurrency.
+
+The number of calls running at the same time follows an AIMD scheme: it
+grows by a fixed step after every window of successful calls, and shrinks
+by a factor once a call reports throttling or a timeout.  Throttled calls
+are retried after a back off.
+
+    calls = [(azure_cli_asm.vm_show, (name,)) for name in names]
+    results = azure_cli_batch.run_batch(calls, max_workers=16)
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import re
+import time
+import logging
+import threading
+
+from avocado.utils import process
+
+
+THROTTLE_PATTERNS = [r"TooManyRequests", r"[Tt]hrottl", r"\b429\b",
+                     r"ServerBusy", r"[Tt]oo many requests"]
+TIMEOUT_PATTERNS = [r"ETIMEDOUT", r"ESOCKETTIMEDOUT", r"[Tt]imed? ?out",
+                    r"OperationTimedOut"]
+
+OK = "ok"
+FAILED = "failed"
+THROTTLED = "throttled"
+TIMEOUT = "timeout"
+
+
+def classify(result):
+    """
+    Classify the outcome of a cli command.
+
+    :param result: CmdResult object
+    :return: One of OK, FAILED, THROTTLED or TIMEOUT
+    """
+    if getattr(result, "interrupted", False):
+        return TIMEOUT
+    if not result.exit_status:
+        return OK
+    output = "%s\n%s" % (result.stderr, result.stdout)
+    for pattern in THROTTLE_PATTERNS:
+        if re.search(pattern, output):
+            return THROTTLED
+    for pattern in TIMEOUT_PATTERNS:
+        if re.search(pattern, output):
+            return TIMEOUT
+    return FAILED
+
+
+class _Call(object):
+
+    def __init__(self, index, call):
+        func = call[0]
+        args = ()
+        kwargs = {}
+        if len(call) > 1:
+            args = call[1]
+        if len(call) > 2:
+            kwargs = call[2]
+        self.index = index
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.attempts = 0
+        self.not_before = 0
+        self.started = 0
+
+
+class BatchExecutor(object):
+
+    """
+    Run cli wrapper calls in threads with an AIMD concurrency limit.
+    """
+
+    def __init__(self, min_workers=1, max_workers=16, initial_workers=4,
+                 increase=1, decrease=0.5, retries=3, backoff=5):
+        """
+        :param min_workers: Lower bound of the concurrency
+        :param max_workers: Upper bound of the concurrency
+        :param initial_workers: Concurrency at the beginning of a batch
+        :param increase: Additive increase after a window of successes
+        :param decrease: Multiplicative decrease on throttling or timeout
+        :param retries: Max retries of a throttled or timed out call
+        :param backoff: Base back off (seconds) before retrying a call
+        """
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.initial_workers = initial_workers
+        self.increase = increase
+        self.decrease = decrease
+        self.retries = retries
+        self.backoff = backoff
+        self.limit = initial_workers
+        self._successes = 0
+        self._last_decrease = 0
+        self._cond = threading.Condition()
+
+    def _on_success(self):
+        self._successes += 1
+        if self._successes >= self.limit:
+            self._successes = 0
+            self.limit = min(self.max_workers, self.limit + self.increase)
+            logging.debug("Batch concurrency increased to %s", self.limit)
+
+    def _on_congestion(self, call):
+        self._successes = 0
+        # Only the calls started after the last decrease tell something new
+        if call.started < self._last_decrease:
+            return
+        self._last_decrease = time.time()
+        self.limit = max(self.min_workers, int(self.limit * self.decrease))
+        logging.debug("Batch concurrency decreased to %s", self.limit)
+
+    def _execute(self, call, pending, results, running):
+        try:
+            ret = call.func(*call.args, **call.kwargs)
+        except Exception, e:
+            ret = e
+        outcome = OK
+        if isinstance(ret, process.CmdError) and ret.result is not None:
+            outcome = classify(ret.result)
+        elif isinstance(ret, process.CmdResult):
+            outcome = classify(ret)
+        elif isinstance(ret, Exception):
+            # e.g. CircuitOpenError, DeadlineExceededError, VMPoolError
+            outcome = FAILED
+            for pattern in THROTTLE_PATTERNS:
+                if re.search(pattern, str(ret)):
+                    outcome = THROTTLED
+        with self._cond:
+            running.remove(call)
+            if outcome in (THROTTLED, TIMEOUT):
+                self._on_congestion(call)
+                if call.attempts <= self.retries:
+                    logging.debug("Retry %s after %s", call.func.__name__,
+                                  outcome)
+                    call.not_before = (time.time() +
+                                       self.backoff * call.attempts)
+                    pending.append(call)
+                    self._cond.notify_all()
+                    return
+            elif outcome == OK:
+                self._on_success()
+            results[call.index] = ret
+            self._cond.notify_all()
+
+    def run(self, calls):
+        """
+        Run the calls and wait for all of them.
+
+        :param calls: List of (func, args[, kwargs]) tuples
+        :return: List of the results in the order of the calls, each of them
+                 being what the call returned or the exception it raised
+        """
+        pending = [_Call(index, call) for index, call in enumerate(calls)]
+        results = [None] * len(pending)
+        running = []
+        self.limit = self.initial_workers
+        with self._cond:
+            while pending or running:
+                now = time.time()
+                ready = [c for c in pending if c.not_before <= now]
+                if ready and len(running) < self.limit:
+                    call = ready[0]
+                    pending.remove(call)
+                    call.attempts += 1
+                    call.started = now
+                    running.append(call)
+                    thread = threading.Thread(target=self._execute,
+                                              args=(call, pending, results,
+                                                    running))
+                    thread.daemon = True
+                    thread.start()
+                    continue
+                wait = None
+                if pending and not ready:
+                    wait = min(c.not_before for c in pending) - now
+                self._cond.wait(wait)
+        return results
+
+
+def run_batch(calls, **kwargs):
+    """
+    Run the calls with a new BatchExecutor.
+
+    :param calls: List of (func, args[, kwargs]) tuples
+    :param kwargs: Arguments of BatchExecutor
+    :return: List of the results in the order of the calls
+    """
+    return BatchExecutor(**kwargs).run(calls)
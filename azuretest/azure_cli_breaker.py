@@ -0,0 +1,280 @@
+"""
+Circuit breaker of the Azure cli commands.
+
+When a region or the storage service is degraded, every test keeps waiting
+out the full timeouts of vm_create or blob_copy_start.  The breaker follows
+the outcome of the commands per (mode, verb, location).  Once too many of
+the recent commands of a key failed, the circuit opens and command() raises
+CircuitOpenError for the following ones without running them.  After a
+cool-off period, a few probe commands are let through (half-open): a probe
+success closes the circuit, a probe failure opens it again.
+
+Timeouts and service errors count as failures; throttling is left to
+azure_cli_limiter, and the other errors (e.g. a missing resource) are
+answers of a healthy service.  The state is kept in a file under a file
+lock, so a degraded service found by one test process fails the following
+tests fast.  The breaker is disabled by default:
+
+    azure_cli_breaker.enable(failure_rate=0.5, cool_off=300)
+
+or, for all the processes of a job, $AZURE_CLI_BREAKER set to
+"failure_rate" or "failure_rate:cool_off".
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import os
+import re
+import json
+import time
+import fcntl
+import logging
+import tempfile
+import threading
+
+from . import azure_cli_batch
+from . import azure_cli_metrics
+
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(),
+                            "avocado-azure-breaker-%d" % os.getuid())
+
+# Errors of a degraded service, other than timeouts
+SERVICE_ERROR_PATTERNS = [r"InternalServerError", r"InternalError",
+                          r"ServiceUnavailable", r"ServerBusy",
+                          r"BadGateway", r"\b50[0234]\b",
+                          r"ECONNRESET", r"ECONNREFUSED"]
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+_LOCATION_RE = re.compile(r"(?:--location|-l)\s+(\"[^\"]*\"|'[^']*'|\S+)")
+
+
+def _describe(key):
+    return " ".join(part for part in key if part)
+
+
+class CircuitOpenError(Exception):
+
+    def __init__(self, key, retry_after):
+        Exception.__init__(self, key, retry_after)
+        self.key = key
+        self.retry_after = retry_after
+
+    def __str__(self):
+        return ("Circuit of '%s' is open after repeated failures, "
+                "retry in %.0fs" % (_describe(self.key), self.retry_after))
+
+
+def circuit_key(cmd, mode=None):
+    """
+    Get the circuit of a cli command.
+
+    :param cmd: Command line, or list of the program and its arguments
+    :param mode: "asm" or "arm"
+    :return: Tuple (mode, verb, location), location is "" if the command
+             has no location option
+    """
+    location = ""
+    if isinstance(cmd, basestring):
+        match = _LOCATION_RE.search(cmd)
+        if match:
+            location = match.group(1).strip("\"'")
+    else:
+        for index, arg in enumerate(cmd[:-1]):
+            if arg in ("--location", "-l"):
+                location = cmd[index + 1]
+    return (mode or "", azure_cli_metrics.cli_verb(cmd), location)
+
+
+def is_failure(result):
+    """
+    :param result: CmdResult object
+    :return: True if the command failed because of the service
+    """
+    outcome = azure_cli_batch.classify(result)
+    if outcome == azure_cli_batch.TIMEOUT:
+        return True
+    if outcome != azure_cli_batch.FAILED:
+        return False
+    output = "%s\n%s" % (result.stderr, result.stdout)
+    for pattern in SERVICE_ERROR_PATTERNS:
+        if re.search(pattern, output):
+            return True
+    return False
+
+
+class CircuitBreaker(object):
+
+    """
+    Circuits of the cli commands, stored in a file shared by several
+    processes.
+    """
+
+    def __init__(self, failure_rate=0.5, min_calls=5, window=20,
+                 cool_off=300, half_open_calls=1, path=DEFAULT_PATH):
+        """
+        :param failure_rate: Rate of failed commands of a circuit, among
+                             its last ones, that opens it
+        :param min_calls: Min number of recent commands before opening
+        :param window: Number of recent commands followed per circuit
+        :param cool_off: Time (seconds) a circuit stays open
+        :param half_open_calls: Number of probe commands run at once when
+                                the cool-off is over
+        :param path: Path of the state file
+        """
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.cool_off = cool_off
+        self.half_open_calls = half_open_calls
+        self.path = path
+        self.short_circuited = 0
+        self._lock = threading.Lock()
+
+    def _update(self, key, func):
+        # Run func(circuit, now) -> result on the circuit of key
+        name = "|".join(key)
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                content = os.read(fd, os.fstat(fd).st_size)
+                circuits = {}
+                if content.strip():
+                    try:
+                        circuits = json.loads(content)
+                    except ValueError:
+                        logging.warning("Reset the corrupted circuit "
+                                        "breaker state %s", self.path)
+                circuit = circuits.setdefault(name, {"state": CLOSED,
+                                                     "outcomes": [],
+                                                     "since": 0})
+                result = func(circuit, time.time())
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, json.dumps(circuits))
+                return result
+            finally:
+                os.close(fd)
+
+    def before(self, key):
+        """
+        Check that a command may run.
+
+        :param key: Circuit of the command, see circuit_key()
+        :raise CircuitOpenError: If the circuit is open
+        """
+        def check(circuit, now):
+            if circuit["state"] == OPEN:
+                retry_after = circuit["since"] + self.cool_off - now
+                if retry_after > 0:
+                    return retry_after
+                circuit["state"] = HALF_OPEN
+                circuit["since"] = now
+                circuit["probes"] = 0
+            if circuit["state"] == HALF_OPEN:
+                if now - circuit["since"] > self.cool_off:
+                    # The probes never reported back
+                    circuit["since"] = now
+                    circuit["probes"] = 0
+                if circuit["probes"] >= self.half_open_calls:
+                    return circuit["since"] + self.cool_off - now
+                circuit["probes"] += 1
+                logging.info("Probe the circuit of '%s'", _describe(key))
+            return None
+        retry_after = self._update(key, check)
+        if retry_after is not None:
+            self.short_circuited += 1
+            raise CircuitOpenError(key, retry_after)
+
+    def after(self, key, result):
+        """
+        Follow the outcome of a command.
+
+        :param key: Circuit of the command, see circuit_key()
+        :param result: CmdResult object
+        """
+        failed = is_failure(result)
+
+        def follow(circuit, now):
+            if circuit["state"] == HALF_OPEN:
+                circuit["outcomes"] = []
+                if failed:
+                    circuit["state"] = OPEN
+                    circuit["since"] = now
+                    logging.warning("Probe of '%s' failed, keep the circuit "
+                                    "open", _describe(key))
+                else:
+                    circuit["state"] = CLOSED
+                    logging.info("Close the circuit of '%s'", _describe(key))
+                return
+            if circuit["state"] != CLOSED:
+                return
+            outcomes = (circuit["outcomes"] + [failed])[-self.window:]
+            circuit["outcomes"] = outcomes
+            if len(outcomes) >= self.min_calls and \
+               sum(outcomes) >= self.failure_rate * len(outcomes):
+                circuit["state"] = OPEN
+                circuit["since"] = now
+                circuit["outcomes"] = []
+                logging.warning("%d of the last %d '%s' commands failed, "
+                                "open the circuit for %ds", sum(outcomes),
+                                len(outcomes), _describe(key), self.cool_off)
+        self._update(key, follow)
+
+    def state(self, key):
+        """
+        :param key: Circuit, see circuit_key()
+        :return: CLOSED, OPEN or HALF_OPEN
+        """
+        return self._update(key, lambda circuit, now: circuit["state"])
+
+    def reset(self):
+        """
+        Close all the circuits.
+        """
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+_breaker = None
+
+
+def enable(failure_rate=0.5, cool_off=300, path=DEFAULT_PATH, **kwargs):
+    """
+    Short-circuit the cli commands of the failing (mode, verb, location).
+
+    :param failure_rate: Rate of failed recent commands that opens a circuit
+    :param cool_off: Time (seconds) a circuit stays open
+    :param path: Path of the state file
+    :param kwargs: Other arguments of CircuitBreaker
+    :return: The CircuitBreaker object
+    """
+    global _breaker
+    _breaker = CircuitBreaker(failure_rate, cool_off=cool_off, path=path,
+                              **kwargs)
+    return _breaker
+
+
+def disable():
+    """
+    Run every cli command.
+    """
+    global _breaker
+    _breaker = None
+
+
+def get_breaker():
+    """
+    :return: The CircuitBreaker object, None if disabled
+    """
+    return _breaker
+
+
+if os.environ.get("AZURE_CLI_BREAKER"):
+    _values = os.environ["AZURE_CLI_BREAKER"].split(":")
+    enable(float(_values[0]), *[float(v) for v in _values[1:2]])
@@ -0,0 +1,193 @@
+"""
+TTL cache of the read-only Azure cli wrappers.
+
+The results of the read-only wrappers (see azure_cli_spec.READ_WRAPPERS)
+are kept for a per-wrapper TTL, keyed by (mode, wrapper, arguments).  Every
+mutating wrapper (see azure_cli_spec.WRITE_WRAPPERS) drops the cached
+results of the resources it changes once it returns.
+
+The cache is disabled by default:
+
+    azure_cli_cache.enable()
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import copy
+import time
+import logging
+import functools
+import threading
+
+from avocado.utils import process
+
+from . import azure_cli_common
+from . import azure_cli_spec
+
+
+DEFAULT_TTL = 10
+
+DEFAULT_TTLS = {
+    "vm_location_list": 3600,
+    "vm_image_show": 60,
+    "vm_image_list": 60,
+    "sto_acct_conn_show": 300,
+    "sto_acct_show": 60,
+    "sto_acct_keys_list": 300,
+    "container_show": 30,
+    "container_list": 30,
+    # Polling loops wait for these to change, so they are never cached
+    # (e.g. BaseVM.wait_for_state() polls vm_show, and vm_list and
+    # blob_list through the tracker)
+    "sto_acct_check": 0,
+    "blob_copy_show": 0,
+    "blob_list": 0,
+    "vm_show": 0,
+    "vm_list": 0,
+}
+
+
+class CLICache(object):
+
+    """
+    Results of the read-only wrappers with their expiry time.
+    """
+
+    def __init__(self, ttls=None, default_ttl=DEFAULT_TTL):
+        """
+        :param ttls: A dict of wrapper name and TTL (seconds), overriding
+                     DEFAULT_TTLS
+        :param default_ttl: TTL of the wrappers missing in ttls
+        """
+        self.ttls = DEFAULT_TTLS.copy()
+        if ttls:
+            self.ttls.update(ttls)
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def ttl(self, verb):
+        return self.ttls.get(verb, self.default_ttl)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self.hits += 1
+                return copy.deepcopy(entry[2])
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key, resource, result, generation):
+        """
+        Cache a result unless an invalidation happened since generation.
+        """
+        ttl = self.ttl(key[1])
+        if ttl <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (resource, time.time() + ttl,
+                                  copy.deepcopy(result))
+
+    def invalidate(self, resources):
+        """
+        Drop the results of the resources in both modes.
+
+        :param resources: Names of the resources, e.g. ("vm", "vm_disk")
+        """
+        with self._lock:
+            self.generation += 1
+            for key in [k for k, v in self._entries.items()
+                        if v[0] in resources]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _reader(func, mode, resource):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        cache = _cache
+        if cache is None or kwargs.get("dry_run", False):
+            return func(*args, **kwargs)
+        key = azure_cli_common.call_key(mode, func.__name__, args, kwargs)
+        ret = cache.get(key)
+        if ret is not None:
+            logging.debug("Use the cached result of %s", func.__name__)
+            return ret
+        generation = cache.generation
+        ret = func(*args, **kwargs)
+        if isinstance(ret, process.CmdResult) and not ret.exit_status:
+            cache.put(key, resource, ret, generation)
+        return ret
+    return wrapper
+
+
+def _writer(func, resources):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _cache is None or kwargs.get("dry_run", False):
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            cache = _cache
+            if cache is not None:
+                cache.invalidate(resources)
+    return wrapper
+
+
+def install(namespace, mode):
+    """
+    Wrap the wrappers of a cli module with the cache.
+
+    :param namespace: The globals() of azure_cli_asm or azure_cli_arm
+    :param mode: "asm" or "arm"
+    """
+    for name, resource in azure_cli_spec.READ_WRAPPERS.items():
+        if name in namespace:
+            namespace[name] = _reader(namespace[name], mode, resource)
+    for name, resources in azure_cli_spec.WRITE_WRAPPERS.items():
+        if name in namespace:
+            namespace[name] = _writer(namespace[name], resources)
+
+
+_cache = None
+
+
+def enable(ttls=None, default_ttl=DEFAULT_TTL):
+    """
+    Start caching the results of the read-only wrappers.
+
+    :param ttls: A dict of wrapper name and TTL (seconds)
+    :param default_ttl: TTL of the wrappers missing in ttls
+    :return: The CLICache object
+    """
+    global _cache
+    _cache = CLICache(ttls, default_ttl)
+    return _cache
+
+
+def disable():
+    """
+    Stop caching and drop all the cached results.
+    """
+    global _cache
+    _cache = None
+
+
+def get_cache():
+    """
+    Get the enabled cache.
+
+    :return: The CLICache object, None if the cache is not enabled
+    """
+    return _cache
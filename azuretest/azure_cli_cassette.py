@@ -0,0 +1,251 @@
+"""
+Record/replay cassettes of the Azure cli commands.
+
+In record mode, command() writes every cli command it runs (argv, exit
+status, stdout and stderr) as a JSON line of the cassette file.  In replay
+mode, command() answers from the cassette without running anything, so the
+harness can be tested and profiled offline:
+
+    azure_cli_cassette.enable("/tmp/life_cycle.cassette", "record")
+    ...
+    azure_cli_cassette.enable("/tmp/life_cycle.cassette", "replay")
+
+The commands recorded several times are replayed in the recorded order, and
+the last answer is repeated once they are exhausted.  Setting
+$AZURE_CLI_CASSETTE (and $AZURE_CLI_CASSETTE_MODE, "replay" by default)
+enables a cassette in every process of an avocado job.  The values of the
+SECRET_OPTIONS and SECRET_ARGS, and the keys, connection strings and SAS
+signatures in the output (see scrub_output()) are not recorded.  The calls served by the REST backend (see
+azure_rest) are recorded and replayed under their cli command too, see
+azure_cli_hooks.
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import os
+import re
+import json
+import fcntl
+import logging
+import threading
+
+from avocado.utils import process
+
+from . import utils_misc
+from . import azure_cli_metrics
+
+
+SECRET_OPTIONS = ["--password", "--connection-string",
+                  "--dest-connection-string", "--sas", "--source-sas",
+                  "--dest-sas", "--source-key"]
+# Index of the secret positional argument of the verbs
+SECRET_ARGS = {"vm disk upload": 2}
+# Fields of the JSON output holding a secret
+SECRET_FIELDS = ["primaryKey", "secondaryKey", "key", "sas",
+                 "connectionString"]
+
+_SECRET_RE = re.compile(r"(%s)(\s+)(\"[^\"]*\"|'[^']*'|\S+)" %
+                        "|".join(re.escape(o) for o in SECRET_OPTIONS))
+# Keys of the connection strings and signatures of the SAS
+_SECRET_TEXT_RE = re.compile(r"(AccountKey=|\bsig=)[^;&\"'\s]+")
+
+
+class CassetteError(Exception):
+
+    def __init__(self, msg, cmd):
+        Exception.__init__(self, msg, cmd)
+        self.msg = msg
+        self.cmd = cmd
+
+    def __str__(self):
+        return "%s: %s" % (self.msg, self.cmd)
+
+
+def scrub(cmd):
+    """
+    Hide the values of the SECRET_OPTIONS and SECRET_ARGS of a command.
+
+    :param cmd: Command line, or list of the program and its arguments
+    :return: The command, of the same type
+    """
+    verb = azure_cli_metrics.cli_verb(cmd)
+    position = None
+    if verb in SECRET_ARGS:
+        position = 1 + len(verb.split()) + SECRET_ARGS[verb]
+    if isinstance(cmd, basestring):
+        cmd = _SECRET_RE.sub(r"\1\2***", cmd)
+        words = cmd.split()
+        if position is not None and position < len(words):
+            words[position] = "***"
+            cmd = " ".join(words)
+        return cmd
+    argv = list(cmd)
+    for index, arg in enumerate(argv[:-1]):
+        if arg in SECRET_OPTIONS:
+            argv[index + 1] = "***"
+    if position is not None and position < len(argv):
+        argv[position] = "***"
+    return argv
+
+
+def _scrub_value(value):
+    if isinstance(value, dict):
+        scrubbed = {}
+        for key, item in value.items():
+            # The arm keys are [{"keyName": ..., "value": ...}]
+            if key in SECRET_FIELDS or (key == "value" and
+                                        "keyName" in value):
+                scrubbed[key] = "***"
+            else:
+                scrubbed[key] = _scrub_value(item)
+        return scrubbed
+    if isinstance(value, list):
+        return [_scrub_value(item) for item in value]
+    if isinstance(value, basestring):
+        return _SECRET_TEXT_RE.sub(r"\1***", value)
+    return value
+
+
+def scrub_output(stdout):
+    """
+    Hide the storage keys, connection string keys and SAS signatures of
+    the output of a command.
+
+    :param stdout: Output of the command, JSON or text
+    :return: The output, of the same type
+    """
+    if not isinstance(stdout, basestring):
+        return _scrub_value(stdout)
+    try:
+        data = json.loads(stdout)
+    except ValueError:
+        return _SECRET_TEXT_RE.sub(r"\1***", stdout)
+    return json.dumps(_scrub_value(data))
+
+
+class Cassette(object):
+
+    """
+    Cli commands and their results, stored as JSON lines.
+    """
+
+    def __init__(self, path, mode="replay"):
+        """
+        :param path: Path of the cassette file
+        :param mode: "record" or "replay"
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError("Unknown cassette mode: %s" % mode)
+        self.path = path
+        self.mode = mode
+        self.played = 0
+        self.recorded = 0
+        self._interactions = {}
+        self._lock = threading.Lock()
+        if mode == "replay":
+            self._load()
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def _load(self):
+        with open(self.path) as cassette_file:
+            for line in cassette_file:
+                if line.strip():
+                    data = json.loads(line)
+                    self._interactions.setdefault(data["command"],
+                                                  []).append(data)
+        logging.debug("Loaded %d cli commands from the cassette %s",
+                      len(self._interactions), self.path)
+
+    def play(self, cmd, ignore_status=False):
+        """
+        Get the recorded result of a command.
+
+        :param cmd: Command line, or list of the program and its arguments
+        :param ignore_status: If False, raise CmdError on non-zero status
+        :return: CmdResult object, with the raw stdout
+        :raise CassetteError: If the command was not recorded
+        :raise: CmdError if non-zero exit status and ignore_status=False
+        """
+        key = utils_misc.cmdline(scrub(cmd))
+        with self._lock:
+            recorded = self._interactions.get(key)
+            if not recorded:
+                raise CassetteError("Command not in the cassette %s" %
+                                    self.path, key)
+            if len(recorded) > 1:
+                data = recorded.pop(0)
+            else:
+                data = recorded[0]
+            self.played += 1
+        ret = process.CmdResult(key, data["stdout"], data["stderr"],
+                                data["exit_status"], 0)
+        ret.interrupted = data.get("interrupted", False)
+        if ret.exit_status and not ignore_status:
+            raise process.CmdError(key, ret)
+        return ret
+
+    def record(self, cmd, result):
+        """
+        Append a command and its result to the cassette file.
+
+        :param cmd: Command line, or list of the program and its arguments
+        :param result: CmdResult object, with the raw stdout
+        """
+        cmd = scrub(cmd)
+        data = {"command": utils_misc.cmdline(cmd),
+                "argv": None if isinstance(cmd, basestring) else cmd,
+                "exit_status": result.exit_status,
+                "stdout": scrub_output(result.stdout),
+                "stderr": scrub_output(result.stderr),
+                "duration": result.duration,
+                "interrupted": bool(getattr(result, "interrupted", False))}
+        line = json.dumps(data, sort_keys=True) + "\n"
+        with self._lock:
+            # Several test processes may record in the same cassette
+            with open(self.path, "a") as cassette_file:
+                fcntl.flock(cassette_file, fcntl.LOCK_EX)
+                try:
+                    cassette_file.write(line)
+                finally:
+                    fcntl.flock(cassette_file, fcntl.LOCK_UN)
+            self.recorded += 1
+
+
+_cassette = None
+
+
+def enable(path, mode="replay"):
+    """
+    Record the cli commands to a cassette, or replay them from it.
+
+    :param path: Path of the cassette file
+    :param mode: "record" or "replay"
+    :return: The Cassette object
+    """
+    global _cassette
+    _cassette = Cassette(path, mode)
+    logging.debug("Use the cassette %s in %s mode", path, mode)
+    return _cassette
+
+
+def disable():
+    """
+    Run the cli commands again.
+    """
+    global _cassette
+    _cassette = None
+
+
+def get_cassette():
+    """
+    :return: The Cassette object, None if disabled
+    """
+    return _cassette
+
+
+if os.environ.get("AZURE_CLI_CASSETTE"):
+    enable(os.environ["AZURE_CLI_CASSETTE"],
+           os.environ.get("AZURE_CLI_CASSETTE_MODE", "replay"))
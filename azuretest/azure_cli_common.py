@@ -4,11 +4,21 @@ Wrappers for the Azure cli functions in both arm and asm mode.
 :copyright: 2016 Red Hat Inc.
 """
 
+import os
+import re
+import json
+import time
+import fcntl
+import atexit
+import shutil
 import logging
 import pexpect
+import threading
 import subprocess
 import shlex
 
+from . import azure_rest
+
 
 def login_azure(username, password):
     """
@@ -48,6 +58,8 @@ def logout_azure(username):
     except:
         logging.error("Failed to logout with: %s", username)
         raise
+    if _session is not None and _session.username == username:
+        _session.clear()
     logging.debug("Logout successfully with: %s", username)
     return True
 
@@ -69,13 +81,279 @@ def account_clear(options=''):
         raise
 
 
+# Lifetime (seconds) of a shared login; the cli refreshes its access tokens
+# by itself, and a rejected login is detected from the cli errors anyway
+DEFAULT_SESSION_TTL = 12 * 3600
+
+# Errors of the cli commands rejected for their credentials
+AUTH_ERROR_PATTERNS = [r"azure login", r"[Cc]redentials have expired",
+                       r"access token (has expired|expiry)", r"AADSTS\d+"]
+
+
+def _config_dir():
+    return os.environ.get("AZURE_CONFIG_DIR",
+                          os.path.join(os.path.expanduser("~"), ".azure"))
+
+
+class CredentialSession(object):
+
+    """
+    Azure login shared by the test processes of a job.
+
+    The login is recorded in a session file next to the cli credentials,
+    so only the first process logs in; the others reuse the login until it
+    expires or the cli rejects it.
+    """
+
+    def __init__(self, username, password, ttl=DEFAULT_SESSION_TTL,
+                 path=None):
+        """
+        :param username: Azure subscription username
+        :param password: Azure subscription password
+        :param ttl: Lifetime (seconds) of a login
+        :param path: Path of the session file
+        """
+        self.username = username
+        self.password = password
+        self.ttl = ttl
+        self.path = path or os.path.join(_config_dir(),
+                                         "avocado-session.json")
+        self.logins = 0
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path) as session_file:
+                data = json.load(session_file)
+        except (IOError, ValueError):
+            return None
+        if data.get("username") != self.username:
+            return None
+        return data
+
+    def _write(self, data):
+        tmp_path = "%s.%d" % (self.path, os.getpid())
+        with open(tmp_path, "w") as session_file:
+            json.dump(data, session_file)
+        os.rename(tmp_path, self.path)
+
+    def login(self, rejected_at=None):
+        """
+        Log in, unless a valid login is recorded.
+
+        :param rejected_at: Time the cli rejected the login; log in again
+                            unless another process did after that time
+        :return: True if logged in
+        """
+        dirname = os.path.dirname(self.path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with self._lock:
+            with open(self.path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    data = self._read()
+                    if data is not None and data["expires_on"] > time.time():
+                        if rejected_at is None or \
+                           data["login_time"] > rejected_at:
+                            logging.debug("Reuse the login of %s",
+                                          self.username)
+                            return True
+                    login_time = time.time()
+                    if not login_azure(self.username, self.password):
+                        return False
+                    self.logins += 1
+                    self._write({"username": self.username,
+                                 "login_time": login_time,
+                                 "expires_on": login_time + self.ttl})
+                    return True
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def clear(self):
+        """
+        Forget the recorded login.
+        """
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+_session = None
+
+
+def is_auth_error(result):
+    """
+    :param result: CmdResult object of a cli command
+    :return: True if the cli rejected the credentials
+    """
+    output = "%s\n%s" % (result.stderr, result.stdout)
+    return any([re.search(p, output) for p in AUTH_ERROR_PATTERNS])
+
+
+def relogin_rejected(result):
+    """
+    Log in again if the cli rejected the credentials of a command.
+
+    :param result: CmdResult object of a failed cli command
+    :return: True if logged in again, so the command may be run once more
+    """
+    session = _session
+    if session is None or not is_auth_error(result):
+        return False
+    logging.warning("The cli rejected the login of %s, log in again",
+                    session.username)
+    return session.login(rejected_at=time.time() - result.duration)
+
+
+def ensure_login(username, password, ttl=DEFAULT_SESSION_TTL):
+    """
+    Log in once for all the test processes of a job.
+
+    The cli commands rejected for their credentials log in again and run
+    once more.
+
+    :param username: Azure subscription username
+    :param password: Azure subscription password
+    :param ttl: Lifetime (seconds) of a login
+    :return: True if logged in
+    """
+    global _session
+    if _session is None or _session.username != username:
+        _session = CredentialSession(username, password, ttl)
+    return _session.login()
+
+
+# Files of the shared cli config dir linked in every profile
+PROFILE_SHARED_FILES = ["azureProfile.json", "accessTokens.json"]
+
+
+class CLIProfile(object):
+
+    """
+    Cli config dir of a worker in one mode.
+
+    The profile has its own config.json, so the workers can run the cli in
+    different modes at the same time, and links to the credentials of the
+    shared config dir.
+    """
+
+    def __init__(self, mode, worker=None, base_dir=None):
+        """
+        :param mode: "asm" or "arm"
+        :param worker: Id of the worker, the process id by default
+        :param base_dir: Shared cli config dir
+        """
+        self.mode = mode
+        self.worker = worker or os.getpid()
+        self.base_dir = base_dir or _config_dir()
+        self.path = os.path.join(self.base_dir, "profiles",
+                                 "%s-%s" % (self.worker, mode))
+        self._ready = False
+
+    def setup(self):
+        """
+        Create the profile dir if needed.
+
+        :return: The path of the profile dir
+        """
+        if self._ready:
+            return self.path
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        for name in PROFILE_SHARED_FILES:
+            link = os.path.join(self.path, name)
+            if not os.path.lexists(link):
+                os.symlink(os.path.join(self.base_dir, name), link)
+        with open(os.path.join(self.path, "config.json"), "w") as config:
+            json.dump({"mode": self.mode}, config)
+        self._ready = True
+        return self.path
+
+    def env(self):
+        """
+        :return: Environment variables running the cli in the profile
+        """
+        return {"AZURE_CONFIG_DIR": self.setup()}
+
+    def remove(self):
+        """
+        Remove the profile dir, the links to the credentials only.
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+        self._ready = False
+
+
+_profiles = {}
+_worker = None
+_profiles_enabled = False
+
+
+def _remove_process_profiles():
+    # The profiles of the process id are never used again
+    for (worker, _), profile in _profiles.items():
+        if worker == os.getpid():
+            profile.remove()
+
+
+atexit.register(_remove_process_profiles)
+
+
+def enable_profiles(worker=None):
+    """
+    Run the cli commands of each mode in the profile of the worker.  The
+    profiles are disabled by default.
+
+    :param worker: Id of the worker, reused by the next processes, e.g. a
+                   worker slot; the process id by default, and the profiles
+                   are removed at exit
+    """
+    global _worker, _profiles_enabled
+    _remove_process_profiles()
+    _profiles.clear()
+    _worker = worker
+    _profiles_enabled = True
+
+
+def disable_profiles():
+    """
+    Run the cli commands with the shared cli config.
+    """
+    global _profiles_enabled
+    _remove_process_profiles()
+    _profiles.clear()
+    _profiles_enabled = False
+
+
+def get_profile(mode):
+    """
+    :param mode: "asm" or "arm"
+    :return: The CLIProfile of the mode, None if profiles are disabled
+    """
+    if not _profiles_enabled or mode is None:
+        return None
+    key = (_worker or os.getpid(), mode)
+    profile = _profiles.get(key)
+    if profile is None:
+        profile = _profiles[key] = CLIProfile(mode, key[0])
+    return profile
+
+
 def set_config_mode(mode="asm"):
     """
     Set the config mode
 
+    Only the profile of the mode is prepared if profiles are enabled, the
+    wrappers of each mode run the cli in their own profile.
+
     :param mode: The mode will be set
     :return: True if operate successfully
     """
+    profile = get_profile(mode)
+    if profile is not None:
+        logging.debug("Use the azure cli profile %s", profile.setup())
+        return True
     logging.debug("Change the azure config mode as %s", mode)
     cmd = "azure config mode %s" % mode
     cmd = shlex.split(cmd)
@@ -87,3 +365,38 @@ def set_config_mode(mode="asm"):
     else:
         logging.debug("Success to change the azure config mode: %s", mode)
         return True
+
+
+def set_backend(name="cli", mode="asm", **params):
+    """
+    Select the backend serving the cli wrappers of a mode
+
+    :param name: "cli" or "rest"
+    :param mode: "asm" or "arm"
+    :param params: Parameters of the REST backend (see azure_rest.enable)
+    :return: True if operate successfully
+    """
+    logging.debug("Use the %s backend in %s mode", name, mode)
+    if name == "rest":
+        azure_rest.enable(mode, **params)
+    elif name == "cli":
+        azure_rest.disable(mode)
+    else:
+        raise ValueError("Unknown backend: %s" % name)
+    return True
+
+
+def call_key(mode, verb, args, kwargs):
+    """
+    Build a hashable key identifying a wrapper call.
+
+    :param mode: "asm" or "arm"
+    :param verb: Name of the wrapper
+    :param args: Positional arguments of the call
+    :param kwargs: Keyword arguments of the call
+    :return: A hashable key
+    """
+    kwargs = dict((k, v) for k, v in kwargs.items()
+                  if k not in ("debug", "deadline", "priority"))
+    return (mode, verb, json.dumps([args, kwargs], sort_keys=True,
+                                   default=repr))
@@ -0,0 +1,190 @@
+"""
+Hedged calls of the read-only Azure cli wrappers.
+
+When a read-only wrapper (see azure_cli_spec.READ_WRAPPERS) has not
+returned after the p95 latency of its cli verb (see azure_cli_metrics), the
+same call is started again and the first successful result is used.  A
+stalled vm_show or blob_copy_show then no longer holds a polling loop for
+tens of seconds.  The slower call is left to finish in the background.
+
+Avocado runs every test in its own process, which records too few calls to
+know the latency of a verb.  The latency also counts the calls of the
+previous tests, read from the metrics they dumped into the job results.
+Hedging is disabled by default:
+
+    azure_cli_hedge.enable(
+        history=os.path.join(self.job.logdir, "azure_cli_metrics.json"))
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import sys
+import Queue
+import logging
+import functools
+import threading
+
+from . import azure_cli_spec
+from . import azure_cli_metrics
+
+
+class HedgePolicy(object):
+
+    """
+    When to start the duplicate of a call, and which result to use.
+    """
+
+    def __init__(self, percent=95, min_samples=20, min_delay=1.0,
+                 history=None):
+        """
+        :param percent: Percentile of the verb latency after which the call
+                        is duplicated
+        :param min_samples: Min number of recorded calls of the verb
+                            before hedging its calls
+        :param min_delay: Min time (seconds) before duplicating a call
+        :param history: MetricsRegistry of the calls of the previous
+                        processes, added to the ones of the process
+        """
+        self.percent = percent
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.history = history
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    def delay(self, verb):
+        """
+        :param verb: Cli verb, e.g. "vm show"
+        :return: Time (seconds) before duplicating a call of the verb, None
+                 if its latency is not known yet
+        """
+        duration = azure_cli_metrics.Histogram(
+            azure_cli_metrics.DURATION_BUCKETS)
+        for source in (self.history, azure_cli_metrics.registry):
+            metrics = source.get(verb) if source is not None else None
+            if metrics is not None:
+                duration.merge(metrics.duration.to_dict())
+        if duration.count < self.min_samples:
+            return None
+        return max(self.min_delay, duration.percentile(self.percent))
+
+    def run(self, func, args, kwargs, delay):
+        """
+        Call func, and call it again if it has not returned after delay.
+
+        :return: What the first call to succeed returns; a failed
+                 CmdResult (under ignore_status) is used only if both
+                 calls fail
+        """
+        results = Queue.Queue()
+
+        def call(hedge):
+            try:
+                ret = func(*args, **kwargs)
+            except Exception:
+                results.put((hedge, None, sys.exc_info()))
+            else:
+                results.put((hedge, ret, None))
+
+        _start(call, False)
+        try:
+            return _unpack(results.get(timeout=delay))
+        except Queue.Empty:
+            pass
+        with self._lock:
+            self.hedged += 1
+        logging.debug("%s is slower than %.1fs, call it again",
+                      func.__name__, delay)
+        _start(call, True)
+        result = results.get()
+        if _failed(result):
+            # Wait for the other call before giving up
+            result = results.get()
+        if result[0] and not _failed(result):
+            with self._lock:
+                self.hedge_wins += 1
+        return _unpack(result)
+
+
+def _failed(result):
+    # An exception, or a non-zero exit status under ignore_status
+    hedge, ret, exc_info = result
+    return exc_info is not None or bool(getattr(ret, "exit_status", 0))
+
+
+def _start(call, hedge):
+    thread = threading.Thread(target=call, args=(hedge,))
+    thread.daemon = True
+    thread.start()
+
+
+def _unpack(result):
+    exc_info = result[2]
+    if exc_info is not None:
+        raise exc_info[0], exc_info[1], exc_info[2]
+    return result[1]
+
+
+def _hedged(func, verb):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        policy = _policy
+        if policy is None or kwargs.get("dry_run", False) or \
+           kwargs.get("iterate", False):
+            return func(*args, **kwargs)
+        delay = policy.delay(verb)
+        if delay is None:
+            return func(*args, **kwargs)
+        return policy.run(func, args, kwargs, delay)
+    return wrapper
+
+
+def install(namespace, mode):
+    """
+    Hedge the read-only wrappers of a cli module.
+
+    :param namespace: The globals() of azure_cli_asm or azure_cli_arm
+    :param mode: "asm" or "arm"
+    """
+    for spec in azure_cli_spec.SPECS:
+        if spec.reads and spec.name in namespace:
+            namespace[spec.name] = _hedged(namespace[spec.name], spec.verb)
+
+
+_policy = None
+
+
+def enable(percent=95, min_samples=20, min_delay=1.0, history=None):
+    """
+    Hedge the slow read-only calls.
+
+    :param percent: Percentile of the verb latency after which the call is
+                    duplicated
+    :param min_samples: Min number of recorded calls of the verb before
+                        hedging its calls
+    :param min_delay: Min time (seconds) before duplicating a call
+    :param history: Path of the metrics dumped by the previous processes
+                    (see azure_cli_metrics.dump()), e.g. the ones of the job
+    :return: The HedgePolicy object
+    """
+    global _policy
+    if history is not None:
+        history = azure_cli_metrics.load(history)
+    _policy = HedgePolicy(percent, min_samples, min_delay, history)
+    return _policy
+
+
+def disable():
+    """
+    Make every read-only call once.
+    """
+    global _policy
+    _policy = None
+
+
+def get_policy():
+    """
+    :return: The HedgePolicy object, None if hedging is disabled
+    """
+    return _policy
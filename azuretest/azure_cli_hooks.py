@@ -0,0 +1,107 @@
+"""
+Per-call hooks of the Azure cli wrappers.
+
+Every call of a wrapper goes through run(), whether the cli runs it (see
+azure_cli_spec.command()) or the REST backend serves it (see azure_rest):
+
+* in replay mode, the cassette answers it (see azure_cli_cassette);
+* else the circuit breaker admits it (see azure_cli_breaker), the call
+  budget of the test is charged (see azure_cli_accounting) and the rate
+  limiter paces it (see azure_cli_limiter);
+* its outcome is recorded in the metrics (see azure_cli_metrics), the call
+  account, the rate limiter, the circuit breaker and the cassette.
+
+The calls are named by the verb of their cli command, so the metrics,
+budgets and circuits of a wrapper are the same with both backends.
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import time
+
+from . import azure_cli_metrics
+from . import azure_cli_cassette
+from . import azure_cli_limiter
+from . import azure_cli_breaker
+from . import azure_cli_priority
+from . import azure_cli_accounting
+
+
+def admit(cmd, mode=None, priority=azure_cli_priority.FOREGROUND,
+          pace=True):
+    """
+    Let a call reach Azure.
+
+    :param cmd: Cli command of the call, list of the program and its
+                arguments or command line
+    :param mode: "asm" or "arm"
+    :param priority: azure_cli_priority class of the call
+    :param pace: If False, the caller paces the call itself
+    :raise CircuitOpenError: If the recent calls of the same circuit
+                             failed, see azure_cli_breaker
+    :raise BudgetExceededError: If the call is over the budget of the
+                                test, see azure_cli_accounting
+    """
+    breaker = azure_cli_breaker.get_breaker()
+    if breaker is not None:
+        breaker.before(azure_cli_breaker.circuit_key(cmd, mode))
+    # Charged once the breaker let the call reach Azure
+    account = azure_cli_accounting.get_account()
+    if account is not None:
+        account.charge(azure_cli_metrics.cli_verb(cmd))
+    limiter = azure_cli_limiter.get_limiter()
+    if pace and limiter is not None:
+        limiter.acquire(priority)
+
+
+def record(cmd, result, mode=None, timeout=None):
+    """
+    Record the outcome of a call admitted by admit().
+
+    :param cmd: Cli command of the call
+    :param result: CmdResult object of the call
+    :param mode: "asm" or "arm"
+    :param timeout: Timeout of the call
+    """
+    verb = azure_cli_metrics.cli_verb(cmd)
+    azure_cli_metrics.record_result(verb, result, result.duration, timeout)
+    account = azure_cli_accounting.get_account()
+    if account is not None:
+        account.record(verb, result.duration)
+    limiter = azure_cli_limiter.get_limiter()
+    if limiter is not None:
+        limiter.update(result)
+    breaker = azure_cli_breaker.get_breaker()
+    if breaker is not None:
+        breaker.after(azure_cli_breaker.circuit_key(cmd, mode), result)
+    cassette = azure_cli_cassette.get_cassette()
+    if cassette is not None and not cassette.replaying:
+        cassette.record(cmd, result)
+
+
+def run(cmd, func, mode=None, priority=azure_cli_priority.FOREGROUND,
+        timeout=None):
+    """
+    Run a call of a wrapper with the per-call hooks.
+
+    :param cmd: Cli command of the call, it keys the call in the cassette
+    :param func: Function running the call, returning a CmdResult object
+                 whatever its exit status
+    :param mode: "asm" or "arm"
+    :param priority: azure_cli_priority class of the call
+    :param timeout: Timeout of the call
+    :return: CmdResult object, not checked for its exit status
+    :raise: See admit()
+    """
+    cassette = azure_cli_cassette.get_cassette()
+    if cassette is not None and cassette.replaying:
+        account = azure_cli_accounting.get_account()
+        if account is not None:
+            account.charge(azure_cli_metrics.cli_verb(cmd))
+        return cassette.play(cmd, ignore_status=True)
+    admit(cmd, mode, priority)
+    start_time = time.time()
+    ret = func()
+    ret.duration = time.time() - start_time
+    record(cmd, ret, mode, timeout)
+    return ret
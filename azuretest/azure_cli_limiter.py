@@ -0,0 +1,211 @@
+"""
+Rate limiter of the Azure cli commands shared by all the processes of a host.
+
+The limiter is a token bucket stored in a small file and updated under a
+file lock, so the test processes of parallel avocado jobs stay under one
+call rate.  command() takes a token before running every cli command.
+
+The rate adapts to the subscription: it is divided once a command reports
+throttling, and grows back a step per successful command up to the
+configured maximum.  The BACKGROUND commands (see azure_cli_priority) only
+take a token when the bucket keeps some headroom for the FOREGROUND ones,
+so the cleanup commands never delay the commands a test waits for.  The
+limiter is disabled by default:
+
+    azure_cli_limiter.enable(rate=5, burst=10)
+
+or, for all the processes of a job, $AZURE_CLI_RATE_LIMIT set to "rate" or
+"rate:burst".
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import os
+import time
+import fcntl
+import struct
+import logging
+import tempfile
+import threading
+
+from . import azure_cli_batch
+from . import azure_cli_priority
+
+
+DEFAULT_RATE = 5.0
+DEFAULT_BURST = 10
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(),
+                            "avocado-azure-limiter-%d" % os.getuid())
+
+# Tokens, time of the last refill, current rate
+_STATE = struct.Struct("=ddd")
+
+
+class TokenBucketLimiter(object):
+
+    """
+    Token bucket stored in a file shared by several processes.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST,
+                 path=DEFAULT_PATH, min_rate=None, decrease=0.5,
+                 increase=None, headroom=None):
+        """
+        :param rate: Max number of commands per second
+        :param burst: Max number of tokens in the bucket
+        :param path: Path of the bucket file
+        :param min_rate: Min rate when throttled, rate / 20 by default
+        :param decrease: Factor of the rate once a command is throttled
+        :param increase: Step of the rate per successful command,
+                         rate / 100 by default
+        :param headroom: Number of tokens the BACKGROUND commands leave
+                         in the bucket, burst / 2 by default, burst - 1 at
+                         most
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.path = path
+        self.min_rate = min_rate or self.rate / 20
+        self.decrease = decrease
+        self.increase = increase or self.rate / 100
+        if headroom is None:
+            headroom = self.burst / 2
+        # A bucket can't keep more than burst - 1 tokens after a take
+        self.headroom = max(0.0, min(headroom, self.burst - 1))
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def _update(self, func):
+        # Run func(tokens, rate) -> (tokens, rate, result) on the bucket
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                now = time.time()
+                data = os.read(fd, _STATE.size)
+                if len(data) == _STATE.size:
+                    tokens, stamp, rate = _STATE.unpack(data)
+                    rate = min(rate, self.rate)
+                    tokens = min(self.burst,
+                                 tokens + max(0, now - stamp) * rate)
+                else:
+                    tokens, rate = self.burst, self.rate
+                tokens, rate, result = func(tokens, rate)
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.write(fd, _STATE.pack(tokens, now, rate))
+                return result
+            finally:
+                os.close(fd)
+
+    def reserve(self):
+        """
+        Take a token.
+
+        :return: Time (seconds) to wait before using the token
+        """
+        def take(tokens, rate):
+            tokens -= 1
+            wait = 0.0
+            if tokens < 0:
+                wait = -tokens / rate
+            return tokens, rate, wait
+        return self._update(take)
+
+    def reserve_background(self):
+        """
+        Take a token for a BACKGROUND command if the bucket keeps its
+        headroom, or if the bucket is full.
+
+        :return: 0 if a token was taken, else time (seconds) to wait before
+                 trying again
+        """
+        def take(tokens, rate):
+            if tokens - 1 >= self.headroom or tokens >= self.burst:
+                return tokens - 1, rate, 0
+            target = min(self.burst, self.headroom + 1)
+            return tokens, rate, (target - tokens) / rate
+        return self._update(take)
+
+    def acquire(self, priority=azure_cli_priority.FOREGROUND):
+        """
+        Wait for a token.
+
+        :param priority: Priority class of the command
+        :return: Time (seconds) waited
+        """
+        if priority == azure_cli_priority.FOREGROUND:
+            wait = self.reserve()
+            if wait > 0:
+                logging.debug("Rate limited, wait %.2fs", wait)
+                time.sleep(wait)
+        else:
+            wait = 0.0
+            retry = self.reserve_background()
+            while retry > 0:
+                time.sleep(retry)
+                wait += retry
+                retry = self.reserve_background()
+            if wait > 0:
+                logging.debug("Rate limited, waited %.2fs in the "
+                              "background", wait)
+        self.waited += wait
+        return wait
+
+    def update(self, result):
+        """
+        Adapt the shared rate to the outcome of a command.
+
+        :param result: CmdResult object
+        """
+        throttled = azure_cli_batch.classify(result) == \
+            azure_cli_batch.THROTTLED
+
+        def adapt(tokens, rate):
+            if throttled:
+                rate = max(self.min_rate, rate * self.decrease)
+                logging.warning("Throttled, lower the cli rate to %.2f/s",
+                                rate)
+            else:
+                rate = min(self.rate, rate + self.increase)
+            return tokens, rate, rate
+        return self._update(adapt)
+
+
+_limiter = None
+
+
+def enable(rate=DEFAULT_RATE, burst=DEFAULT_BURST, path=DEFAULT_PATH,
+           **kwargs):
+    """
+    Limit the rate of the cli commands of all the processes using the
+    same bucket file.
+
+    :param rate: Max number of commands per second
+    :param burst: Max number of commands run without waiting
+    :param path: Path of the bucket file
+    :param kwargs: Other arguments of TokenBucketLimiter
+    :return: The TokenBucketLimiter object
+    """
+    global _limiter
+    _limiter = TokenBucketLimiter(rate, burst, path, **kwargs)
+    return _limiter
+
+
+def disable():
+    """
+    Run the cli commands without rate limit.
+    """
+    global _limiter
+    _limiter = None
+
+
+def get_limiter():
+    """
+    :return: The TokenBucketLimiter object, None if disabled
+    """
+    return _limiter
+
+
+if os.environ.get("AZURE_CLI_RATE_LIMIT"):
+    _values = os.environ["AZURE_CLI_RATE_LIMIT"].split(":")
+    enable(float(_values[0]), *[float(v) for v in _values[1:2]])
@@ -0,0 +1,272 @@
+"""
+Per-verb latency and outcome metrics of the Azure cli commands.
+
+command() in azure_cli_asm and azure_cli_arm records the wall time, exit
+status, stdout size and timeout of every cli command under its verb (e.g.
+"vm show", "storage blob copy show") in an in-process registry.  The
+registry is merged into a JSON file with dump(), so the test processes of an
+avocado job can add up their metrics in the job results directory.  It is
+also dumped at exit to $AZURE_CLI_METRICS if that is set.
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import os
+import json
+import fcntl
+import atexit
+import bisect
+import threading
+
+
+# Words of the cli command groups, the verb ends with the first action word
+CLI_GROUPS = ["vm", "image", "disk", "endpoint", "location", "storage",
+              "account", "connectionstring", "keys", "blob", "copy",
+              "container", "group", "network", "config", "sas"]
+
+# Upper bounds of the histogram buckets
+DURATION_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 240, 600]
+SIZE_BUCKETS = [0, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304]
+
+
+def cli_verb(cmd):
+    """
+    Get the verb of a cli command line.
+
+    :param cmd: Command line, e.g. "azure vm show walatest --json", or
+                list of the program and its arguments
+    :return: The verb, e.g. "vm show"
+    """
+    words = cmd
+    if isinstance(cmd, basestring):
+        words = cmd.split()
+    if words and words[0] == "azure":
+        words = words[1:]
+    verb = []
+    for word in words:
+        if word.startswith("-"):
+            break
+        verb.append(word)
+        if word not in CLI_GROUPS:
+            break
+    return " ".join(verb)
+
+
+class Histogram(object):
+
+    """
+    Counts of the observed values per bucket.
+    """
+
+    def __init__(self, bounds):
+        """
+        :param bounds: Sorted upper bounds of the buckets, an overflow
+                       bucket is added after the last one
+        """
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """
+        Estimate a percentile as the upper bound of its bucket.
+
+        :param percent: Percentile, e.g. 95
+        :return: The estimate, None if nothing was observed
+        """
+        if not self.count:
+            return None
+        rank = self.count * percent / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                if index < len(self.bounds):
+                    return min(self.bounds[index], self.max)
+                return self.max
+        return self.max
+
+    def merge(self, data):
+        if data["bounds"] != self.bounds:
+            raise ValueError("Histogram buckets differ")
+        self.counts = [a + b for a, b in zip(self.counts, data["counts"])]
+        self.count += data["count"]
+        self.total += data["total"]
+        for attr, func in (("min", min), ("max", max)):
+            values = [v for v in (getattr(self, attr), data[attr])
+                      if v is not None]
+            if values:
+                setattr(self, attr, func(values))
+
+    def to_dict(self):
+        return {"bounds": self.bounds, "counts": self.counts,
+                "count": self.count, "total": self.total,
+                "min": self.min, "max": self.max,
+                "p50": self.percentile(50), "p95": self.percentile(95)}
+
+
+class VerbMetrics(object):
+
+    """
+    Metrics of one cli verb.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.timeouts = 0
+        self.exit_statuses = {}
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.stdout_size = Histogram(SIZE_BUCKETS)
+
+    def record(self, duration, exit_status, stdout_size, timed_out):
+        self.calls += 1
+        status = str(exit_status)
+        self.exit_statuses[status] = self.exit_statuses.get(status, 0) + 1
+        if timed_out:
+            self.timeouts += 1
+        self.duration.observe(duration)
+        self.stdout_size.observe(stdout_size)
+
+    def merge(self, data):
+        self.calls += data["calls"]
+        self.timeouts += data["timeouts"]
+        for status, count in data["exit_statuses"].items():
+            self.exit_statuses[status] = \
+                self.exit_statuses.get(status, 0) + count
+        self.duration.merge(data["duration"])
+        self.stdout_size.merge(data["stdout_size"])
+
+    def to_dict(self):
+        return {"calls": self.calls, "timeouts": self.timeouts,
+                "exit_statuses": self.exit_statuses,
+                "duration": self.duration.to_dict(),
+                "stdout_size": self.stdout_size.to_dict()}
+
+
+class MetricsRegistry(object):
+
+    """
+    Metrics of all the cli verbs of the process.
+    """
+
+    def __init__(self):
+        self.verbs = {}
+        self._lock = threading.Lock()
+
+    def record(self, verb, duration, exit_status, stdout_size=0,
+               timed_out=False):
+        with self._lock:
+            if verb not in self.verbs:
+                self.verbs[verb] = VerbMetrics()
+            self.verbs[verb].record(duration, exit_status, stdout_size,
+                                    timed_out)
+
+    def get(self, verb):
+        """
+        :return: The VerbMetrics of the verb, None if never recorded
+        """
+        return self.verbs.get(verb)
+
+    def merge(self, data):
+        with self._lock:
+            for verb, verb_data in data.items():
+                if verb not in self.verbs:
+                    self.verbs[verb] = VerbMetrics()
+                self.verbs[verb].merge(verb_data)
+
+    def to_dict(self):
+        with self._lock:
+            return dict((verb, metrics.to_dict()) for verb, metrics in
+                        self.verbs.items())
+
+    def reset(self):
+        with self._lock:
+            self.verbs = {}
+
+
+registry = MetricsRegistry()
+
+
+def record_result(verb, result, duration, timeout=None):
+    """
+    Record the outcome of a cli command.
+
+    :param verb: Verb of the command
+    :param result: CmdResult object
+    :param duration: Wall time (seconds) of the command
+    :param timeout: Timeout of the command
+    """
+    stdout_size = 0
+    if isinstance(result.stdout, basestring):
+        stdout_size = len(result.stdout)
+    timed_out = bool(getattr(result, "interrupted", False)) or \
+        bool(timeout and duration >= timeout)
+    registry.record(verb, duration, result.exit_status, stdout_size,
+                    timed_out)
+
+
+def dump(path):
+    """
+    Merge the metrics of the process into a JSON file and reset them.
+
+    :param path: Path of the JSON file, created if missing
+    :return: The merged metrics
+    """
+    total = MetricsRegistry()
+    with open(path, "a+") as dump_file:
+        fcntl.flock(dump_file, fcntl.LOCK_EX)
+        try:
+            dump_file.seek(0)
+            content = dump_file.read()
+            if content.strip():
+                total.merge(json.loads(content))
+            total.merge(registry.to_dict())
+            registry.reset()
+            data = total.to_dict()
+            dump_file.seek(0)
+            dump_file.truncate()
+            json.dump(data, dump_file, indent=2, sort_keys=True)
+        finally:
+            fcntl.flock(dump_file, fcntl.LOCK_UN)
+    return data
+
+
+def load(path):
+    """
+    Read the metrics dumped into a JSON file, e.g. the ones of the previous
+    tests of the job.
+
+    :param path: Path of the JSON file
+    :return: A MetricsRegistry object, empty if the file is missing
+    """
+    loaded = MetricsRegistry()
+    try:
+        with open(path) as dump_file:
+            fcntl.flock(dump_file, fcntl.LOCK_SH)
+            content = dump_file.read()
+    except IOError:
+        return loaded
+    if content.strip():
+        loaded.merge(json.loads(content))
+    return loaded
+
+
+def _dump_at_exit():
+    path = os.environ.get("AZURE_CLI_METRICS")
+    if path and registry.verbs:
+        dump(path)
+
+
+atexit.register(_dump_at_exit)
@@ -0,0 +1,297 @@
+"""
+Pool of persistent shell workers used to run the Azure cli commands.
+
+Running a command with process.run() forks the whole harness process and
+starts a fresh /bin/sh for every call.  The workers of this pool are started
+once and then fed the commands through their stdin, so the only process
+created per call is the cli itself.
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import os
+import time
+import signal
+import select
+import logging
+import heapq
+import threading
+import itertools
+import subprocess
+import pipes
+
+from avocado.utils import process
+
+from . import utils_misc
+from . import azure_cli_priority
+
+
+DEFAULT_POOL_SIZE = 4
+
+
+class CLIWorkerError(Exception):
+
+    def __init__(self, msg, output=None):
+        Exception.__init__(self, msg, output)
+        self.msg = msg
+        self.output = output
+
+    def __str__(self):
+        return "%s    (output: %r)" % (self.msg, self.output)
+
+
+class CLIWorkerTimeoutError(CLIWorkerError):
+
+    def __init__(self, output):
+        CLIWorkerError.__init__(self, "Command timeout expired", output)
+
+
+class CLIWorker(object):
+
+    """
+    A persistent shell which runs one command at a time.
+
+    Every command is followed by a marker line on both stdout and stderr, the
+    marker on stdout carries the exit status of the command.
+    """
+
+    def __init__(self, shell="/bin/sh", env=None):
+        self.shell = shell
+        self.marker = "__AZURE_CLI_%s__" % \
+            utils_misc.generate_random_string(16)
+        self.proc = subprocess.Popen([shell], stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     close_fds=True, env=env,
+                                     preexec_fn=os.setsid)
+        logging.debug("Started cli worker %s", self.proc.pid)
+
+    def is_alive(self):
+        return self.proc.poll() is None
+
+    def run(self, cmd, timeout=None, env=None):
+        """
+        Run a command in the worker.
+
+        :param cmd: Command line, or list of the program and its arguments
+        :param timeout: Time (seconds) before giving up the command
+        :param env: Extra environment variables of the command
+        :return: A tuple (exit_status, stdout, stderr)
+        :raise CLIWorkerTimeoutError: If the timeout expires
+        :raise CLIWorkerError: If the worker dies while running the command
+        """
+        exports = "".join("export %s=%s; " % (name, pipes.quote(value))
+                          for name, value in sorted((env or {}).items()))
+        # The command runs in its own shell, so that unbalanced quotes or
+        # parentheses in it can't swallow the marker lines
+        script = ("%s -c %s < /dev/null\n"
+                  "printf '\\n%%s %%d\\n' %s $?\n"
+                  "printf '\\n%%s\\n' %s >&2\n" %
+                  (pipes.quote(self.shell),
+                   pipes.quote(exports + utils_misc.cmdline(cmd)),
+                   self.marker, self.marker))
+        try:
+            self.proc.stdin.write(script)
+            self.proc.stdin.flush()
+        except (IOError, OSError), e:
+            self.close()
+            raise CLIWorkerError("Failed to send the command to the worker",
+                                 str(e))
+
+        out_fd = self.proc.stdout.fileno()
+        err_fd = self.proc.stderr.fileno()
+        output = {out_fd: "", err_fd: ""}
+        pending = [out_fd, err_fd]
+        end_time = None
+        if timeout:
+            end_time = time.time() + timeout
+        while pending:
+            wait = None
+            if end_time is not None:
+                wait = end_time - time.time()
+                if wait <= 0:
+                    self.close()
+                    raise CLIWorkerTimeoutError(output[out_fd])
+            readable, _, _ = select.select(pending, [], [], wait)
+            for fd in readable:
+                data = os.read(fd, 65536)
+                if not data:
+                    self.close()
+                    raise CLIWorkerError("Worker terminated unexpectedly",
+                                         output[out_fd])
+                output[fd] += data
+                if output[fd].endswith("\n") and \
+                   output[fd].rfind("\n%s" % self.marker) >= 0:
+                    pending.remove(fd)
+
+        stdout, status = output[out_fd].rsplit("\n%s " % self.marker, 1)
+        stderr = output[err_fd].rsplit("\n%s\n" % self.marker, 1)[0]
+        return int(status), stdout, stderr
+
+    def close(self):
+        """
+        Kill the worker and everything it started.
+        """
+        if self.is_alive():
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        self.proc.wait()
+
+
+class CLIWorkerPool(object):
+
+    """
+    A bounded pool of CLIWorker objects.
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, shell="/bin/sh", env=None):
+        """
+        Start the workers of the pool.
+
+        :param size: Number of the workers
+        :param shell: Shell used by the workers
+        :param env: Environment of the workers
+        """
+        self.size = size
+        self.shell = shell
+        self.env = env
+        self._idle = []
+        self._busy = set()
+        # Heap of the (priority, ticket) of the callers waiting for a worker
+        self._waiting = []
+        self._tickets = itertools.count()
+        self._cond = threading.Condition()
+        self._count = size
+        for _ in range(size):
+            self._idle.append(CLIWorker(shell, env))
+
+    def _acquire(self, priority=azure_cli_priority.FOREGROUND):
+        # The callers get the workers by priority, then in arrival order
+        with self._cond:
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._waiting, ticket)
+            while self._waiting[0] != ticket or \
+                    not (self._idle or self._count < self.size):
+                self._cond.wait()
+            heapq.heappop(self._waiting)
+            worker = None
+            if self._idle:
+                worker = self._idle.pop()
+            else:
+                self._count += 1
+            # Let the next caller check for a worker
+            self._cond.notify_all()
+        if worker is None:
+            try:
+                worker = CLIWorker(self.shell, self.env)
+            except Exception:
+                self._release(None)
+                raise
+        with self._cond:
+            self._busy.add(worker)
+        return worker
+
+    def _release(self, worker):
+        with self._cond:
+            self._busy.discard(worker)
+            if worker is not None and worker.is_alive():
+                self._idle.append(worker)
+            else:
+                self._count -= 1
+            self._cond.notify_all()
+
+    def run(self, cmd, timeout=None, verbose=False, ignore_status=False,
+            env=None, priority=azure_cli_priority.FOREGROUND):
+        """
+        Run a command in one of the idle workers.
+
+        :param cmd: Command line, or list of the program and its arguments
+        :param timeout: Time (seconds) before giving up the command
+        :param env: Extra environment variables of the command
+        :param verbose: If True, log the command
+        :param ignore_status: If False, raise CmdError on non-zero status
+        :param priority: Priority class of the command, the FOREGROUND
+                         commands get the first idle workers
+        :return: CmdResult object
+        :raise: CmdError if non-zero exit status and ignore_status=False
+        """
+        cmd = utils_misc.cmdline(cmd)
+        if verbose:
+            logging.info("Running '%s' in the cli worker pool", cmd)
+        worker = self._acquire(priority)
+        start_time = time.time()
+        interrupted = False
+        try:
+            status, stdout, stderr = worker.run(cmd, timeout, env)
+        except CLIWorkerTimeoutError, e:
+            logging.error("Command '%s' timed out after %ss", cmd, timeout)
+            status, stdout, stderr = -signal.SIGKILL, e.output, ""
+            interrupted = True
+        except CLIWorkerError, e:
+            logging.error("Cli worker failed to run '%s': %s", cmd, e)
+            status, stdout, stderr = -signal.SIGKILL, e.output or "", str(e)
+        finally:
+            self._release(worker)
+        result = process.CmdResult(cmd, stdout, stderr, status,
+                                   time.time() - start_time)
+        result.interrupted = interrupted
+        if status and not ignore_status:
+            raise process.CmdError(cmd, result)
+        return result
+
+    def close(self):
+        """
+        Stop all the workers.
+
+        The commands running in the busy workers are killed, their callers
+        get a failed CmdResult and the workers are not reused.
+        """
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._count -= len(idle)
+            busy = list(self._busy)
+        for worker in idle + busy:
+            worker.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def enable(size=DEFAULT_POOL_SIZE, shell="/bin/sh", env=None):
+    """
+    Run the Azure cli commands in a pool of persistent workers.
+
+    :param size: Number of the workers
+    :param shell: Shell used by the workers
+    :param env: Environment of the workers
+    :return: The CLIWorkerPool object
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = CLIWorkerPool(size, shell, env)
+        return _pool
+
+
+def disable():
+    """
+    Stop the workers and run the Azure cli commands with process.run again.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = None
+
+
+def get_pool():
+    """
+    Get the enabled pool.
+
+    :return: The CLIWorkerPool object, None if the pool is not enabled
+    """
+    return _pool
@@ -0,0 +1,67 @@
+"""
+Priority classes of the Azure cli commands.
+
+Cleanup commands (vm_delete, blob_delete, container_delete, ...) compete
+for the same cli workers and rate limit as the provisioning commands and
+status polls a running test waits for.  Every command has a priority
+class: FOREGROUND by default, BACKGROUND for the cleanup wrappers (see the
+priority of azure_cli_spec.CommandSpec).  When the worker pool (see
+azure_cli_pool) or the rate limit (see azure_cli_limiter) is saturated, the
+foreground commands go first.
+
+A wrapper call takes priority=FOREGROUND or priority=BACKGROUND, and a
+block of code can run all its commands in the background:
+
+    with azure_cli_priority.background():
+        vm.delete()
+        blob.delete()
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import threading
+import contextlib
+
+
+# Lower values run first
+FOREGROUND = 0
+BACKGROUND = 1
+
+_local = threading.local()
+
+
+def current(default=FOREGROUND):
+    """
+    :param default: Priority if no block of the thread sets one
+    :return: Priority set by the innermost background() or foreground()
+             block of the thread, default if none
+    """
+    return getattr(_local, "priority", default)
+
+
+@contextlib.contextmanager
+def _priority(priority):
+    previous = getattr(_local, "priority", None)
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        if previous is None:
+            del _local.priority
+        else:
+            _local.priority = previous
+
+
+def background():
+    """
+    Run the cli commands of a block with the BACKGROUND priority.
+    """
+    return _priority(BACKGROUND)
+
+
+def foreground():
+    """
+    Run the cli commands of a block with the FOREGROUND priority, e.g. the
+    cleanup commands a test waits for.
+    """
+    return _priority(FOREGROUND)
@@ -0,0 +1,130 @@
+"""
+Single-flight coalescing of the read-only Azure cli wrappers.
+
+When several threads call the same read-only wrapper (see
+azure_cli_spec.READ_WRAPPERS) with the same arguments at the same time,
+only the first call runs the cli; the others wait for it and get a copy of
+its result, or the exception it raised.
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import sys
+import copy
+import logging
+import functools
+import threading
+
+from . import azure_cli_common
+from . import azure_cli_spec
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exc_info = None
+        self.followers = 0
+
+
+class SingleFlight(object):
+
+    """
+    Calls in flight, keyed by the call key.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Run func, or wait for the call in flight with the same key.
+
+        :param key: Hashable key of the call
+        :param func: Function to call
+        :return: What func returns
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.followers += 1
+                self.coalesced += 1
+        if not leader:
+            logging.debug("Wait for the same %s call in flight", key[1])
+            flight.event.wait()
+            if flight.exc_info is not None:
+                raise flight.exc_info[0], flight.exc_info[1], \
+                    flight.exc_info[2]
+            return copy.deepcopy(flight.result)
+        try:
+            flight.result = func(*args, **kwargs)
+        except Exception:
+            flight.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+        if flight.followers:
+            return copy.deepcopy(flight.result)
+        return flight.result
+
+
+def _coalesced(func, mode):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        group = _group
+        if group is None or kwargs.get("dry_run", False) or \
+           kwargs.get("iterate", False):
+            return func(*args, **kwargs)
+        key = azure_cli_common.call_key(mode, func.__name__, args, kwargs)
+        return group.do(key, func, *args, **kwargs)
+    return wrapper
+
+
+def install(namespace, mode):
+    """
+    Coalesce the read-only wrappers of a cli module.
+
+    :param namespace: The globals() of azure_cli_asm or azure_cli_arm
+    :param mode: "asm" or "arm"
+    """
+    for name in azure_cli_spec.READ_WRAPPERS:
+        if name in namespace:
+            namespace[name] = _coalesced(namespace[name], mode)
+
+
+_group = SingleFlight()
+
+
+def enable():
+    """
+    Coalesce the identical read-only calls in flight (the default).
+
+    :return: The SingleFlight object
+    """
+    global _group
+    if _group is None:
+        _group = SingleFlight()
+    return _group
+
+
+def disable():
+    """
+    Let every read-only call run its own cli command.
+    """
+    global _group
+    _group = None
+
+
+def get_group():
+    """
+    :return: The SingleFlight object, None if coalescing is disabled
+    """
+    return _group
@@ -0,0 +1,240 @@
+"""
+Spawn server of azure_cli_spawner.
+
+This script runs in a small helper process and starts the subprocesses of
+the harness on its behalf, so the harness process itself never forks.  It
+only uses the standard library and is run by path, not imported as part of
+the azuretest package.
+
+The requests are JSON lines read from stdin:
+
+    {"id": 1, "argv": ["azure", "vm", "show", "vm1"], "env": {...},
+     "timeout": 60}
+
+and the answers JSON lines written to stdout, the output of the process
+while it runs and then its exit status:
+
+    {"id": 1, "stdout": "..."}
+    {"id": 1, "stderr": "..."}
+    {"id": 1, "exit_status": 0, "interrupted": false}
+
+The subprocesses are started with posix_spawn(3) when the C library has it,
+with subprocess.Popen otherwise.  The output is decoded as latin-1 to go
+through JSON unchanged, and so are the arguments and the environment of the
+requests.
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import ctypes
+import ctypes.util
+import signal
+import select
+import threading
+import subprocess
+
+
+# posix_spawnattr_setflags() flag of glibc
+POSIX_SPAWN_SETPGROUP = 0x02
+
+# Opaque structures, larger than posix_spawn_file_actions_t and
+# posix_spawnattr_t of every C library
+_STRUCT_SIZE = 1024
+
+
+class PosixSpawn(object):
+
+    """
+    posix_spawnp(3) through ctypes.
+    """
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._spawnp = libc.posix_spawnp
+        self._fa_init = libc.posix_spawn_file_actions_init
+        self._fa_destroy = libc.posix_spawn_file_actions_destroy
+        self._fa_adddup2 = libc.posix_spawn_file_actions_adddup2
+        self._fa_addopen = libc.posix_spawn_file_actions_addopen
+        self._attr_init = libc.posix_spawnattr_init
+        self._attr_destroy = libc.posix_spawnattr_destroy
+        self._attr_setflags = libc.posix_spawnattr_setflags
+        self._attr_setpgroup = libc.posix_spawnattr_setpgroup
+        self._fa_addopen.argtypes = [ctypes.c_void_p, ctypes.c_int,
+                                     ctypes.c_char_p, ctypes.c_int,
+                                     ctypes.c_uint]
+        self._attr_setflags.argtypes = [ctypes.c_void_p, ctypes.c_short]
+
+    def spawn(self, argv, env, stdout_fd, stderr_fd):
+        """
+        Start a process in its own process group.
+
+        :param argv: List of the program and its arguments
+        :param env: Environment of the process
+        :param stdout_fd: File descriptor of the process stdout
+        :param stderr_fd: File descriptor of the process stderr
+        :return: Pid of the process
+        """
+        actions = ctypes.create_string_buffer(_STRUCT_SIZE)
+        attr = ctypes.create_string_buffer(_STRUCT_SIZE)
+        self._fa_init(actions)
+        self._attr_init(attr)
+        try:
+            self._fa_addopen(actions, 0, "/dev/null", os.O_RDONLY, 0)
+            self._fa_adddup2(actions, stdout_fd, 1)
+            self._fa_adddup2(actions, stderr_fd, 2)
+            self._attr_setflags(attr, POSIX_SPAWN_SETPGROUP)
+            self._attr_setpgroup(attr, 0)
+            c_argv = (ctypes.c_char_p * (len(argv) + 1))(*(argv + [None]))
+            env_list = ["%s=%s" % item for item in env.items()]
+            c_env = (ctypes.c_char_p * (len(env_list) + 1))(
+                *(env_list + [None]))
+            pid = ctypes.c_int()
+            error = self._spawnp(ctypes.byref(pid), argv[0], actions, attr,
+                                 c_argv, c_env)
+            if error:
+                raise OSError(error, "%s: %s" % (os.strerror(error),
+                                                 argv[0]))
+            return pid.value
+        finally:
+            self._fa_destroy(actions)
+            self._attr_destroy(attr)
+
+
+# Popen objects of the processes started without posix_spawn, by pid
+_children = {}
+
+
+def _popen_spawn(argv, env, stdout_fd, stderr_fd):
+    with open(os.devnull) as devnull:
+        proc = subprocess.Popen(argv, stdin=devnull, stdout=stdout_fd,
+                                stderr=stderr_fd, env=env, close_fds=True,
+                                preexec_fn=os.setpgrp)
+    _children[proc.pid] = proc
+    return proc.pid
+
+
+def _encode(value):
+    return value.encode("latin-1")
+
+
+def _exit_status(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _cloexec(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+
+class SpawnServer(object):
+
+    """
+    Run the requests read from infile, one thread per request.
+    """
+
+    def __init__(self, infile, outfile):
+        self.infile = infile
+        self.outfile = outfile
+        self._write_lock = threading.Lock()
+        self._spawn_lock = threading.Lock()
+        try:
+            self._spawn = PosixSpawn().spawn
+        except (OSError, AttributeError, TypeError):
+            self._spawn = _popen_spawn
+
+    def send(self, message):
+        line = json.dumps(message) + "\n"
+        with self._write_lock:
+            self.outfile.write(line)
+            self.outfile.flush()
+
+    def _start(self, argv, env):
+        # No other spawn may inherit the pipes of this one
+        with self._spawn_lock:
+            out_r, out_w = os.pipe()
+            err_r, err_w = os.pipe()
+            for fd in (out_r, out_w, err_r, err_w):
+                _cloexec(fd)
+            try:
+                pid = self._spawn(argv, env, out_w, err_w)
+            except Exception:
+                for fd in (out_r, err_r):
+                    os.close(fd)
+                raise
+            finally:
+                os.close(out_w)
+                os.close(err_w)
+        return pid, out_r, err_r
+
+    def run(self, request):
+        req_id = request["id"]
+        argv = [_encode(arg) for arg in request["argv"]]
+        env = dict(os.environ)
+        if request.get("env"):
+            env = dict((_encode(name), _encode(value))
+                       for name, value in request["env"].items())
+        try:
+            pid, out_r, err_r = self._start(argv, env)
+        except OSError, e:
+            self.send({"id": req_id, "stderr": "%s\n" % e})
+            self.send({"id": req_id, "exit_status": 127,
+                       "interrupted": False})
+            return
+        names = {out_r: "stdout", err_r: "stderr"}
+        end_time = None
+        if request.get("timeout"):
+            end_time = time.time() + request["timeout"]
+        interrupted = False
+        pending = [out_r, err_r]
+        while pending:
+            wait = None
+            if end_time is not None:
+                wait = end_time - time.time()
+                if wait <= 0:
+                    interrupted = True
+                    try:
+                        os.killpg(pid, signal.SIGKILL)
+                    except OSError:
+                        pass
+                    break
+            readable, _, _ = select.select(pending, [], [], wait)
+            for fd in readable:
+                data = os.read(fd, 65536)
+                if data:
+                    self.send({"id": req_id,
+                               names[fd]: data.decode("latin-1")})
+                else:
+                    pending.remove(fd)
+        os.close(out_r)
+        os.close(err_r)
+        proc = _children.pop(pid, None)
+        if proc is not None:
+            exit_status = proc.wait()
+        else:
+            _, status = os.waitpid(pid, 0)
+            exit_status = _exit_status(status)
+        self.send({"id": req_id, "exit_status": exit_status,
+                   "interrupted": interrupted})
+
+    def serve(self):
+        while True:
+            line = self.infile.readline()
+            if not line:
+                break
+            thread = threading.Thread(target=self.run,
+                                      args=(json.loads(line),))
+            thread.daemon = True
+            thread.start()
+
+
+if __name__ == "__main__":
+    # Do not die with the process group of the harness on a ^C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    SpawnServer(sys.stdin, sys.stdout).serve()
@@ -0,0 +1,231 @@
+"""
+Fork-server of the Azure cli commands.
+
+The harness process grows large (avocado, aexpect sessions, cached JSON
+output), and every process.run() forks the whole of it.  The spawner starts
+a small helper process once (see azure_cli_spawn_server), while the harness
+is still small, and has it start the cli commands with posix_spawn and
+stream their output back.  The cost of a command then does not depend on
+the size of the harness.
+
+command() uses the spawner when it is enabled and the worker pool (see
+azure_cli_pool) is not:
+
+    azure_cli_spawner.enable()
+
+or, for all the processes of a job, $AZURE_CLI_SPAWNER set to "1".
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import itertools
+import threading
+import subprocess
+import Queue
+
+from avocado.utils import process
+
+from . import utils_misc
+
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "azure_cli_spawn_server.py")
+
+
+class SpawnerError(Exception):
+
+    def __init__(self, msg):
+        Exception.__init__(self, msg)
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+def _decode(value):
+    # The spawn server gets the bytes of the arguments through JSON
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    return value.decode("latin-1")
+
+
+class Spawner(object):
+
+    """
+    Client of a spawn server process.
+    """
+
+    def __init__(self, python=sys.executable):
+        """
+        Start the spawn server.
+
+        :param python: Python interpreter running the server
+        """
+        self.python = python
+        self.pid = os.getpid()
+        self._ids = itertools.count(1)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.proc = subprocess.Popen([python, SERVER_SCRIPT],
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     close_fds=True)
+        self._reader = threading.Thread(target=self._read)
+        self._reader.daemon = True
+        self._reader.start()
+        logging.debug("Started cli spawn server %s", self.proc.pid)
+
+    def is_alive(self):
+        return self.proc.poll() is None
+
+    def _read(self):
+        for line in iter(self.proc.stdout.readline, ""):
+            message = json.loads(line)
+            with self._lock:
+                call = self._calls.get(message["id"])
+            if call is not None:
+                call.put(message)
+        # The server is gone, fail the pending calls
+        with self._lock:
+            calls, self._calls = self._calls, {}
+        for call in calls.values():
+            call.put(None)
+
+    def _wait(self, request, call, stdout, stderr):
+        # Send the request and collect its output until the exit status
+        try:
+            with self._lock:
+                self.proc.stdin.write(json.dumps(request) + "\n")
+                self.proc.stdin.flush()
+        except (IOError, OSError), e:
+            raise SpawnerError("Failed to send the command: %s" % e)
+        while True:
+            message = call.get()
+            if message is None:
+                raise SpawnerError("Spawn server terminated unexpectedly")
+            if "stdout" in message:
+                stdout.append(message["stdout"].encode("latin-1"))
+            elif "stderr" in message:
+                stderr.append(message["stderr"].encode("latin-1"))
+            else:
+                return message["exit_status"], message["interrupted"]
+
+    def run(self, cmd, timeout=None, verbose=False, ignore_status=False,
+            env=None):
+        """
+        Run a command in the spawn server.
+
+        :param cmd: Command line run by the shell, or list of the program
+                    and its arguments
+        :param timeout: Time (seconds) before killing the command
+        :param verbose: If True, log the command
+        :param ignore_status: If False, raise CmdError on non-zero status
+        :param env: Extra environment variables of the command
+        :return: CmdResult object, with a -SIGKILL status if the spawn
+                 server died
+        :raise: CmdError if non-zero exit status and ignore_status=False
+        """
+        argv = cmd
+        if isinstance(cmd, basestring):
+            argv = ["/bin/sh", "-c", cmd]
+        cmd = utils_misc.cmdline(cmd)
+        if verbose:
+            logging.info("Running '%s' in the cli spawn server", cmd)
+        env = dict(os.environ, **(env or {}))
+        request = {"id": next(self._ids),
+                   "argv": [_decode(arg) for arg in argv],
+                   "env": dict((_decode(name), _decode(value))
+                               for name, value in env.items()),
+                   "timeout": timeout}
+        call = Queue.Queue()
+        with self._lock:
+            self._calls[request["id"]] = call
+        start_time = time.time()
+        stdout, stderr = [], []
+        try:
+            status, interrupted = self._wait(request, call, stdout, stderr)
+        except SpawnerError, e:
+            logging.error("Cli spawn server failed to run '%s': %s", cmd, e)
+            status, interrupted = -signal.SIGKILL, False
+            stderr.append(str(e))
+        finally:
+            with self._lock:
+                self._calls.pop(request["id"], None)
+        if interrupted:
+            logging.error("Command '%s' timed out after %ss", cmd, timeout)
+            status = -signal.SIGKILL
+        result = process.CmdResult(cmd, "".join(stdout), "".join(stderr),
+                                   status, time.time() - start_time)
+        result.interrupted = interrupted
+        if result.exit_status and not ignore_status:
+            raise process.CmdError(cmd, result)
+        return result
+
+    def close(self):
+        """
+        Stop the spawn server.
+        """
+        if self.is_alive():
+            try:
+                self.proc.stdin.close()
+            except (IOError, OSError):
+                pass
+            self.proc.wait()
+
+
+_spawner = None
+_spawner_lock = threading.Lock()
+
+
+def enable(python=sys.executable):
+    """
+    Run the Azure cli commands through a spawn server.
+
+    :param python: Python interpreter running the server
+    :return: The Spawner object
+    """
+    global _spawner
+    with _spawner_lock:
+        if _spawner is not None:
+            _spawner.close()
+        _spawner = Spawner(python)
+        return _spawner
+
+
+def disable():
+    """
+    Stop the spawn server and run the Azure cli commands with process.run
+    again.
+    """
+    global _spawner
+    with _spawner_lock:
+        if _spawner is not None:
+            _spawner.close()
+        _spawner = None
+
+
+def get_spawner():
+    """
+    Get the spawner of the process, a process forked from the one which
+    enabled the spawner starts its own.
+
+    :return: The Spawner object, None if disabled or if its server died
+    """
+    global _spawner
+    with _spawner_lock:
+        if _spawner is not None and _spawner.pid != os.getpid():
+            _spawner = Spawner(_spawner.python)
+        spawner = _spawner
+    if spawner is not None and not spawner.is_alive():
+        return None
+    return spawner
+
+
+if os.environ.get("AZURE_CLI_SPAWNER", "") == "1":
+    enable()
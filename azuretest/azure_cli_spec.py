@@ -0,0 +1,639 @@
+"""
+Declarative specs of the Azure cli wrappers in both arm and asm mode.
+
+Each CommandSpec of SPECS describes one wrapper of azure_cli_asm and
+azure_cli_arm: the cli verb, the positional arguments, the mapping of the
+params keys to the cli options, whether the output is JSON, and the
+resources the command reads or changes.  install() compiles the specs once
+into the wrapper functions of a cli module; they build the argv of the
+command, which command() runs without a shell.
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import json
+import shlex
+import logging
+import collections
+
+from avocado.utils import process
+
+from . import utils_misc
+from . import azure_cli_pool
+from . import azure_cli_hooks
+from . import azure_cli_stream
+from . import azure_cli_cassette
+from . import azure_cli_common
+from . import azure_cli_priority
+from . import azure_cli_spawner
+
+
+_REQUIRED = object()
+
+
+class Arg(collections.namedtuple("Arg", "name doc flag default")):
+
+    """
+    Positional argument of a wrapper.
+
+    It is passed to the cli as a positional argument, or as the value of
+    the option flag if set.
+    """
+
+    def __new__(cls, name, doc, flag=None, default=_REQUIRED):
+        return super(Arg, cls).__new__(cls, name, doc, flag, default)
+
+
+class CommandSpec(object):
+
+    """
+    Description of a cli wrapper.
+    """
+
+    def __init__(self, name, verb, doc, args=(), params="optional",
+                 options=(), flags=(), azure_json=False, ignore_status=None,
+                 reads=None, writes=(), modes=("asm", "arm"), priority=None):
+        """
+        :param name: Name of the wrapper
+        :param verb: Cli verb, e.g. "vm show"
+        :param doc: Summary of the wrapper docstring
+        :param args: Arg objects of the positional arguments
+        :param params: "optional" or "required" params argument, None if
+                       the wrapper has no params argument
+        :param options: Tuples (option flag, params key); the value is
+                        passed as a positional argument if the flag is None
+        :param flags: Options always passed, e.g. "--quiet"
+        :param azure_json: If True, decode the JSON output of the command
+        :param ignore_status: Default ignore_status of the command
+        :param reads: Resource the command reads, None if it is not
+                      read-only
+        :param writes: Resources the command changes
+        :param modes: Modes of the cli modules having the wrapper
+        :param priority: Priority class of the command (see
+                         azure_cli_priority), BACKGROUND for the delete
+                         commands and FOREGROUND for the others by default
+        """
+        self.name = name
+        self.verb = verb
+        self.doc = doc
+        self.args = tuple(args)
+        self.params = params
+        self.options = tuple(options)
+        self.flags = tuple(flags)
+        self.azure_json = azure_json
+        self.ignore_status = ignore_status
+        self.reads = reads
+        self.writes = tuple(writes)
+        self.modes = modes
+        if priority is None:
+            priority = azure_cli_priority.FOREGROUND
+            if verb.endswith(" delete"):
+                priority = azure_cli_priority.BACKGROUND
+        self.priority = priority
+
+
+_DNS_NAME = ("--dns-name", "DNSName")
+_BLOB_DELETE = ("--blob-delete", "blob_delete")
+_CONNECTION_STRING = ("--connection-string", "connection_string")
+_BLOB_ACCESS = (("--container", "container"), ("--sas", "sas"),
+                _CONNECTION_STRING)
+
+SPECS = [
+    # VM
+    CommandSpec("vm_capture", "vm capture", "Capture the VM",
+                args=[Arg("name", "Name of VM"),
+                      Arg("target_image_name", "the target image name")],
+                options=[_DNS_NAME, ("--label", "Label"),
+                         ("--os-state", "os_state"), ("--delete", "delete")],
+                writes=("vm", "vm_image", "vm_disk")),
+    CommandSpec("vm_create", "vm create", "Create a VM",
+                params="required",
+                options=[(None, "DNSName"), (None, "Image"),
+                         ("--vm-name", "VMName"),
+                         ("--userName", "username"),
+                         ("--password", "password"),
+                         ("--vm-size", "VMSize"),
+                         ("--location", "Location")],
+                writes=("vm", "vm_endpoint", "vm_disk")),
+    CommandSpec("vm_create_from", "vm create-from",
+                "Create a VM from a json file",
+                params="required",
+                options=[(None, "DNSName"), (None, "role_file"),
+                         ("--location", "Location"),
+                         ("--affinity-group", "affinity_group")],
+                writes=("vm", "vm_endpoint", "vm_disk")),
+    CommandSpec("vm_delete", "vm delete", "Delete the VM",
+                args=[Arg("vm_name", "Name of the VM")],
+                options=[_DNS_NAME, _BLOB_DELETE], flags=["--quiet"],
+                writes=("vm", "vm_endpoint", "vm_disk")),
+    CommandSpec("vm_restart", "vm restart", "Restart the VM",
+                args=[Arg("name", "Name of VM")], options=[_DNS_NAME],
+                writes=("vm",)),
+    CommandSpec("vm_list", "vm list", "List all the VMs",
+                options=[_DNS_NAME], azure_json=True, reads="vm"),
+    CommandSpec("vm_show", "vm show", "Show the properties of the VM.",
+                args=[Arg("name", "Name of VM")], options=[_DNS_NAME],
+                azure_json=True, reads="vm"),
+    CommandSpec("vm_shutdown", "vm shutdown", "Shutdown the VM",
+                args=[Arg("name", "Name of VM")],
+                options=[_DNS_NAME,
+                         ("--stay-provisioned", "stay_provisioned")],
+                writes=("vm",)),
+    CommandSpec("vm_start", "vm start", "Start the VM",
+                args=[Arg("name", "Name of VM")], options=[_DNS_NAME],
+                writes=("vm",)),
+    CommandSpec("vm_location_list", "vm location list",
+                "List the available locations",
+                params=None, azure_json=True, reads="location"),
+
+    # VM image
+    CommandSpec("vm_image_show", "vm image show", "Check the VM image info.",
+                args=[Arg("name", "Name of the VM image")], params=None,
+                azure_json=True, ignore_status=True, reads="vm_image"),
+    CommandSpec("vm_image_list", "vm image list",
+                "Check all the VM images' info.",
+                params=None, azure_json=True, reads="vm_image"),
+    CommandSpec("vm_image_create", "vm image create",
+                "Help to create a VM image",
+                args=[Arg("name", "Name of the VM image")],
+                params="required",
+                options=[("--blob-url", "blob_url"),
+                         ("--stay-provisioned", "stay_provisioned"),
+                         ("--os", "os"), ("--location", "location"),
+                         ("--label", "label"),
+                         ("--source-key", "source_key")],
+                writes=("vm_image",)),
+    CommandSpec("vm_image_delete", "vm image delete",
+                "Help to delete a VM image",
+                args=[Arg("name", "Name of the VM image")],
+                options=[_BLOB_DELETE], writes=("vm_image", "blob")),
+
+    # VM endpoint
+    CommandSpec("vm_endpoint_create", "vm endpoint create",
+                "Help to create a VM endpoint",
+                args=[Arg("name", "Name of the VM"),
+                      Arg("public_port", "Public port")],
+                params="required",
+                options=[("--name", "name"),
+                         ("--local-port", "local-port"),
+                         ("--protocol", "protocol"),
+                         ("--idle-timeout", "idle_timeout"),
+                         ("--probe-port", "probe_port"),
+                         ("--probe-protocol", "probe_protocol"),
+                         ("--probe-path", "probe_path"),
+                         ("--probe-interval", "probe_interval"),
+                         ("--probe-timeout", "probe_timeout"),
+                         ("--direct-server-return", "direct_server_return"),
+                         ("--load-balanced-set-name",
+                          "load_balanced_set_name"),
+                         ("--internal-load-balancer-name",
+                          "internal_load_balancer_name"),
+                         ("--load-balancer-distribution",
+                          "load_balancer_distribution")],
+                writes=("vm", "vm_endpoint")),
+    CommandSpec("vm_endpoint_delete", "vm endpoint delete",
+                "Help to delete a VM endpoint",
+                args=[Arg("name", "Name of the VM"),
+                      Arg("endpoint_name", "Endpoint name")],
+                options=[_DNS_NAME], writes=("vm", "vm_endpoint")),
+    CommandSpec("vm_endpoint_show", "vm endpoint show",
+                "Help to show a VM endpoint",
+                args=[Arg("name", "Name of the VM"),
+                      Arg("endpoint_name", "Endpoint name")],
+                options=[_DNS_NAME], azure_json=True, reads="vm_endpoint"),
+    CommandSpec("vm_endpoint_list", "vm endpoint list",
+                "Help to list a VM endpoint",
+                args=[Arg("name", "Name of the VM")],
+                options=[_DNS_NAME], azure_json=True, reads="vm_endpoint"),
+
+    # VM disk
+    CommandSpec("vm_disk_attach", "vm disk attach",
+                "Help to attach a data-disk to a VM",
+                args=[Arg("name", "Name of the VM"),
+                      Arg("disk_image_name", "Disk image name attached")],
+                options=[("--host-caching", "host_caching"), _DNS_NAME],
+                writes=("vm", "vm_disk")),
+    CommandSpec("vm_disk_attach_new", "vm disk attach-new",
+                "Help to attach a new data-disk to a VM",
+                args=[Arg("name", "Name of the VM"),
+                      Arg("disk_image_name", "Disk image name attached")],
+                options=[("--host-caching", "host_caching"), _DNS_NAME],
+                writes=("vm", "vm_disk", "blob")),
+    CommandSpec("vm_disk_create", "vm disk create",
+                "Help to upload and register a disk image",
+                args=[Arg("name", "Disk name"),
+                      Arg("source_path", "Source path of the disk",
+                          default=None)],
+                options=[("--blob-url", "blob_url"),
+                         ("--location", "location"),
+                         ("--affinity-group", "affinity_group"),
+                         ("--os", "os"), ("--parallel", "parallel"),
+                         ("--md5-skip", "md5_skip"),
+                         ("--force-overwrite", "force_overwrite"),
+                         ("--label", "label"),
+                         ("--description", "description"),
+                         ("--base-vhd", "base_vhd"),
+                         ("--source-key", "source-key")],
+                writes=("vm_disk", "blob")),
+    CommandSpec("vm_disk_delete", "vm disk delete",
+                "Help to delete a disk image from personal repository",
+                args=[Arg("disk_image_name", "Disk image name attached")],
+                options=[_BLOB_DELETE], writes=("vm_disk", "blob")),
+    CommandSpec("vm_disk_detach", "vm disk detach",
+                "Help to detach a data-disk from VM",
+                args=[Arg("disk_lun", "Disk LUN")],
+                options=[_DNS_NAME], writes=("vm", "vm_disk")),
+    CommandSpec("vm_disk_list", "vm disk list",
+                "Help to list disks on a VM",
+                args=[Arg("name", "Name of the VM")],
+                options=[_DNS_NAME], azure_json=True, reads="vm_disk"),
+    CommandSpec("vm_disk_show", "vm disk show",
+                "Help to show details about a disk",
+                args=[Arg("name", "Name of the VM")], params=None,
+                azure_json=True, reads="vm_disk"),
+    CommandSpec("vm_disk_update", "vm disk update",
+                "Help to update properties of a data-disk attached to a VM",
+                args=[Arg("name", "Name of the VM"),
+                      Arg("disk_lun", "Disk LUN")],
+                options=[("--host-caching", "host_caching"), _DNS_NAME],
+                writes=("vm", "vm_disk")),
+    CommandSpec("vm_disk_upload", "vm disk upload",
+                "Help to Upload a VHD to a storage account",
+                args=[Arg("source_path", "Source path of the vm disk"),
+                      Arg("blob_url", "The target disk blob url"),
+                      Arg("storage_account_key", "Storage account key")],
+                options=[("--parallel", "parallel"),
+                         ("--md5-skip", "md5_skip"),
+                         ("--force-overwrite", "force_overwrite"),
+                         ("--base-vhd", "base_vhd"),
+                         ("--source-key", "source-key")],
+                writes=("blob",)),
+
+    # Storage account
+    CommandSpec("sto_acct_check", "storage account check",
+                "Help to check whether the account name is valid and is "
+                "not in use",
+                args=[Arg("name", "Name of the storage account")],
+                azure_json=True, reads="sto_acct"),
+    CommandSpec("sto_acct_conn_show", "storage account connectionstring show",
+                "Help to show storage connection string",
+                args=[Arg("name", "Name of the storage account")],
+                options=[("--use-http", "use_http"),
+                         ("--blob-endpoint", "blob_endpoint"),
+                         ("--queue-endpoint", "queue_endpoint"),
+                         ("--table-endpoint", "table_endpoint"),
+                         ("--file-endpoint", "file_endpoint")],
+                azure_json=True, reads="sto_acct"),
+    CommandSpec("sto_acct_create", "storage account create",
+                "Help to create a storage account",
+                args=[Arg("name", "Name of the storage account")],
+                options=[("--label", "label"),
+                         ("--description", "description"),
+                         ("--affinity-group", "affinity-group"),
+                         ("--location", "location"), ("--type", "type")],
+                writes=("sto_acct",)),
+    CommandSpec("sto_acct_show", "storage account show",
+                "Help to show a storage account",
+                args=[Arg("name", "Name of the storage account")],
+                azure_json=True, reads="sto_acct"),
+    CommandSpec("sto_acct_delete", "storage account delete",
+                "Help to delete a storage account",
+                args=[Arg("name", "Name of the storage account")],
+                flags=["--quiet"], writes=("sto_acct", "container", "blob")),
+    CommandSpec("sto_acct_keys_list", "storage account keys list",
+                "Help to list the keys of a storage account",
+                args=[Arg("name", "Name of the storage account")],
+                azure_json=True, reads="sto_acct"),
+    CommandSpec("sto_acct_keys_renew", "storage account keys renew",
+                "Help to renew a key for a storage account from your account",
+                args=[Arg("name", "Name of the storage account")],
+                options=[("--primary", "primary"),
+                         ("--secondary", "secondary")],
+                azure_json=True, writes=("sto_acct",)),
+
+    # Storage blob
+    CommandSpec("blob_copy_start", "storage blob copy start",
+                "Start to copy the resource to the specified storage blob "
+                "which\ncompletes asynchronously",
+                options=[("--source-sas", "source_sas"),
+                         ("--source-uri", "source_uri"),
+                         ("--source-container", "source_container"),
+                         ("--source-blob", "source_blob"),
+                         ("--dest-connection-string",
+                          "dest_connection_string"),
+                         ("--dest-sas", "dest_sas"),
+                         ("--dest-container", "dest_container"),
+                         ("--dest-blob", "dest_blob"),
+                         _CONNECTION_STRING],
+                azure_json=True, writes=("blob",)),
+    CommandSpec("blob_copy_show", "storage blob copy show",
+                "Show details of the specified storage blob",
+                options=[("--container", "container"), ("--blob", "blob"),
+                         ("--sas", "sas"), _CONNECTION_STRING],
+                azure_json=True, reads="blob"),
+    CommandSpec("blob_delete", "storage blob delete",
+                "Delete the specified storage blob",
+                args=[Arg("name", "blob name", flag="--blob")],
+                options=_BLOB_ACCESS, flags=["--quiet"], azure_json=True,
+                writes=("blob",)),
+    CommandSpec("blob_show", "storage blob show",
+                "Show details of the specified storage blob",
+                args=[Arg("name", "blob name", flag="--blob")],
+                options=_BLOB_ACCESS, azure_json=True, reads="blob"),
+    CommandSpec("blob_list", "storage blob list",
+                "List storage blob in the specified storage container use "
+                "wildcard and blob\nname prefix",
+                args=[Arg("name", "blob name prefix", flag="--prefix")],
+                options=_BLOB_ACCESS + (("--include", "include"),),
+                azure_json=True, reads="blob"),
+    CommandSpec("blob_sas", "storage blob sas create",
+                "Create a shared access signature of a storage blob",
+                args=[Arg("name", "blob name", flag="--blob")],
+                options=[("--container", "container"),
+                         ("--permissions", "permissions"),
+                         ("--start", "start"), ("--expiry", "expiry"),
+                         _CONNECTION_STRING],
+                azure_json=True),
+    CommandSpec("blob_upload", "storage blob upload",
+                "Upload the specified file to storage blob",
+                args=[Arg("name", "blob name", flag="--blob")],
+                options=[("--file", "file"), ("--container", "container"),
+                         ("--blobtype", "blobtype"), ("--sas", "sas"),
+                         _CONNECTION_STRING],
+                flags=["--quiet"], writes=("blob",)),
+
+    # Storage container
+    CommandSpec("container_create", "storage container create",
+                "Create a storage container",
+                args=[Arg("name", "container name", flag="--container")],
+                options=[("--permission", "permission"), _CONNECTION_STRING],
+                writes=("container",)),
+    CommandSpec("container_delete", "storage container delete",
+                "Delete the specified storage container",
+                args=[Arg("name", "container name", flag="--container")],
+                options=[_CONNECTION_STRING], flags=["--quiet"],
+                writes=("container", "blob")),
+    CommandSpec("container_show", "storage container show",
+                "Show details of the specified storage container",
+                args=[Arg("name", "container name", flag="--container")],
+                options=[_CONNECTION_STRING], azure_json=True,
+                reads="container"),
+    CommandSpec("container_list", "storage container list",
+                "List storage containers with wildcard",
+                options=[_CONNECTION_STRING], azure_json=True,
+                reads="container"),
+]
+
+
+# Read-only wrappers of the cli modules and the resource they read
+READ_WRAPPERS = dict((spec.name, spec.reads) for spec in SPECS
+                     if spec.reads)
+
+# Mutating wrappers of the cli modules and the resources they change
+WRITE_WRAPPERS = dict((spec.name, spec.writes) for spec in SPECS
+                      if spec.writes)
+
+
+def _option(flag, value):
+    # Same rules as utils_misc.add_option()
+    if value is True:
+        return [flag]
+    if value and isinstance(value, basestring):
+        if flag is None:
+            return [value]
+        return [flag, value]
+    return []
+
+
+def _builder(spec):
+    prefix = ["azure"] + spec.verb.split()
+    arg_flags = [arg.flag for arg in spec.args]
+    options = spec.options
+    flags = list(spec.flags)
+
+    def build(values, params, extra_options):
+        argv = list(prefix)
+        for flag, value in zip(arg_flags, values):
+            if value is None or value == "":
+                continue
+            if flag is not None:
+                argv.append(flag)
+            argv.append(value if isinstance(value, basestring)
+                        else str(value))
+        if params:
+            for flag, key in options:
+                argv.extend(_option(flag, params.get(key, None)))
+        if extra_options:
+            argv.extend(shlex.split(extra_options))
+        return argv + flags
+    return build
+
+
+def _docstring(spec):
+    lines = [spec.doc, ""]
+    for arg in spec.args:
+        lines.append(":param %s: %s" % (arg.name, arg.doc))
+    if spec.params:
+        lines.append(":param params: Command properties")
+    lines += [":param options: extra options",
+              ":param kwargs: Additional args for running the command",
+              ":return: CmdResult object"]
+    return "\n".join(lines)
+
+
+_TEMPLATE = """def %(name)s(%(signature)s):
+    return _run(_build((%(values)s), %(params)s, options), kwargs)
+"""
+
+
+def compile_spec(spec, namespace, mode):
+    """
+    Compile a spec into a wrapper function of a cli module.
+
+    :param spec: CommandSpec object
+    :param namespace: The globals() of the cli module, its command() runs
+                      the built commands
+    :param mode: "asm" or "arm", the cli profile of the commands
+    :return: The wrapper function
+    """
+    signature = []
+    for arg in spec.args:
+        if arg.default is _REQUIRED:
+            signature.append(arg.name)
+        else:
+            signature.append("%s=%r" % (arg.name, arg.default))
+    if spec.params == "required":
+        signature.append("params")
+    elif spec.params:
+        signature.append("params=None")
+    signature += ["options=''", "**kwargs"]
+    values = "".join("%s, " % arg.name for arg in spec.args)
+    defaults = {}
+    if spec.azure_json:
+        defaults["azure_json"] = True
+    if spec.ignore_status is not None:
+        defaults["ignore_status"] = spec.ignore_status
+
+    def run(argv, kwargs):
+        kwargs.setdefault("mode", mode)
+        if "priority" not in kwargs:
+            kwargs["priority"] = azure_cli_priority.current(spec.priority)
+        for key, value in defaults.items():
+            kwargs.setdefault(key, value)
+        return namespace["command"](argv, **kwargs)
+
+    source = _TEMPLATE % {"name": spec.name,
+                          "signature": ", ".join(signature),
+                          "values": values,
+                          "params": "params" if spec.params else "None"}
+    env = {"__name__": namespace["__name__"], "_run": run,
+           "_build": _builder(spec)}
+    exec compile(source, "<%s spec>" % spec.name, "exec") in env
+    func = env[spec.name]
+    func.__doc__ = _docstring(spec)
+    return func
+
+
+def install(namespace, mode):
+    """
+    Define the wrappers of a cli module from the specs.
+
+    :param namespace: The globals() of azure_cli_asm or azure_cli_arm
+    :param mode: "asm" or "arm"
+    """
+    for spec in SPECS:
+        if mode in spec.modes:
+            namespace[spec.name] = compile_spec(spec, namespace, mode)
+
+
+def command(cmd, **kwargs):
+    """
+    Run an Azure cli command.
+
+    :param cmd: List of the program and its arguments, run without a
+                shell, or a command line run by the shell
+    :param kwargs: Additional args for running the command; mode="asm" or
+                   "arm" runs it in the cli profile of the mode, a
+                   utils_misc.Deadline object as deadline bounds its
+                   timeout, and priority is its azure_cli_priority class
+    :return: CmdResult object, a generator of the elements of the JSON
+             array if azure_json=True and iterate=True, or a tuple
+             (cmd, kwargs) without running the command if dry_run=True
+    :raise: CmdError if non-zero exit status and ignore_status=False
+    :raise DeadlineExceededError: If the deadline has passed
+    :raise CircuitOpenError: If the recent commands of the same mode, verb
+                             and location failed, see azure_cli_breaker
+    :raise BudgetExceededError: If the command is over the budget of the
+                                test, see azure_cli_accounting
+    """
+    if kwargs.get('dry_run', False):
+        return cmd, kwargs
+    azure_json = kwargs.get('azure_json', False)
+    debug = kwargs.get('debug', False)
+    ignore_status = kwargs.get('ignore_status', False)
+    timeout = kwargs.get('timeout', None)
+    shell = isinstance(cmd, basestring)
+    if azure_json:
+        if shell:
+            cmd += " --json"
+        else:
+            cmd = cmd + ["--json"]
+    if debug:
+        logging.debug("command: %s", utils_misc.cmdline(cmd))
+    if timeout:
+        try:
+            timeout = int(timeout)
+        except ValueError:
+            logging.error("Ignore the invalid timeout value: %s", timeout)
+            timeout = None
+    deadline = kwargs.get('deadline', None)
+    if deadline is not None:
+        timeout = deadline.get_timeout(timeout)
+    priority = kwargs.get('priority', azure_cli_priority.current())
+    mode = kwargs.get('mode', None)
+
+    env = None
+    profile = azure_cli_common.get_profile(mode)
+    if profile is not None:
+        env = profile.env()
+
+    iterate = azure_json and kwargs.get('iterate', False)
+    if iterate and azure_cli_cassette.get_cassette() is None:
+        azure_cli_hooks.admit(cmd, mode, priority)
+        return _iter_command(cmd, mode, timeout, ignore_status, debug, env)
+
+    def execute():
+        ret = _run(cmd, shell, timeout, debug, env, priority)
+        if ret.exit_status and azure_cli_common.relogin_rejected(ret):
+            logging.debug("Run '%s' again", ret.command)
+            ret = _run(cmd, shell, timeout, debug, env, priority)
+        return ret
+
+    ret = azure_cli_hooks.run(cmd, execute, mode, priority, timeout)
+    if debug:
+        logging.debug("status: %s", ret.exit_status)
+        logging.debug("stdout: %s", ret.stdout.strip())
+        logging.debug("stderr: %s", ret.stderr.strip())
+    if ret.exit_status and not ignore_status:
+        raise process.CmdError(ret.command, ret)
+
+    if azure_json and not ret.exit_status:
+        try:
+            ret.stdout = json.loads(ret.stdout)
+        except ValueError as e:
+            logging.warn(e)
+    if iterate:
+        # The cassettes hold the whole output of the list commands
+        if isinstance(ret.stdout, list):
+            return iter(ret.stdout)
+        return iter([])
+    return ret
+
+
+def _iter_command(cmd, mode, timeout, ignore_status, debug, env):
+    # Stream the elements, the outcome is recorded once the command is done
+    for attempt in range(2):
+        done = []
+
+        def record(ret):
+            done.append(ret)
+            azure_cli_hooks.record(cmd, ret, mode, timeout)
+
+        items = azure_cli_stream.iter_command(cmd, timeout=timeout,
+                                              ignore_status=True,
+                                              verbose=debug, env=env,
+                                              on_result=record)
+        received = False
+        try:
+            for item in items:
+                received = True
+                yield item
+        finally:
+            items.close()
+        ret = done[0]
+        if ret.exit_status and not received and not attempt and \
+           azure_cli_common.relogin_rejected(ret):
+            logging.debug("Run '%s' again", ret.command)
+            continue
+        break
+    if debug:
+        logging.debug("status: %s", ret.exit_status)
+        logging.debug("stderr: %s", ret.stderr.strip())
+    if ret.exit_status and not ignore_status:
+        raise process.CmdError(ret.command, ret)
+
+
+def _run(cmd, shell, timeout, debug, env=None,
+         priority=azure_cli_priority.FOREGROUND):
+    pool = azure_cli_pool.get_pool()
+    spawner = azure_cli_spawner.get_spawner()
+    if pool is not None:
+        return pool.run(cmd, timeout=timeout, verbose=debug,
+                        ignore_status=True, env=env, priority=priority)
+    if spawner is not None:
+        return spawner.run(cmd, timeout=timeout, verbose=debug,
+                           ignore_status=True, env=env)
+    # Without a shell, process.run() splits the quoted command line
+    return process.run(utils_misc.cmdline(cmd), timeout=timeout,
+                       verbose=debug, ignore_status=True, shell=shell,
+                       env=env)
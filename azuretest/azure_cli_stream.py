@@ -0,0 +1,232 @@
+"""
+Streaming decoding of the JSON arrays printed by the Azure cli list commands.
+
+command(cmd, azure_json=True, iterate=True) returns a generator which yields
+the elements of the array while the cli is still writing it, instead of a
+CmdResult holding the whole decoded list:
+
+    for blob in azure_cli_asm.blob_list("", params, iterate=True):
+        ...
+
+Only the element being received is kept in memory.
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import os
+import re
+import json
+import time
+import signal
+import select
+import logging
+import subprocess
+
+from avocado.utils import process
+
+from . import utils_misc
+
+
+_NEXT_RE = re.compile(r"[^\s,]")
+_SCALAR_END_RE = re.compile(r"[\s,\]]")
+_STRUCT_RE = re.compile(r'[{}\[\]"]')
+_STRING_RE = re.compile(r'["\\]')
+
+
+class JSONArrayDecoder(object):
+
+    """
+    Incremental decoder of the elements of a top-level JSON array.
+
+    The input is scanned once: only the boundaries of the elements are
+    tracked (nesting depth and strings), and each complete element is then
+    decoded with json.loads().
+    """
+
+    def __init__(self):
+        self.done = False
+        self._buf = ""
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._scalar = False
+
+    def _take(self, buf, end):
+        item = json.loads(buf[self._start:end])
+        self._start = None
+        return item
+
+    def feed(self, data):
+        """
+        Decode the elements completed by a chunk of data.
+
+        :param data: Next chunk of the array text
+        :return: List of the completed elements
+        :raise ValueError: If the data is not a JSON array
+        """
+        buf = self._buf + data
+        pos = self._pos
+        items = []
+        while pos < len(buf) and not self.done:
+            if self._in_string:
+                match = _STRING_RE.search(buf, pos)
+                if match is None:
+                    pos = len(buf)
+                elif match.group() == "\\":
+                    if match.end() == len(buf):
+                        pos = match.start()
+                        break
+                    pos = match.end() + 1
+                else:
+                    self._in_string = False
+                    pos = match.end()
+                    if self._depth == 1:
+                        items.append(self._take(buf, pos))
+                continue
+            if self._depth == 0:
+                match = _NEXT_RE.search(buf, pos)
+                if match is None:
+                    pos = len(buf)
+                    continue
+                if match.group() != "[":
+                    raise ValueError("Not a JSON array: %r" % buf[:80])
+                self._depth = 1
+                pos = match.end()
+                continue
+            if self._depth == 1 and self._start is None:
+                match = _NEXT_RE.search(buf, pos)
+                if match is None:
+                    pos = len(buf)
+                    continue
+                if match.group() == "]":
+                    self.done = True
+                    pos = match.end()
+                    continue
+                self._start = pos = match.start()
+                self._scalar = match.group() not in '{["'
+            if self._scalar:
+                end = _SCALAR_END_RE.search(buf, pos)
+                if end is None:
+                    break
+                pos = end.start()
+                self._scalar = False
+                items.append(self._take(buf, pos))
+                continue
+            match = _STRUCT_RE.search(buf, pos)
+            if match is None:
+                pos = len(buf)
+                continue
+            pos = match.end()
+            if match.group() == '"':
+                self._in_string = True
+            elif match.group() in "{[":
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 1:
+                    items.append(self._take(buf, pos))
+
+        # Keep only the element being received
+        base = pos
+        if self._start is not None:
+            base = self._start
+            self._start = 0
+        self._buf = buf[base:]
+        self._pos = pos - base
+        return items
+
+
+def iter_command(cmd, timeout=None, ignore_status=False, verbose=False,
+                 env=None, on_result=None):
+    """
+    Run a cli command printing a JSON array and yield its elements.
+
+    :param cmd: List of the program and its arguments, run without a
+                shell, or a command line run by the shell
+    :param timeout: Time (seconds) before giving up the command
+    :param ignore_status: If False, raise CmdError on non-zero status
+    :param verbose: If True, log the command
+    :param env: Extra environment variables of the command
+    :param on_result: Function called with the CmdResult of the command
+                      once the elements are consumed or the generator is
+                      closed; a command stopped by its consumer succeeded
+    :return: A generator of the array elements
+    :raise: CmdError if non-zero exit status and ignore_status=False, once
+            the elements are consumed
+    """
+    shell = isinstance(cmd, basestring)
+    cmd_line = utils_misc.cmdline(cmd)
+    if verbose:
+        logging.info("Running '%s'", cmd_line)
+    start_time = time.time()
+    end_time = None
+    if timeout:
+        end_time = start_time + timeout
+    if env:
+        env = dict(os.environ, **env)
+    proc = subprocess.Popen(cmd, shell=shell, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, close_fds=True,
+                            preexec_fn=os.setsid, env=env)
+    out_fd = proc.stdout.fileno()
+    err_fd = proc.stderr.fileno()
+    pending = [out_fd, err_fd]
+    decoder = JSONArrayDecoder()
+    head = ""
+    stderr = ""
+    interrupted = False
+    try:
+        while pending:
+            wait = None
+            if end_time is not None:
+                wait = end_time - time.time()
+                if wait <= 0:
+                    logging.error("Command '%s' timed out after %ss",
+                                  cmd_line, timeout)
+                    os.killpg(proc.pid, signal.SIGKILL)
+                    interrupted = True
+                    break
+            readable, _, _ = select.select(pending, [], [], wait)
+            for fd in readable:
+                data = os.read(fd, 65536)
+                if not data:
+                    pending.remove(fd)
+                elif fd == err_fd:
+                    stderr += data
+                elif decoder is not None:
+                    if len(head) < 1024:
+                        head += data[:1024]
+                    try:
+                        for item in decoder.feed(data):
+                            yield item
+                    except ValueError as e:
+                        logging.warn(e)
+                        decoder = None
+    finally:
+        stopped = False
+        if proc.poll() is None and pending and not interrupted:
+            # The consumer stopped early
+            stopped = True
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+        status = proc.returncode
+        if interrupted:
+            status = -signal.SIGKILL
+        elif stopped:
+            status = 0
+        ret = process.CmdResult(cmd_line, head, stderr, status,
+                                time.time() - start_time)
+        ret.interrupted = interrupted
+        if on_result is not None:
+            on_result(ret)
+
+    if verbose:
+        logging.debug("status: %s", ret.exit_status)
+        logging.debug("stderr: %s", ret.stderr.strip())
+    if status and not ignore_status:
+        raise process.CmdError(cmd_line, ret)
@@ -55,30 +55,37 @@ class VMImage(object):
             self.vm_image_update()
         logging.info("Azure VM image '%s'", self.name)
 
-    def verify_exist(self):
+    def verify_exist(self, deadline=None):
         """
         Make sure the VM image is available.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
         logging.info("Check the VM image %s if available", self.name)
-        return azure_cli_asm.vm_image_show(self.name).exit_status
+        return azure_cli_asm.vm_image_show(self.name,
+                                           deadline=deadline).exit_status
 
-    def vm_image_update(self):
+    def vm_image_update(self, deadline=None):
         """
         Update the VM image info.
+
+        :param deadline: utils_misc.Deadline of the calling operation
         """
         logging.info("Check the VM image if available. "
                      "And update the VM image %s properties", self.name)
-        ret = azure_cli_asm.vm_image_show(self.name)
+        ret = azure_cli_asm.vm_image_show(self.name, deadline=deadline)
         if not ret.exit_status:
             self.params.update(ret.stdout)
         return ret.exit_status
 
-    def vm_image_create(self):
+    def vm_image_create(self, deadline=None):
         """
         Create the VM image based on the parameters
+        :param deadline: utils_misc.Deadline of the calling operation
         :return: Zero if success to create the VM image
         """
-        ret = azure_cli_asm.vm_image_create(self.name, self.params, options='')
+        ret = azure_cli_asm.vm_image_create(self.name, self.params, options='',
+                                            deadline=deadline)
         if not ret.exit_status:
-            self.vm_image_update()
+            self.vm_image_update(deadline=deadline)
         return ret.exit_status
@@ -0,0 +1,807 @@
+"""
+REST backend of the Azure cli wrappers in both arm and asm mode.
+
+Once enabled for a mode, the wrappers implemented here (vm_show, vm_start,
+sto_acct_show, ...) talk to the Service Management (asm) or Resource Manager
+(arm) REST API over a pool of keep-alive HTTPS connections instead of running
+the azure cli.  They return the same CmdResult objects; the other wrappers,
+and the calls passing extra cli options, still run the cli.  The calls go
+through the per-call hooks of the cli commands (metrics, cassette, rate
+limiter, circuit breaker and call budget, see azure_cli_hooks).
+
+    azure_rest.enable("arm", subscription_id=sub_id, resource_group="rg")
+
+azure_rest_stub provides a local server implementing the same API subset.
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import os
+import json
+import time
+import socket
+import signal
+import httplib
+import logging
+import urlparse
+import functools
+import threading
+import xml.etree.ElementTree as ElementTree
+
+from avocado.utils import process
+
+from . import azure_cli_hooks
+from . import azure_cli_priority
+
+
+ASM_ENDPOINT = "https://management.core.windows.net"
+ARM_ENDPOINT = "https://management.azure.com"
+ASM_API_VERSION = "2015-04-01"
+ARM_COMPUTE_API_VERSION = "2016-03-30"
+ARM_STORAGE_API_VERSION = "2016-01-01"
+ARM_API_VERSION = "2016-06-01"
+ASM_XMLNS = "http://schemas.microsoft.com/windowsazure"
+DEFAULT_POOL_SIZE = 8
+DEFAULT_TIMEOUT = 240
+POLL_INTERVAL = 2
+
+
+class RESTError(Exception):
+
+    def __init__(self, status, msg):
+        Exception.__init__(self, status, msg)
+        self.status = status
+        self.msg = msg
+
+    def __str__(self):
+        return "REST request failed    (status: %s,    message: %s)" % \
+            (self.status, self.msg)
+
+
+class RESTUnsupportedError(Exception):
+
+    """
+    The call can't be served by the REST backend.
+    """
+    pass
+
+
+class HTTPConnectionPool(object):
+
+    """
+    Keep-alive HTTP(S) connections to one host.
+    """
+
+    def __init__(self, url, maxsize=DEFAULT_POOL_SIZE, timeout=60,
+                 cert_file=None, key_file=None):
+        """
+        :param url: Base url of the host, e.g. https://management.azure.com
+        :param maxsize: Max number of the idle connections kept
+        :param timeout: Socket timeout (seconds)
+        :param cert_file: Client certificate (PEM) for https
+        :param key_file: Private key (PEM) of cert_file
+        """
+        parsed = urlparse.urlparse(url)
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.cert_file = cert_file
+        self.key_file = key_file
+        self.created = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _new_connection(self):
+        self.created += 1
+        if self.scheme == "https":
+            conn = httplib.HTTPSConnection(self.host, self.port,
+                                           key_file=self.key_file,
+                                           cert_file=self.cert_file,
+                                           timeout=self.timeout)
+        else:
+            conn = httplib.HTTPConnection(self.host, self.port,
+                                          timeout=self.timeout)
+        conn.connect()
+        # Small requests on a kept-alive connection must not wait for acks
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conn
+
+    def _get(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._new_connection(), False
+
+    def _put(self, conn):
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        Send a request on an idle connection.
+
+        :param method: HTTP method
+        :param path: Path and query of the url
+        :param body: Request body
+        :param headers: Request headers
+        :return: A tuple (status, headers, body)
+        """
+        headers = headers or {}
+        while True:
+            conn, reused = self._get()
+            try:
+                conn.request(method, path, body, headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                # The server may have closed an idle connection
+                if reused:
+                    continue
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._put(conn)
+            return resp.status, dict(resp.getheaders()), data
+
+    def close(self):
+        with self._lock:
+            for conn in self._idle:
+                conn.close()
+            self._idle = []
+
+
+def _strip_ns(tag):
+    return tag.split("}", 1)[-1]
+
+
+def xml_to_dict(elem):
+    """
+    Convert a Service Management XML element to python objects.
+
+    Elements without children become strings, elements whose children share
+    one tag become lists, and others become dicts.
+    """
+    children = list(elem)
+    if not children:
+        return elem.text or ""
+    tags = [_strip_ns(child.tag) for child in children]
+    if len(children) > 1 and len(set(tags)) == 1:
+        return [xml_to_dict(child) for child in children]
+    return dict((tag, xml_to_dict(child)) for tag, child in
+                zip(tags, children))
+
+
+def _as_list(value):
+    if not value:
+        return []
+    if isinstance(value, list):
+        return value
+    if isinstance(value, dict) and len(value) == 1:
+        # A list element holding a single item
+        value = value.values()[0]
+        if isinstance(value, list):
+            return value
+    return [value]
+
+
+def _cli_access_token():
+    """
+    Get the newest access token of the azure cli login, from the cli config
+    dir (AZURE_CONFIG_DIR, ~/.azure by default) the profiles link to.
+    """
+    config_dir = os.environ.get("AZURE_CONFIG_DIR",
+                                os.path.join(os.path.expanduser("~"),
+                                             ".azure"))
+    path = os.path.join(config_dir, "accessTokens.json")
+    try:
+        with open(path) as token_file:
+            tokens = json.load(token_file)
+    except (IOError, ValueError):
+        return None
+    tokens = [t for t in tokens if "accessToken" in t]
+    if not tokens:
+        return None
+    return sorted(tokens, key=lambda t: t.get("expiresOn", ""))[-1][
+        "accessToken"]
+
+
+class BaseRESTBackend(object):
+
+    """
+    Common code of the asm and arm REST backends.
+
+    Every public method mirrors the wrapper of the same name in the cli
+    modules, and raises RESTUnsupportedError when it can't serve the call.
+    """
+
+    def __init__(self, endpoint, subscription_id, headers,
+                 pool_size=DEFAULT_POOL_SIZE, cert_file=None,
+                 key_file=None):
+        self.endpoint = endpoint.rstrip("/")
+        self.subscription_id = subscription_id
+        self.headers = headers
+        self.pool = HTTPConnectionPool(self.endpoint, pool_size,
+                                       cert_file=cert_file,
+                                       key_file=key_file)
+
+    def _path(self, url):
+        parsed = urlparse.urlparse(url)
+        path = parsed.path
+        if parsed.query:
+            path += "?" + parsed.query
+        return path
+
+    def _request(self, method, path, body=None, headers=None):
+        all_headers = self.headers.copy()
+        if headers:
+            all_headers.update(headers)
+        if body is not None:
+            all_headers["Content-Length"] = str(len(body))
+        else:
+            all_headers["Content-Length"] = "0"
+        return self.pool.request(method, path, body, all_headers)
+
+    def _decode(self, data):
+        raise NotImplementedError
+
+    def _error(self, status, data):
+        raise NotImplementedError
+
+    def _wait_operation(self, headers, end_time):
+        raise NotImplementedError
+
+    def _run(self, cmd, func, kwargs):
+        """
+        Run a request function and build the CmdResult of the wrapper.
+
+        The call goes through the same per-call hooks as the cli commands
+        (see azure_cli_hooks), named by the cli command of the wrapper
+        given by the dispatcher as cli_cmd.  The stdout is JSON encoded in
+        between, like the output of the cli.
+
+        :param cmd: Description of the request, used as the command
+        :param func: Function called with the end time of the call,
+                     returning the stdout of the result
+        :param kwargs: Keyword arguments of the wrapper
+        """
+        ignore_status = kwargs.get("ignore_status", False)
+        timeout = kwargs.get("timeout", None) or DEFAULT_TIMEOUT
+        if kwargs.get("deadline", None) is not None:
+            timeout = kwargs["deadline"].get_timeout(timeout)
+        if kwargs.get("debug", False):
+            logging.debug("request: %s", cmd)
+
+        def execute():
+            start_time = time.time()
+            stdout, stderr, exit_status = "", "", 0
+            interrupted = False
+            try:
+                stdout = func(start_time + timeout)
+            except RESTError, e:
+                stderr = str(e)
+                exit_status = 1
+                interrupted = e.status == "timeout"
+            except (httplib.HTTPException, socket.error), e:
+                stderr = "%s: %s" % (e.__class__.__name__, e)
+                exit_status = 1
+            if interrupted:
+                exit_status = -signal.SIGKILL
+            ret = process.CmdResult(cmd, json.dumps(stdout), stderr,
+                                    exit_status, time.time() - start_time)
+            ret.interrupted = interrupted
+            return ret
+
+        ret = azure_cli_hooks.run(kwargs.get("cli_cmd") or cmd, execute,
+                                  kwargs.get("mode"),
+                                  kwargs.get("priority",
+                                             azure_cli_priority.current()),
+                                  timeout)
+        if ret.exit_status and not ignore_status:
+            raise process.CmdError(ret.command, ret)
+        try:
+            ret.stdout = json.loads(ret.stdout)
+        except ValueError:
+            pass
+        return ret
+
+    def _send(self, method, path, body, end_time, not_found=None,
+              wait=False):
+        """
+        Send a single request from a request function of _run().
+
+        :param not_found: Result if the resource doesn't exist
+        :param wait: Wait for the completion of an asynchronous operation
+        :return: The decoded response
+        """
+        status, headers, data = self._request(method, path, body)
+        if status == 404 and not_found is not None:
+            return not_found
+        if status >= 400:
+            raise RESTError(status, self._error(status, data))
+        if wait and status in (201, 202):
+            self._wait_operation(headers, end_time)
+            return ""
+        if not data:
+            return ""
+        return self._decode(data)
+
+    def _call(self, method, path, body=None, kwargs=None, not_found=None,
+              wait=False, convert=None):
+        """
+        Run a single request and build the CmdResult of the wrapper.
+
+        :param not_found: stdout of the result if the resource doesn't exist
+        :param wait: Wait for the completion of an asynchronous operation
+        :param convert: Function building the stdout of the result from the
+                        decoded response, e.g. in the shape of the cli output
+        """
+        def request(end_time):
+            ret = self._send(method, path, body, end_time, not_found, wait)
+            if convert is not None and ret is not not_found:
+                return convert(ret)
+            return ret
+        return self._run("%s %s%s" % (method, self.endpoint, path), request,
+                         kwargs or {})
+
+    def _check_options(self, options):
+        if options and options.strip() not in ("", "--quiet"):
+            raise RESTUnsupportedError("cli options: %s" % options)
+
+    def close(self):
+        self.pool.close()
+
+
+class ASMRESTBackend(BaseRESTBackend):
+
+    """
+    Service Management REST API backend of azure_cli_asm.
+
+    The image, location and storage account wrappers are left to the cli:
+    the XML of the API has another shape than their cli output.
+    """
+
+    DEFAULT_ENDPOINT = ASM_ENDPOINT
+
+    def __init__(self, subscription_id, endpoint=ASM_ENDPOINT,
+                 cert_file=None, key_file=None,
+                 pool_size=DEFAULT_POOL_SIZE, **_):
+        headers = {"x-ms-version": ASM_API_VERSION,
+                   "Content-Type": "application/xml"}
+        super(ASMRESTBackend, self).__init__(endpoint, subscription_id,
+                                             headers, pool_size,
+                                             cert_file, key_file)
+
+    def _decode(self, data):
+        return xml_to_dict(ElementTree.fromstring(data))
+
+    def _error(self, status, data):
+        try:
+            error = self._decode(data)
+            return "%s: %s" % (error.get("Code"), error.get("Message"))
+        except (ElementTree.ParseError, AttributeError):
+            return data
+
+    def _wait_operation(self, headers, end_time):
+        request_id = headers.get("x-ms-request-id")
+        path = "/%s/operations/%s" % (self.subscription_id, request_id)
+        while time.time() < end_time:
+            status, _, data = self._request("GET", path)
+            operation = self._decode(data)
+            if operation.get("Status") == "Succeeded":
+                return
+            if operation.get("Status") == "Failed":
+                error = operation.get("Error", {})
+                raise RESTError(operation.get("HttpStatusCode"),
+                                "%s: %s" % (error.get("Code"),
+                                            error.get("Message")))
+            time.sleep(POLL_INTERVAL)
+        raise RESTError("timeout", "Operation %s timed out" % request_id)
+
+    def _service_path(self, *parts):
+        return "/".join(("", self.subscription_id, "services") + parts)
+
+    def _deployment(self, service):
+        path = self._service_path("hostedservices", service,
+                                  "deploymentslots", "production")
+        status, _, data = self._request("GET", path)
+        if status == 404:
+            return None
+        if status >= 400:
+            raise RESTError(status, self._error(status, data))
+        return self._decode(data)
+
+    @staticmethod
+    def _vm_from_deployment(service, deployment, role_name):
+        """
+        Build the 'azure vm show --json' output from a deployment.
+        """
+        instances = _as_list(deployment.get("RoleInstanceList"))
+        roles = _as_list(deployment.get("RoleList"))
+        instance = dict()
+        for item in instances:
+            if item.get("RoleName") == role_name:
+                instance = item
+        role = dict()
+        for item in roles:
+            if item.get("RoleName") == role_name:
+                role = item
+        endpoints = []
+        for endpoint in _as_list(instance.get("InstanceEndpoints")):
+            endpoints.append({"localPort": int(endpoint.get("LocalPort", 0)),
+                              "name": endpoint.get("Name"),
+                              "port": int(endpoint.get("PublicPort", 0)),
+                              "protocol": endpoint.get("Protocol"),
+                              "virtualIPAddress": endpoint.get("Vip")})
+        vips = [{"address": vip.get("Address"), "name": vip.get("Name")}
+                for vip in _as_list(deployment.get("VirtualIPs"))]
+        return {"DNSName": "%s.cloudapp.net" % service,
+                "VMName": role_name,
+                "IPAddress": instance.get("IpAddress"),
+                "InstanceStatus": instance.get("InstanceStatus"),
+                "InstanceSize": instance.get("InstanceSize"),
+                "PowerState": instance.get("PowerState"),
+                "OSDisk": role.get("OSVirtualHardDisk", {}),
+                "DataDisks": _as_list(role.get("DataVirtualHardDisks")),
+                "VirtualIPAddresses": vips,
+                "Network": {"Endpoints": endpoints}}
+
+    def _role(self, name, params):
+        service = name
+        if params and params.get("DNSName"):
+            service = params["DNSName"].split(".")[0]
+        return service, name
+
+    def vm_show(self, name, params=None, options='', **kwargs):
+        self._check_options(options)
+        service, role = self._role(name, params)
+
+        def request(end_time):
+            deployment = self._deployment(service)
+            if deployment is None:
+                return "No VMs found"
+            return self._vm_from_deployment(service, deployment, role)
+        return self._run("GET %s%s" % (self.endpoint, service), request,
+                         kwargs)
+
+    def vm_list(self, params=None, options='', **kwargs):
+        self._check_options(options)
+        path = self._service_path("hostedservices")
+
+        def request(end_time):
+            status, _, data = self._request("GET", path)
+            if status >= 400:
+                raise RESTError(status, self._error(status, data))
+            vms = []
+            for service in _as_list(self._decode(data)):
+                name = service.get("ServiceName")
+                deployment = self._deployment(name)
+                if deployment is None:
+                    continue
+                for role in _as_list(deployment.get("RoleList")):
+                    vms.append(self._vm_from_deployment(
+                        name, deployment, role.get("RoleName")))
+            return vms
+        return self._run("GET %s%s" % (self.endpoint, path), request, kwargs)
+
+    def _deployment_call(self, method, service, parts, body=None,
+                         kwargs=None, query=""):
+        """
+        Run a request on the production deployment of a service and build
+        the CmdResult of the wrapper.  The deployment is looked up within
+        the call, so its failures and timeout are handled like those of the
+        request.
+
+        :param parts: Parts of the path under the deployment
+        :param query: Query string of the path, e.g. "?comp=media"
+        """
+        def request(end_time):
+            deployment = self._deployment(service)
+            if deployment is None:
+                raise RESTError(404, "No deployment of %s" % service)
+            path = self._service_path("hostedservices", service,
+                                      "deployments", deployment.get("Name"),
+                                      *parts) + query
+            return self._send(method, path, body, end_time, wait=True)
+        path = self._service_path("hostedservices", service, "deployments",
+                                  "*", *parts) + query
+        return self._run("%s %s%s" % (method, self.endpoint, path), request,
+                         kwargs or {})
+
+    def _role_operation(self, name, params, operation, kwargs, extra=""):
+        service, role = self._role(name, params)
+        body = ('<%s xmlns="%s" xmlns:i="http://www.w3.org/2001/'
+                'XMLSchema-instance"><OperationType>%s</OperationType>%s'
+                '</%s>' % (operation, ASM_XMLNS, operation, extra,
+                           operation))
+        return self._deployment_call("POST", service,
+                                     ("roleinstances", role, "Operations"),
+                                     body, kwargs)
+
+    def vm_start(self, name, params=None, options='', **kwargs):
+        self._check_options(options)
+        return self._role_operation(name, params, "StartRoleOperation",
+                                    kwargs)
+
+    def vm_restart(self, name, params=None, options='', **kwargs):
+        self._check_options(options)
+        return self._role_operation(name, params, "RestartRoleOperation",
+                                    kwargs)
+
+    def vm_shutdown(self, name, params=None, options='', **kwargs):
+        self._check_options(options)
+        post_state = "StoppedDeallocated"
+        if params and params.get("stay_provisioned"):
+            post_state = "Stopped"
+        return self._role_operation(
+            name, params, "ShutdownRoleOperation", kwargs,
+            "<PostShutdownAction>%s</PostShutdownAction>" % post_state)
+
+    def vm_delete(self, vm_name, params=None, options='', **kwargs):
+        self._check_options(options)
+        service, _ = self._role(vm_name, params)
+        query = ""
+        if params and params.get("blob_delete"):
+            query = "?comp=media"
+        return self._deployment_call("DELETE", service, (), kwargs=kwargs,
+                                     query=query)
+
+
+class ARMRESTBackend(BaseRESTBackend):
+
+    """
+    Resource Manager REST API backend of azure_cli_arm.
+    """
+
+    DEFAULT_ENDPOINT = ARM_ENDPOINT
+
+    def __init__(self, subscription_id, endpoint=ARM_ENDPOINT, token=None,
+                 resource_group=None, pool_size=DEFAULT_POOL_SIZE, **_):
+        # The token of the cli login is read again once it expires
+        self.cli_token = token is None
+        token = token or _cli_access_token()
+        headers = {"Authorization": "Bearer %s" % token,
+                   "Content-Type": "application/json"}
+        self.resource_group = resource_group
+        super(ARMRESTBackend, self).__init__(endpoint, subscription_id,
+                                             headers, pool_size)
+
+    def _request(self, method, path, body=None, headers=None):
+        ret = super(ARMRESTBackend, self)._request(method, path, body,
+                                                   headers)
+        if ret[0] != 401 or not self.cli_token:
+            return ret
+        token = _cli_access_token()
+        if token is None or \
+           self.headers["Authorization"] == "Bearer %s" % token:
+            return ret
+        logging.debug("Access token expired, use the new cli one")
+        self.headers["Authorization"] = "Bearer %s" % token
+        return super(ARMRESTBackend, self)._request(method, path, body,
+                                                    headers)
+
+    def _decode(self, data):
+        ret = json.loads(data)
+        if isinstance(ret, dict) and "value" in ret and len(ret) <= 2:
+            return ret["value"]
+        return ret
+
+    def _error(self, status, data):
+        try:
+            error = json.loads(data).get("error", {})
+            return "%s: %s" % (error.get("code"), error.get("message"))
+        except (ValueError, AttributeError):
+            return data
+
+    def _wait_operation(self, headers, end_time):
+        url = headers.get("azure-asyncoperation") or headers.get("location")
+        if not url:
+            return
+        path = self._path(url)
+        while time.time() < end_time:
+            time.sleep(POLL_INTERVAL)
+            status, _, data = self._request("GET", path)
+            if status >= 400:
+                raise RESTError(status, self._error(status, data))
+            if status == 202:
+                continue
+            operation = data and json.loads(data) or {}
+            if operation.get("status", "Succeeded") == "Succeeded":
+                return
+            if operation.get("status") in ("Failed", "Canceled"):
+                error = operation.get("error", {})
+                raise RESTError(status, "%s: %s" % (error.get("code"),
+                                                    error.get("message")))
+        raise RESTError("timeout", "Operation %s timed out" % url)
+
+    def _group(self, params):
+        group = self.resource_group
+        if params:
+            group = params.get("ResourceGroupName", group)
+        if not group:
+            raise RESTUnsupportedError("No resource group")
+        return group
+
+    def _resource_path(self, provider, params, *parts, **query):
+        path = "/subscriptions/%s/resourceGroups/%s/providers/%s" % \
+            (self.subscription_id, self._group(params), provider)
+        if parts:
+            path += "/" + "/".join(parts)
+        return path + "?" + "&".join("%s=%s" % item for item in
+                                     sorted(query.items()))
+
+    def _vm_path(self, params, *parts, **query):
+        query["api-version"] = ARM_COMPUTE_API_VERSION
+        return self._resource_path("Microsoft.Compute/virtualMachines",
+                                   params, *parts, **query)
+
+    @staticmethod
+    def _vm_from_resource(resource):
+        """
+        Build the 'azure vm show --json' output from a VM resource: the
+        properties at the top level and the power state of the instance
+        view, e.g. "VM running".
+        """
+        vm = dict((k, v) for k, v in resource.items() if k != "properties")
+        vm.update(resource.get("properties", {}))
+        view = vm.get("instanceView") or {}
+        for status in view.get("statuses", []):
+            if status.get("code", "").startswith("PowerState/"):
+                vm["powerState"] = status.get("displayStatus")
+        return vm
+
+    def vm_show(self, name, params=None, options='', **kwargs):
+        self._check_options(options)
+        return self._call("GET", self._vm_path(params, name,
+                                               **{"$expand": "instanceView"}),
+                          kwargs=kwargs, not_found="No VMs found",
+                          convert=self._vm_from_resource)
+
+    def vm_list(self, params=None, options='', **kwargs):
+        self._check_options(options)
+        return self._call("GET", self._vm_path(params), kwargs=kwargs,
+                          convert=lambda vms: [self._vm_from_resource(vm)
+                                               for vm in vms])
+
+    def vm_start(self, name, params=None, options='', **kwargs):
+        self._check_options(options)
+        return self._call("POST", self._vm_path(params, name, "start"),
+                          kwargs=kwargs, wait=True)
+
+    def vm_restart(self, name, params=None, options='', **kwargs):
+        self._check_options(options)
+        return self._call("POST", self._vm_path(params, name, "restart"),
+                          kwargs=kwargs, wait=True)
+
+    def vm_shutdown(self, name, params=None, options='', **kwargs):
+        self._check_options(options)
+        action = "deallocate"
+        if params and params.get("stay_provisioned"):
+            action = "powerOff"
+        return self._call("POST", self._vm_path(params, name, action),
+                          kwargs=kwargs, wait=True)
+
+    def vm_delete(self, vm_name, params=None, options='', **kwargs):
+        self._check_options(options)
+        return self._call("DELETE", self._vm_path(params, vm_name),
+                          kwargs=kwargs, wait=True)
+
+    def vm_location_list(self, options='', **kwargs):
+        self._check_options(options)
+        return self._call("GET", "/subscriptions/%s/locations?api-version=%s"
+                          % (self.subscription_id, ARM_API_VERSION),
+                          kwargs=kwargs)
+
+    def sto_acct_show(self, name, params=None, options='', **kwargs):
+        self._check_options(options)
+        path = self._resource_path("Microsoft.Storage/storageAccounts",
+                                   params, name,
+                                   **{"api-version": ARM_STORAGE_API_VERSION})
+        return self._call("GET", path, kwargs=kwargs)
+
+    def sto_acct_keys_list(self, name, params=None, options='', **kwargs):
+        self._check_options(options)
+        path = self._resource_path("Microsoft.Storage/storageAccounts",
+                                   params, name, "listKeys",
+                                   **{"api-version": ARM_STORAGE_API_VERSION})
+        return self._call("POST", path, kwargs=kwargs)
+
+
+BACKENDS = {"asm": ASMRESTBackend, "arm": ARMRESTBackend}
+
+_backends = {}
+
+
+def _dispatcher(func, mode):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        backend = _backends.get(mode)
+        method = getattr(backend, func.__name__, None)
+        if method is None or kwargs.get("dry_run", False):
+            return func(*args, **kwargs)
+        iterate = kwargs.pop("iterate", False)
+        # The cli command of the call names it in the per-call hooks
+        cli_cmd, kwargs = func(*args, **dict(kwargs, dry_run=True))
+        kwargs = dict(kwargs)
+        del kwargs["dry_run"]
+        if kwargs.get("azure_json", False):
+            cli_cmd = cli_cmd + ["--json"]
+        try:
+            ret = method(*args, cli_cmd=cli_cmd, **kwargs)
+        except RESTUnsupportedError, e:
+            logging.debug("Run %s with the cli: %s", func.__name__, e)
+            if iterate:
+                kwargs["iterate"] = iterate
+            return func(*args, **kwargs)
+        if iterate:
+            return iter(ret.stdout or [])
+        return ret
+    return wrapper
+
+
+def install(namespace, mode):
+    """
+    Route the wrappers of a cli module to the REST backend once enabled.
+
+    :param namespace: The globals() of azure_cli_asm or azure_cli_arm
+    :param mode: "asm" or "arm"
+    """
+    for name in dir(BACKENDS[mode]):
+        if not name.startswith("_") and callable(namespace.get(name)):
+            namespace[name] = _dispatcher(namespace[name], mode)
+
+
+def enable(mode, subscription_id, **params):
+    """
+    Serve the wrappers of a mode with the REST backend.
+
+    :param mode: "asm" or "arm"
+    :param subscription_id: Azure subscription id
+    :param params: Arguments of the backend, e.g. endpoint, cert_file and
+                   key_file (asm), token and resource_group (arm), pool_size
+    :return: The backend object
+    :raise ValueError: If the params can't authenticate the backend
+    """
+    if mode not in BACKENDS:
+        raise ValueError("Unknown mode: %s" % mode)
+    if not subscription_id:
+        raise ValueError("No subscription id for the %s REST backend" % mode)
+    params = dict((k, v) for k, v in params.items() if v)
+    endpoint = params.get("endpoint", BACKENDS[mode].DEFAULT_ENDPOINT)
+    # A plain http endpoint is a local stub, see azure_rest_stub
+    if mode == "asm" and endpoint.startswith("https:") and \
+       not params.get("cert_file"):
+        raise ValueError("The asm REST backend needs the management "
+                         "certificate of the subscription (cert_file)")
+    if mode == "arm" and not params.get("token") and \
+       _cli_access_token() is None:
+        raise ValueError("The arm REST backend needs an access token, log "
+                         "in the azure cli or give the token")
+    disable(mode)
+    _backends[mode] = BACKENDS[mode](subscription_id, **params)
+    logging.debug("Use the REST backend in %s mode", mode)
+    return _backends[mode]
+
+
+def disable(mode):
+    """
+    Serve the wrappers of a mode with the azure cli again.
+
+    :param mode: "asm" or "arm"
+    """
+    backend = _backends.pop(mode, None)
+    if backend is not None:
+        backend.close()
+
+
+def get_backend(mode):
+    """
+    :return: The REST backend of the mode, None if not enabled
+    """
+    return _backends.get(mode)
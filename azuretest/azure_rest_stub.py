@@ -0,0 +1,352 @@
+#!/usr/bin/python
+"""
+Local stub of the Azure REST API subset used by azure_rest.
+
+The stub keeps VMs, images and storage accounts in memory and serves the
+Service Management (asm) and Resource Manager (arm) requests of the REST
+backends over HTTP/1.1 keep-alive connections, so the backends can be
+exercised and benchmarked offline:
+
+    server = azure_rest_stub.start_stub()
+    server.state.add_vm("walatest")
+    azure_rest.enable("asm", "sub", endpoint=server.url)
+
+Run "python -m azuretest.azure_rest_stub" to benchmark the backends against
+the stub.
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import re
+import json
+import time
+import uuid
+import threading
+import BaseHTTPServer
+import SocketServer
+from xml.sax.saxutils import escape
+
+ASM_XMLNS = "http://schemas.microsoft.com/windowsazure"
+
+_ASM_STATES = {"StartRoleOperation": ("ReadyRole", "Started"),
+               "RestartRoleOperation": ("ReadyRole", "Started"),
+               "ShutdownRoleOperation": ("StoppedDeallocated", "Stopped")}
+_ARM_STATES = {"start": "running", "restart": "running",
+               "powerOff": "stopped", "deallocate": "deallocated"}
+
+
+def _xml(tag, value):
+    if isinstance(value, dict):
+        inner = "".join(_xml(k, v) for k, v in sorted(value.items()))
+    elif isinstance(value, list):
+        inner = "".join(_xml(k, v) for item in value
+                        for k, v in item.items())
+    else:
+        inner = escape(str(value))
+    return "<%s>%s</%s>" % (tag, inner, tag)
+
+
+class StubState(object):
+
+    """
+    In-memory resources of the stub.
+    """
+
+    def __init__(self, delay=0):
+        """
+        :param delay: Time (seconds) added to every response
+        """
+        self.delay = delay
+        self.requests = 0
+        self.vms = {}
+        self.images = {}
+        self.storage_accounts = {}
+        self.lock = threading.Lock()
+
+    def add_vm(self, name, size="Small", location="East US",
+               group="walaauto", status="running"):
+        self.vms[name] = {"name": name, "size": size, "location": location,
+                          "group": group, "status": status,
+                          "ip": "10.0.0.%d" % (len(self.vms) + 4)}
+
+    def add_image(self, name, location="East US", os_type="Linux"):
+        self.images[name] = {"Name": name, "Label": name,
+                             "Location": location, "OS": os_type}
+
+    def add_storage_account(self, name, location="East US"):
+        self.storage_accounts[name] = {"ServiceName": name,
+                                       "Location": location}
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    # Buffer the headers, they are flushed after each request
+    wbufsize = -1
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status, body="", content_type="application/json",
+              headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_xml(self, tag, value, status=200):
+        body = _xml(tag, value).replace("<%s>" % tag, '<%s xmlns="%s">' %
+                                        (tag, ASM_XMLNS), 1)
+        self._send(status, body, "application/xml")
+
+    def _accepted(self):
+        request_id = str(uuid.uuid4())
+        self._send(202, headers={
+            "x-ms-request-id": request_id,
+            "Azure-AsyncOperation": "http://%s:%s/operations/%s" %
+            (self.server.server_address + (request_id,))})
+
+    def _handle(self, method):
+        state = self.server.state
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else ""
+        if state.delay:
+            time.sleep(state.delay)
+        path = self.path.split("?", 1)[0]
+        with state.lock:
+            state.requests += 1
+            for pattern, handler_name in self.ROUTES:
+                match = re.match(pattern, path)
+                if match and handler_name.startswith(method.lower() + "_"):
+                    return getattr(self, handler_name)(state, body,
+                                                       *match.groups())
+        self._send(404, json.dumps({"error": {"code": "NotFound",
+                                              "message": path}}))
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    # Service Management API
+    def get_asm_services(self, state, body):
+        self._send_xml("HostedServices",
+                       [{"HostedService": {"ServiceName": name}}
+                        for name in sorted(state.vms)])
+
+    def get_asm_deployment(self, state, body, service):
+        vm = state.vms.get(service)
+        if vm is None:
+            return self._send(404, _xml("Error", {"Code": "ResourceNotFound",
+                                                  "Message": service}),
+                              "application/xml")
+        running = vm["status"] == "running"
+        instance = {"RoleName": vm["name"], "InstanceName": vm["name"],
+                    "InstanceStatus": running and "ReadyRole" or
+                    "StoppedDeallocated",
+                    "InstanceSize": vm["size"], "IpAddress": vm["ip"],
+                    "PowerState": running and "Started" or "Stopped",
+                    "InstanceEndpoints": [{"InstanceEndpoint": {
+                        "Name": "ssh", "Vip": "13.0.0.1", "PublicPort": "22",
+                        "LocalPort": "22", "Protocol": "tcp"}}]}
+        self._send_xml("Deployment", {
+            "Name": vm["name"], "DeploymentSlot": "Production",
+            "RoleInstanceList": [{"RoleInstance": instance}],
+            "RoleList": [{"Role": {"RoleName": vm["name"]}}],
+            "VirtualIPs": [{"VirtualIP": {"Address": "13.0.0.1",
+                                          "Name": service}}]})
+
+    def post_asm_role_operation(self, state, body, service, deployment,
+                                role):
+        operation = re.search(r"<OperationType>(\w+)</", body).group(1)
+        state.vms[service]["status"] = (
+            _ASM_STATES[operation][0] == "ReadyRole" and "running" or
+            "deallocated")
+        self._accepted()
+
+    def delete_asm_deployment(self, state, body, service, deployment):
+        state.vms.pop(service, None)
+        self._accepted()
+
+    def get_asm_operation(self, state, body, request_id):
+        self._send_xml("Operation", {"ID": request_id, "Status": "Succeeded",
+                                     "HttpStatusCode": "200"})
+
+    def get_asm_images(self, state, body):
+        self._send_xml("Images", [{"OSImage": image} for _, image in
+                                  sorted(state.images.items())])
+
+    def get_asm_image(self, state, body, name):
+        if name not in state.images:
+            return self._send(404, _xml("Error", {"Code": "ResourceNotFound",
+                                                  "Message": name}),
+                              "application/xml")
+        self._send_xml("OSImage", state.images[name])
+
+    def get_asm_storage(self, state, body, name):
+        account = state.storage_accounts.get(name)
+        if account is None:
+            return self._send(404, _xml("Error", {"Code": "ResourceNotFound",
+                                                  "Message": name}),
+                              "application/xml")
+        self._send_xml("StorageService", account)
+
+    def get_asm_storage_keys(self, state, body, name):
+        self._send_xml("StorageService", {
+            "ServiceName": name, "StorageServiceKeys": {
+                "Primary": "cHJpbWFyeQ==", "Secondary": "c2Vjb25kYXJ5"}})
+
+    def get_asm_locations(self, state, body):
+        self._send_xml("Locations", [{"Location": {"Name": "East US"}},
+                                     {"Location": {"Name": "West US"}}])
+
+    # Resource Manager API
+    def _arm_vm(self, vm):
+        return {"name": vm["name"], "location": vm["location"],
+                "properties": {
+                    "hardwareProfile": {"vmSize": vm["size"]},
+                    "provisioningState": "Succeeded",
+                    "instanceView": {"statuses": [
+                        {"code": "ProvisioningState/succeeded"},
+                        {"code": "PowerState/%s" % vm["status"]}]}}}
+
+    def get_arm_vms(self, state, body, group):
+        self._send(200, json.dumps({"value": [
+            self._arm_vm(vm) for _, vm in sorted(state.vms.items())
+            if vm["group"] == group]}))
+
+    def get_arm_vm(self, state, body, group, name):
+        vm = state.vms.get(name)
+        if vm is None or vm["group"] != group:
+            return self._send(404, json.dumps({"error": {
+                "code": "ResourceNotFound", "message": name}}))
+        self._send(200, json.dumps(self._arm_vm(vm)))
+
+    def post_arm_vm_action(self, state, body, group, name, action):
+        if name not in state.vms or action not in _ARM_STATES:
+            return self._send(404, json.dumps({"error": {
+                "code": "ResourceNotFound", "message": name}}))
+        state.vms[name]["status"] = _ARM_STATES[action]
+        self._accepted()
+
+    def delete_arm_vm(self, state, body, group, name):
+        state.vms.pop(name, None)
+        self._accepted()
+
+    def get_arm_operation(self, state, body, request_id):
+        self._send(200, json.dumps({"status": "Succeeded"}))
+
+    def get_arm_storage(self, state, body, group, name):
+        account = state.storage_accounts.get(name)
+        if account is None:
+            return self._send(404, json.dumps({"error": {
+                "code": "ResourceNotFound", "message": name}}))
+        self._send(200, json.dumps({"name": name, "location":
+                                    account["Location"]}))
+
+    def post_arm_storage_keys(self, state, body, group, name):
+        self._send(200, json.dumps({"keys": [
+            {"keyName": "key1", "value": "cHJpbWFyeQ=="},
+            {"keyName": "key2", "value": "c2Vjb25kYXJ5"}]}))
+
+    def get_arm_locations(self, state, body):
+        self._send(200, json.dumps({"value": [{"name": "eastus"},
+                                              {"name": "westus"}]}))
+
+    _HS = r"^/[^/]+/services/hostedservices"
+    _RG = r"^/subscriptions/[^/]+/resourceGroups/([^/]+)/providers"
+    ROUTES = [
+        (_HS + r"$", "get_asm_services"),
+        (_HS + r"/([^/]+)/deploymentslots/production$",
+         "get_asm_deployment"),
+        (_HS + r"/([^/]+)/deployments/([^/]+)/roleinstances/([^/]+)"
+         r"/Operations$", "post_asm_role_operation"),
+        (_HS + r"/([^/]+)/deployments/([^/]+)$", "delete_asm_deployment"),
+        (r"^/[^/]+/operations/([^/]+)$", "get_asm_operation"),
+        (r"^/[^/]+/services/images$", "get_asm_images"),
+        (r"^/[^/]+/services/images/([^/]+)$", "get_asm_image"),
+        (r"^/[^/]+/services/storageservices/([^/]+)$", "get_asm_storage"),
+        (r"^/[^/]+/services/storageservices/([^/]+)/keys$",
+         "get_asm_storage_keys"),
+        (r"^/[^/]+/locations$", "get_asm_locations"),
+        (_RG + r"/Microsoft.Compute/virtualMachines$", "get_arm_vms"),
+        (_RG + r"/Microsoft.Compute/virtualMachines/([^/]+)$",
+         "get_arm_vm"),
+        (_RG + r"/Microsoft.Compute/virtualMachines/([^/]+)/(\w+)$",
+         "post_arm_vm_action"),
+        (_RG + r"/Microsoft.Compute/virtualMachines/([^/]+)$",
+         "delete_arm_vm"),
+        (r"^/operations/([^/]+)$", "get_arm_operation"),
+        (_RG + r"/Microsoft.Storage/storageAccounts/([^/]+)$",
+         "get_arm_storage"),
+        (_RG + r"/Microsoft.Storage/storageAccounts/([^/]+)/listKeys$",
+         "post_arm_storage_keys"),
+        (r"^/subscriptions/[^/]+/locations$", "get_arm_locations"),
+    ]
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, state):
+        BaseHTTPServer.HTTPServer.__init__(self, address, StubHandler)
+        self.state = state
+        self.url = "http://%s:%s" % self.server_address
+
+
+def start_stub(port=0, delay=0):
+    """
+    Start the stub in a background thread.
+
+    :param port: TCP port, 0 to pick a free one
+    :param delay: Time (seconds) added to every response
+    :return: The StubServer object, stop it with shutdown()
+    """
+    server = StubServer(("127.0.0.1", port), StubState(delay))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def benchmark(count=500, delay=0):
+    """
+    Compare pooled and one-shot connections of the REST backends.
+
+    :param count: Number of vm_show calls per run
+    :param delay: Time (seconds) added to every response of the stub
+    :return: A dict of run name and calls per second
+    """
+    from . import azure_rest
+
+    server = start_stub(delay=delay)
+    server.state.add_vm("walabench")
+    results = {}
+    try:
+        for mode in ("asm", "arm"):
+            for pool_size in (azure_rest.DEFAULT_POOL_SIZE, 0):
+                backend = azure_rest.BACKENDS[mode](
+                    "sub", endpoint=server.url, token="stub",
+                    resource_group="walaauto", pool_size=pool_size)
+                start_time = time.time()
+                for _ in range(count):
+                    backend.vm_show("walabench")
+                name = "%s %s" % (mode, pool_size and "pooled" or "one-shot")
+                results[name] = count / (time.time() - start_time)
+                backend.close()
+    finally:
+        server.shutdown()
+    return results
+
+
+if __name__ == '__main__':
+    for run, rate in sorted(benchmark().items()):
+        print "%-14s %8.1f calls/s" % (run, rate)
@@ -0,0 +1,364 @@
+"""
+Tracker of the long-running Azure operations.
+
+VM provisioning, blob copies and the like complete asynchronously.  Rather
+than every pending object polling its own show command, the operations
+register with one tracker.  A background thread polls their status in bulk,
+one list command per group and tick (vm_list per mode, blob_list per
+container), and completes the Operation of every operation found done:
+
+    tracker = azure_tracker.enable(interval=10)
+    copy = tracker.track_blob_copy("dest.vhd", "vhds", connection_string)
+    vm = tracker.track_vm("asm", "walaauto", ["ReadyRole"])
+    copy.add_done_callback(lambda op: logging.info("copied"))
+    vm.result(timeout=600)
+
+The tracker is disabled by default, and Blob.copy polls on its own then.
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import os
+import logging
+import threading
+
+from . import azure_cli_asm
+from . import azure_cli_arm
+from . import utils_misc
+
+
+DEFAULT_INTERVAL = 10
+
+# Status field of the VMs of vm list
+VM_STATUS_KEYS = {"asm": "InstanceStatus", "arm": "powerState"}
+VM_NAME_KEYS = {"asm": "VMName", "arm": "name"}
+
+
+class OperationFailedError(Exception):
+
+    def __init__(self, name, status):
+        Exception.__init__(self, name, status)
+        self.name = name
+        self.status = status
+
+    def __str__(self):
+        return "Operation on %s failed with status %s" % (self.name,
+                                                          self.status)
+
+
+class Operation(object):
+
+    """
+    Pending result of a long-running operation.
+    """
+
+    def __init__(self, name, condition, deadline):
+        """
+        :param name: Name of the resource
+        :param condition: Function of the listed resource (None if it is
+                          not listed) returning True once the operation is
+                          done; it raises OperationFailedError if the
+                          operation failed
+        :param deadline: utils_misc.Deadline of the operation
+        """
+        self.name = name
+        self.condition = condition
+        self.deadline = deadline
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._result = None
+        self._exception = None
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the operation.
+
+        :param timeout: Time (seconds) to wait, forever if None
+        :return: The listed resource once the operation is done
+        :raise: The error of the operation, or DeadlineExceededError if
+                it is still pending after timeout
+        """
+        if not self._event.wait(timeout):
+            raise utils_misc.DeadlineExceededError(self.name, timeout)
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        """
+        Wait for the operation.
+
+        :param timeout: Time (seconds) to wait, forever if None
+        :return: The error of the operation, None if it succeeded
+        :raise DeadlineExceededError: If it is still pending after timeout
+        """
+        if not self._event.wait(timeout):
+            raise utils_misc.DeadlineExceededError(self.name, timeout)
+        return self._exception
+
+    def add_done_callback(self, func):
+        """
+        Call func(operation) once the operation is done, right away if it
+        is done already.  The callbacks run in the tracker thread.
+        """
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(func)
+                return
+        func(self)
+
+    def _complete(self, result=None, exception=None):
+        with self._lock:
+            if self.done():
+                return
+            self._result = result
+            self._exception = exception
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for func in callbacks:
+            try:
+                func(self)
+            except Exception:
+                logging.exception("Callback of the operation on %s failed",
+                                  self.name)
+
+    def check(self, resource):
+        # Complete the operation if the listed resource shows it is done
+        try:
+            if self.condition(resource):
+                self._complete(result=resource)
+            elif self.deadline.expired():
+                self._complete(exception=utils_misc.DeadlineExceededError(
+                    self.deadline.name, self.deadline.timeout))
+        except Exception, e:
+            self._complete(exception=e)
+
+
+class VMGroup(object):
+
+    """
+    VMs of a mode, listed with vm_list.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.key = ("vm", mode)
+
+    def list(self):
+        """
+        :return: A dict of the listed VMs by name
+        """
+        cli = azure_cli_asm if self.mode == "asm" else azure_cli_arm
+        vms = cli.vm_list().stdout
+        name_key = VM_NAME_KEYS[self.mode]
+        return dict((vm.get(name_key), vm) for vm in vms or [])
+
+
+class BlobGroup(object):
+
+    """
+    Blobs of a container, listed with blob_list.
+    """
+
+    def __init__(self, container, connection_string=None, sas=None):
+        self.params = {"container": container,
+                       "connection_string": connection_string, "sas": sas}
+        self.key = ("blob", container, connection_string, sas)
+
+    def list(self, names=()):
+        """
+        :param names: Names of the blobs of interest, the listing is
+                      restricted to their common prefix
+        :return: A dict of the listed blobs by name, with their copy
+                 status
+        """
+        prefix = os.path.commonprefix(list(names))
+        # blob list shows the copy status only with the copy details
+        params = dict(self.params, include="copy")
+        blobs = azure_cli_asm.blob_list(prefix, params).stdout
+        return dict((blob.get("name", blob.get("blob")), blob)
+                    for blob in blobs or [])
+
+
+class OperationTracker(object):
+
+    """
+    Background thread polling the pending operations in bulk.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        """
+        :param interval: Time (seconds) between two polls of a group
+        """
+        self.interval = interval
+        self.polls = 0
+        self._groups = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def track(self, group, name, condition, timeout=None):
+        """
+        Register a pending operation.
+
+        :param group: VMGroup or BlobGroup listing the resource
+        :param name: Name of the resource in the listing
+        :param condition: See Operation
+        :param timeout: Time (seconds) before giving up the operation
+        :return: The Operation object
+        """
+        operation = Operation(name, condition,
+                              utils_misc.Deadline(timeout, name))
+        with self._lock:
+            self._groups.setdefault(group.key, group)
+            self._pending.setdefault(group.key, []).append(operation)
+        self._wakeup.set()
+        return operation
+
+    def track_vm(self, mode, name, states, failed_states=(), timeout=None):
+        """
+        Wait for a VM to reach a status.
+
+        :param mode: "asm" or "arm"
+        :param name: Name of the VM
+        :param states: Statuses completing the operation, e.g. ["ReadyRole"]
+        :param failed_states: Statuses failing the operation
+        :param timeout: Time (seconds) before giving up
+        :return: The Operation object, its result is the listed VM
+        """
+        status_key = VM_STATUS_KEYS[mode]
+
+        def condition(vm):
+            status = (vm or {}).get(status_key)
+            if status in failed_states:
+                raise OperationFailedError(name, status)
+            return status in states
+        return self.track(VMGroup(mode), name, condition, timeout)
+
+    def track_vm_deleted(self, mode, name, timeout=None):
+        """
+        Wait for a VM to disappear from the listing.
+        """
+        return self.track(VMGroup(mode), name, lambda vm: vm is None,
+                          timeout)
+
+    def track_blob_copy(self, name, container, connection_string=None,
+                        sas=None, timeout=None):
+        """
+        Wait for the copy to a blob to end.
+
+        :param name: Name of the destination blob
+        :param container: Container of the destination blob
+        :param connection_string: Connection string of the storage account
+        :param sas: Shared access signature of the container
+        :param timeout: Time (seconds) before giving up
+        :return: The Operation object, its result is the listed blob
+        """
+        group = BlobGroup(container, connection_string, sas)
+
+        def condition(blob):
+            status = (blob or {}).get("copyStatus")
+            if status in ("failed", "aborted"):
+                raise OperationFailedError(name, status)
+            return status == "success"
+        return self.track(group, name, condition, timeout)
+
+    def _poll(self, key):
+        with self._lock:
+            group = self._groups[key]
+            operations = [op for op in self._pending.get(key, [])
+                          if not op.done()]
+        if not operations:
+            return
+        self.polls += 1
+        try:
+            if isinstance(group, BlobGroup):
+                resources = group.list(op.name for op in operations)
+            else:
+                resources = group.list()
+        except Exception, e:
+            logging.warning("Failed to poll %s, retry in %ds: %s",
+                            " ".join(str(k) for k in key if k),
+                            self.interval, e)
+            resources = None
+        for operation in operations:
+            if resources is not None:
+                operation.check(resources.get(operation.name))
+            elif operation.deadline.expired():
+                operation.check(None)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # The operations just started are not done, poll a tick later
+            self._stop.wait(self.interval)
+            while not self._stop.is_set():
+                with self._lock:
+                    keys = list(self._pending)
+                for key in keys:
+                    self._poll(key)
+                with self._lock:
+                    for key in keys:
+                        pending = [op for op in self._pending.get(key, [])
+                                   if not op.done()]
+                        if pending:
+                            self._pending[key] = pending
+                        else:
+                            del self._pending[key]
+                            del self._groups[key]
+                    if not self._pending:
+                        break
+                self._stop.wait(self.interval)
+
+    def stop(self):
+        """
+        Stop polling, the pending operations stay pending.
+        """
+        self._stop.set()
+        self._wakeup.set()
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def enable(interval=DEFAULT_INTERVAL):
+    """
+    Track the long-running operations in a background thread.
+
+    :param interval: Time (seconds) between two polls of a group
+    :return: The OperationTracker object
+    """
+    global _tracker
+    with _tracker_lock:
+        if _tracker is not None:
+            _tracker.stop()
+        _tracker = OperationTracker(interval)
+        return _tracker
+
+
+def disable():
+    """
+    Stop the tracker.
+    """
+    global _tracker
+    with _tracker_lock:
+        if _tracker is not None:
+            _tracker.stop()
+        _tracker = None
+
+
+def get_tracker():
+    """
+    :return: The OperationTracker object, None if disabled
+    """
+    return _tracker
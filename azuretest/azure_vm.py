@@ -12,6 +12,36 @@ from utils_misc import *
 from . import remote
 from . import data_dir
 from . import utils_misc
+from . import azure_tracker
+
+
+class VMDeadError(Exception):
+
+    def __init__(self, name, state):
+        Exception.__init__(self, name, state)
+        self.name = name
+        self.state = state
+
+    def __str__(self):
+        return "VM %s is not alive, its state is %s" % (self.name, self.state)
+
+
+class VMStateError(Exception):
+
+    def __init__(self, name, state, states):
+        Exception.__init__(self, name, state, states)
+        self.name = name
+        self.state = state
+        self.states = states
+
+    def __str__(self):
+        return ("VM %s reached the failed state %s while waiting for %s" %
+                (self.name, self.state, "/".join(str(s) for s in self.states)))
+
+
+# Typical time (seconds) the VMs took to reach states, by mode and states
+_state_times = {}
+
 
 class BaseVM(object):
 
@@ -57,6 +87,24 @@ class BaseVM(object):
     COPY_FILES_TIMEOUT = 600
     RESTART_TIMEOUT = 240
     DELETE_TIMEOUT = 240
+    STATE_WAIT_TIMEOUT = 600
+
+    #
+    # Polling of the VM state in wait_for_state(): the first polls are
+    # spread over the typical time of the wait, then backed off
+    #
+    STATE_TIME = 60
+    MIN_POLL_INTERVAL = 2
+    MAX_POLL_INTERVAL = 30
+
+    #
+    # States of the VM, see get_state()
+    #
+    RUNNING_STATES = []
+    STOPPED_STATES = []
+    DEALLOCATED_STATES = []
+    # Terminal states, e.g. a failed provisioning
+    FAILED_STATES = []
 
     def __init__(self, name, size, params):
         self.name = name
@@ -68,7 +116,106 @@ class BaseVM(object):
     #
     # Public API - could be reimplemented with virt specific code
     #
-    
+
+    def get_state(self, deadline=None):
+        """
+        Get the state of the VM, e.g. ReadyRole.
+
+        :param deadline: utils_misc.Deadline of the calling operation
+        :return: The state, None if the VM does not exist
+        """
+        raise NotImplementedError
+
+    def _vm_state(self, vm):
+        """
+        Get the state of the VM from its properties.
+
+        :param vm: The VM properties given by vm show or vm list, None if
+                   the VM was not found
+        :return: The state, None if the VM does not exist
+        """
+        raise NotImplementedError
+
+    def _state_time(self, states):
+        return _state_times.get((self.mode, tuple(sorted(states))),
+                                self.STATE_TIME)
+
+    def _record_state_time(self, states, duration):
+        # Moving average of the waits for the states
+        key = (self.mode, tuple(sorted(states)))
+        if key in _state_times:
+            duration = 0.7 * _state_times[key] + 0.3 * duration
+        _state_times[key] = duration
+
+    def _track_state(self, states, failed_states, deadline):
+        # Wait on the bulk polling of the operation tracker
+        tracker = azure_tracker.get_tracker()
+
+        def condition(vm):
+            state = self._vm_state(vm)
+            if state in failed_states:
+                raise VMStateError(self.name, state, states)
+            return state in states
+        operation = tracker.track(azure_tracker.VMGroup(self.mode.lower()),
+                                  self.name, condition, deadline.remaining())
+        return self._vm_state(operation.result(deadline.remaining()))
+
+    def wait_for_state(self, states, deadline=None, failed_states=None):
+        """
+        Wait for the VM to reach a state.
+
+        The VM is polled at intervals adapted to the time it typically
+        takes to reach the states: half the time left until then, and an
+        exponential back off once it is overdue.  The typical times are
+        learnt from the previous waits.  The operation tracker polls the
+        VM instead when it is enabled (see azure_tracker).
+
+        :param states: A state, or a list of states, e.g. RUNNING_STATES
+        :param deadline: utils_misc.Deadline of the calling operation, the
+                         wait lasts STATE_WAIT_TIMEOUT at most
+        :param failed_states: Terminal states failing the wait,
+                              FAILED_STATES by default
+        :return: The state reached
+        :raise VMStateError: If the VM reaches a failed state
+        :raise DeadlineExceededError: If the deadline passes first
+        """
+        if isinstance(states, basestring) or states is None:
+            states = [states]
+        if failed_states is None:
+            failed_states = self.FAILED_STATES
+        deadline = utils_misc.Deadline.within(
+            deadline, self.STATE_WAIT_TIMEOUT,
+            "wait for %s to be %s" % (self.name,
+                                      "/".join(str(s) for s in states)))
+        start_time = time.time()
+        if azure_tracker.get_tracker() is not None:
+            state = self._track_state(states, failed_states, deadline)
+            self._record_state_time(states, time.time() - start_time)
+            return state
+        typical = self._state_time(states)
+        backoff = self.MIN_POLL_INTERVAL
+        polls = 0
+        while True:
+            state = self.get_state(deadline=deadline)
+            polls += 1
+            if state in states:
+                # A VM already in the state tells nothing of the wait
+                if polls > 1:
+                    self._record_state_time(states, time.time() - start_time)
+                return state
+            if state in failed_states:
+                raise VMStateError(self.name, state, states)
+            left = typical - (time.time() - start_time)
+            if left > self.MIN_POLL_INTERVAL:
+                interval = max(self.MIN_POLL_INTERVAL, left / 2)
+            else:
+                interval = backoff
+                backoff = min(backoff * 2, self.MAX_POLL_INTERVAL)
+            logging.debug("VM %s is %s, poll again in %.1fs", self.name,
+                          state, interval)
+            deadline.check()
+            deadline.sleep(min(interval, self.MAX_POLL_INTERVAL))
+
     def get_public_address(self):
         """
         Get the public IP address
@@ -93,7 +240,7 @@ class BaseVM(object):
         return self.params
 
     def login(self, timeout=LOGIN_TIMEOUT,
-              username=None, password=None):
+              username=None, password=None, deadline=None):
         """
         Log into the guest via SSH.
         If timeout expires while waiting for output from the guest (e.g. a
@@ -103,8 +250,11 @@ class BaseVM(object):
                 guest.
         :param username:
         :param password:
+        :param deadline: utils_misc.Deadline of the calling operation
         :return: A ShellSession object.
         """
+        if deadline is not None:
+            timeout = deadline.get_timeout(timeout)
         if not username:
             username = self.params.get("username", "")
         if not password:
@@ -125,16 +275,47 @@ class BaseVM(object):
         return session
 
     def remote_login(self, timeout=LOGIN_TIMEOUT,
-                     username=None, password=None):
+                     username=None, password=None, deadline=None):
         """
         Alias for login() for backward compatibility.
         """
-        return self.login(timeout, username, password)
+        return self.login(timeout, username, password, deadline)
+
+    def wait_for_login(self, timeout=LOGIN_WAIT_TIMEOUT,
+                       username=None, password=None, deadline=None):
+        """
+        Make multiple attempts to log into the guest until one succeeds.
+
+        :param timeout: Time (seconds) to keep trying to log in.
+        :param username:
+        :param password:
+        :param deadline: utils_misc.Deadline of the calling operation, no
+                attempt is made once it passed
+        :return: A ShellSession object.
+        """
+        if not username:
+            username = self.params.get("username", "")
+        if not password:
+            password = self.params.get("password", "")
+        prompt = self.params.get("shell_prompt", "[\#\$]")
+        linesep = eval("'%s'" % self.params.get("shell_linesep", r"\n"))
+        client = self.params.get("shell_client", "ssh")
+        log_filename = ("session-%s-%s.log" %
+                        (self.name, utils_misc.generate_random_string(4)))
+        session = remote.wait_for_login(client, self.get_public_address(),
+                                        self.get_ssh_port(), username,
+                                        password, prompt, linesep,
+                                        log_filename, timeout,
+                                        deadline=deadline)
+        session.set_status_test_command(self.params.get("status_test_command",
+                                                        ""))
+        self.session.append(session)
+        return session
 
     def copy_files_to(self, host_path, guest_path, limit="",
                       verbose=False,
                       timeout=COPY_FILES_TIMEOUT,
-                      username=None, password=None):
+                      username=None, password=None, deadline=None):
         """
         Transfer files to the remote host(guest).
 
@@ -144,7 +325,10 @@ class BaseVM(object):
         :param verbose: If True, log some stats using logging.debug (RSS only)
         :param timeout: Time (seconds) before giving up on doing the remote
                 copy.
+        :param deadline: utils_misc.Deadline of the calling operation
         """
+        if deadline is not None:
+            timeout = deadline.get_timeout(timeout)
         logging.info("sending file(s) to '%s'", self.name)
         if not username:
             username = self.params.get("username", "")
@@ -164,7 +348,7 @@ class BaseVM(object):
     def copy_files_from(self, guest_path, host_path, nic_index=0, limit="",
                         verbose=False,
                         timeout=COPY_FILES_TIMEOUT,
-                        username=None, password=None):
+                        username=None, password=None, deadline=None):
         """
         Transfer files from the guest.
 
@@ -174,7 +358,10 @@ class BaseVM(object):
         :param verbose: If True, log some stats using logging.debug (RSS only)
         :param timeout: Time (seconds) before giving up on doing the remote
                 copy.
+        :param deadline: utils_misc.Deadline of the calling operation
         """
+        if deadline is not None:
+            timeout = deadline.get_timeout(timeout)
         logging.info("receiving file(s) to '%s'", self.name)
         if not username:
             username = self.params.get("username", "")
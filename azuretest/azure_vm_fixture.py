@@ -0,0 +1,227 @@
+"""
+VMs shared by the tests of a class.
+
+Avocado runs every test method in its own process, and each of them used
+to get a VM of its own in setUp().  A VMFixture provisions the VM once per
+test class and variant (the VM params), hands it to the tests of the class
+one after the other and tears it down after the last one:
+
+    class LifeCycleTest(Test):
+
+        vm_fixture = azure_vm_fixture.VMFixture(
+            shared=["test_restart_vm", "test_shutdown_vm"])
+
+        def setUp(self):
+            self.vm_test01 = self.vm_fixture.acquire(self, vm_params, "asm")
+
+        def tearDown(self):
+            self.vm_fixture.release(self, self.vm_test01)
+
+The shared tests are the non-destructive ones: they leave the VM usable by
+the next test, which gets it started again.  The other tests of the class
+are destructive (e.g. capture, which deletes the VM).  A destructive test
+takes the VM over once all the shared tests are done with it, and the VM is
+recycled after it.  order() gives the tests in the order they should run,
+the shared ones first; avocado runs them in the order of the source, so the
+destructive tests come last in the class.  A destructive test run before
+the shared ones are done gets a VM of its own.
+
+The VMs are leased with azure_vm_pool.lease(), from the pool when it is
+enabled.  The fixtures are kept in a JSON file under a file lock, shared by
+the test processes of the host, and held by the avocado job process: the
+fixtures of a job which ended before running all the shared tests are
+dropped by the next one.
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import os
+import json
+import time
+import fcntl
+import errno
+import logging
+import tempfile
+import threading
+
+from . import azure_vm_pool
+
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(),
+                            "avocado-azure-vm-fixtures-%d.json" % os.getuid())
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def fixture_key(cls, params, mode):
+    """
+    :param cls: Test class
+    :param params: A dict containing VM params
+    :param mode: "asm" or "arm"
+    :return: The key of the fixture of the class and variant
+    """
+    return "%s.%s|%s" % (cls.__module__, cls.__name__,
+                         azure_vm_pool.pool_key(params, mode))
+
+
+class VMFixture(object):
+
+    """
+    VM of a test class, shared by its non-destructive tests.
+    """
+
+    def __init__(self, shared=(), path=DEFAULT_PATH):
+        """
+        :param shared: Names of the non-destructive test methods
+        :param path: Path of the fixtures file
+        """
+        self.shared = list(shared)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _update(self, func):
+        # Run func(fixtures) -> result on the fixtures of the file, by key
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                content = os.read(fd, os.fstat(fd).st_size)
+                fixtures = {}
+                if content.strip():
+                    fixtures = json.loads(content)
+                result = func(fixtures)
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, json.dumps(fixtures, indent=2, sort_keys=True))
+                return result
+            finally:
+                os.close(fd)
+
+    def order(self, cls):
+        """
+        :param cls: Test class
+        :return: The names of the test methods of cls in the order they
+                 should run, the shared ones first, in the order of the
+                 source otherwise
+        """
+        tests = []
+        for name in dir(cls):
+            method = getattr(cls, name)
+            if not name.startswith("test") or not callable(method):
+                continue
+            code = getattr(getattr(method, "im_func", method), "func_code",
+                           None)
+            line = code.co_firstlineno if code is not None else 0
+            tests.append((name not in self.shared, line, name))
+        return [name for _, _, name in sorted(tests)]
+
+    def acquire(self, test, params, mode):
+        """
+        Get the VM of a test: the VM of the fixture if a previous test left
+        it, else a new one.
+
+        :param test: avocado Test object
+        :param params: A dict containing VM params
+        :param mode: "asm" or "arm"
+        :return: A VMASM or VMARM object of a running VM
+        """
+        method = test._testMethodName
+        key = fixture_key(type(test), params, mode)
+        shared = method in self.shared
+        pending = [name for name in self.order(type(test))
+                   if name in self.shared and name != method]
+
+        def take(fixtures):
+            entry = fixtures.get(key)
+            if entry is None:
+                return None
+            if not _pid_alive(entry["holder"]):
+                logging.info("Drop the VM %s of the fixture %s, its job "
+                             "is over", entry["vm"], key)
+                del fixtures[key]
+                return None
+            if entry["user"] and _pid_alive(entry["user"]):
+                logging.warning("VM %s of the fixture %s is in use by %s",
+                                entry["vm"], key, entry["user"])
+                return None
+            if not shared and set(pending) - set(entry["done"]):
+                logging.warning("Destructive test %s runs before the "
+                                "shared tests of the fixture %s", method, key)
+                return None
+            entry["user"] = os.getpid()
+            if not shared:
+                del fixtures[key]
+            return dict(entry)
+
+        entry = self._update(take)
+        if entry is not None:
+            vm_params = dict(entry["params"], password=params.get("password"))
+            vm = azure_vm_pool.make_vm(mode, vm_params)
+            vm.pool_key = entry["pool_key"]
+            logging.info("Reuse the VM %s of the fixture %s", vm.name, key)
+            # The previous test may have shut it down
+            if vm.is_running() or not vm.start():
+                if shared:
+                    vm.fixture_key = key
+                return vm
+            logging.warning("Failed to start the VM %s of the fixture %s, "
+                            "drop it", vm.name, key)
+            self._update(lambda fixtures: fixtures.pop(key, None))
+            azure_vm_pool.release(vm, recycle=True)
+
+        # The VM outlives the test process, the job process holds it
+        holder = os.getppid() if shared else None
+        vm = azure_vm_pool.lease(params, mode, holder)
+        if shared and len(self.order(type(test))) > 1:
+            stored = dict((k, v) for k, v in vm.params.items()
+                          if k != "password")
+
+            def record(fixtures):
+                fixtures[key] = {"vm": vm.name, "params": stored,
+                                 "pool_key": getattr(vm, "pool_key", None),
+                                 "holder": holder, "user": os.getpid(),
+                                 "done": [], "since": time.time()}
+            self._update(record)
+            vm.fixture_key = key
+        return vm
+
+    def release(self, test, vm):
+        """
+        Give the VM of a test back to the fixture, or tear it down after
+        the last shared test or a destructive one.
+
+        :param test: avocado Test object
+        :param vm: VMASM or VMARM object returned by acquire()
+        """
+        method = test._testMethodName
+        key = getattr(vm, "fixture_key", None)
+        shared = method in self.shared
+        pending = [name for name in self.order(type(test))
+                   if name in self.shared]
+
+        def give_back(fixtures):
+            entry = fixtures.get(key)
+            if entry is None or entry["vm"] != vm.name:
+                return False
+            entry["done"].append(method)
+            entry["user"] = None
+            if set(pending) - set(entry["done"]):
+                return True
+            # No shared test left, no destructive test either if the
+            # shared ones are the whole class
+            if len(pending) == len(self.order(type(test))):
+                del fixtures[key]
+                return False
+            return True
+
+        if shared and key is not None and self._update(give_back):
+            logging.info("Keep the VM %s for the next tests of the fixture "
+                         "%s", vm.name, key)
+            return
+        azure_vm_pool.release(vm, recycle=not shared)
@@ -0,0 +1,178 @@
+"""
+Look-ahead provisioning of the VMs of the next tests.
+
+A test creates or leases its VM in setUp(), and no VM is being provisioned
+while it runs, so the next test starts from zero.  The look-ahead knows the
+queue of the tests of the job and their VM params, and has the VM pool (see
+azure_vm_pool) create the VMs of the next tests while the current one runs.
+
+The queue is written up front by azure_vm_matrix (--queue), in the order
+avocado runs the tests: every test method of the class, the destructive
+ones last (see azure_vm_fixture), each with all the variants of the mux
+files.  The tests call advance() in setUp():
+
+    azure_vm_lookahead.advance(self, self.vm_params, "asm", depth=1)
+
+advance() marks the test started in the queue and starts, in background
+processes, the creation of the VMs of the next depth tests which will get
+no VM from the pool or from a fixture.  It does nothing without a queue or
+with the pool disabled.
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import os
+import json
+import fcntl
+import logging
+import tempfile
+import threading
+
+from . import azure_vm_pool
+
+
+DEFAULT_DEPTH = 1
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(),
+                            "avocado-azure-vm-queue-%d.json" % os.getuid())
+
+# States of the tests in the queue
+PENDING = "pending"
+STARTED = "started"
+
+
+def test_name(cls, method):
+    """
+    :param cls: Test class
+    :param method: Name of the test method
+    :return: The name of the test in the queue
+    """
+    return "%s.%s" % (cls.__name__, method)
+
+
+def build_queue(module, variants):
+    """
+    List the tests of a test module in the order avocado runs them.
+
+    :param module: Test module, defining collect_vm_params() and test
+                   classes sharing their VM with a VMFixture
+    :param variants: List of the params of the variants
+    :return: A list of the tests, each of them a dict with its name and
+             the VM params (without the password) and azure mode of its
+             variant
+    """
+    classes = [value for value in vars(module).values()
+               if isinstance(value, type) and hasattr(value, "vm_fixture")]
+    queue = []
+    for cls in sorted(classes, key=lambda cls: cls.__name__):
+        for method in cls.vm_fixture.order(cls):
+            for params in variants:
+                vm_params, mode = module.collect_vm_params(params)
+                vm_params = dict((k, v) for k, v in vm_params.items()
+                                 if k != "password")
+                queue.append({"test": test_name(cls, method),
+                              "key": azure_vm_pool.pool_key(vm_params, mode),
+                              "params": vm_params, "mode": mode,
+                              "state": PENDING, "provisioning": False})
+    return queue
+
+
+class TestQueue(object):
+
+    """
+    Queue of the tests of a job, stored in a file.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        """
+        :param path: Path of the queue file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _update(self, func):
+        # Run func(queue) -> result on the tests of the queue file
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                content = os.read(fd, os.fstat(fd).st_size)
+                queue = []
+                if content.strip():
+                    queue = json.loads(content)
+                result = func(queue)
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, json.dumps(queue, indent=2, sort_keys=True))
+                return result
+            finally:
+                os.close(fd)
+
+    def write(self, queue):
+        """
+        Replace the tests of the queue.
+
+        :param queue: List of the tests, see build_queue()
+        """
+        def replace(old):
+            old[:] = queue
+        self._update(replace)
+
+    def advance(self, name, key, pool, depth=DEFAULT_DEPTH):
+        """
+        Mark a test started, and pick the next tests needing a new VM.
+
+        :param name: Name of the test, see test_name()
+        :param key: Pool key of the VM of the test
+        :param pool: VMPool object
+        :param depth: Number of tests to look ahead
+        :return: A list of the next tests to create a VM for
+        """
+        def pick(queue):
+            for index, test in enumerate(queue):
+                if test["state"] == PENDING and test["test"] == name and \
+                   test["key"] == key:
+                    break
+            else:
+                return []
+            # The tests before it were skipped
+            for test in queue[:index + 1]:
+                test["state"] = STARTED
+            picked = []
+            keys = set()
+            for test in queue[index + 1:index + 1 + depth]:
+                if test["provisioning"] or test["key"] in keys:
+                    continue
+                keys.add(test["key"])
+                if pool.covered(test["key"]):
+                    continue
+                test["provisioning"] = True
+                picked.append(dict(test))
+            return picked
+        return self._update(pick)
+
+
+def advance(test, params, mode, depth=DEFAULT_DEPTH, path=DEFAULT_PATH):
+    """
+    Mark a test started in the queue of the job, and start the creation of
+    the VMs of the next tests in the VM pool.
+
+    :param test: avocado Test object
+    :param params: A dict containing the VM params of the test
+    :param mode: "asm" or "arm"
+    :param depth: Number of tests to look ahead
+    :param path: Path of the queue file
+    :return: A list of the next tests a VM is created for
+    """
+    pool = azure_vm_pool.get_pool()
+    if pool is None or not depth or not os.path.exists(path):
+        return []
+    name = test_name(type(test), test._testMethodName)
+    picked = TestQueue(path).advance(name,
+                                     azure_vm_pool.pool_key(params, mode),
+                                     pool, depth)
+    for next_test in picked:
+        logging.info("Create the VM of the next test %s in the background",
+                     next_test["test"])
+        vm_params = dict(next_test["params"], password=params.get("password"))
+        pool.provision_in_background(vm_params, next_test["mode"])
+    return picked
@@ -0,0 +1,259 @@
+"""
+Provisioning of the VMs of all the variants of a test at once.
+
+Every mux variant of a test (e.g. the four VM sizes of cfg/life_cycle.yaml)
+creates its VM in its own setUp(), so the VMs are provisioned one after
+another.  The matrix provisioner resolves the variants of the mux files up
+front and creates the VM of every variant concurrently in the VM pool (see
+azure_vm_pool), before the tests run:
+
+    python -m azuretest.azure_vm_matrix life_cycle.py cfg/life_cycle.yaml
+    avocado run life_cycle.py --multiplex cfg/life_cycle.yaml
+
+The test module gives the VM params of a variant with its
+collect_vm_params() function.  The tests lease their VMs from the pool
+(VMPool/size above 0), so each variant gets a ready VM and the setup takes
+as long as the slowest VM instead of the sum of all.
+
+With --queue, only the VMs of the first tests are created, and the queue
+of the tests of the job is written for azure_vm_lookahead, which creates
+the VMs of the next tests while the tests run.
+
+The creations run with a bounded concurrency and within a core quota (the
+cores of the VMs being created), and the cli commands are paced by the
+rate limiter when it is enabled (see azure_cli_limiter).
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import os
+import sys
+import imp
+import fnmatch
+import logging
+import argparse
+import threading
+
+from avocado.core import tree
+from avocado.core import multiplexer
+
+from . import azure_cli_batch
+from . import azure_cli_common
+from . import azure_cli_limiter
+from . import azure_vm_pool
+from . import azure_vm_lookahead
+
+
+DEFAULT_PARALLEL = 8
+# Default regional core quota of a subscription
+DEFAULT_CORE_QUOTA = 20
+
+# Cores of the VM sizes
+CORES = {"ExtraSmall": 1, "Small": 1, "Medium": 2, "Large": 4,
+         "ExtraLarge": 8, "A5": 2, "A6": 4, "A7": 8,
+         "Standard_A0": 1, "Standard_A1": 1, "Standard_A2": 2,
+         "Standard_A3": 4, "Standard_A4": 8, "Standard_A5": 2,
+         "Standard_A6": 4, "Standard_A7": 8,
+         "Standard_D1": 1, "Standard_D2": 2, "Standard_D3": 4,
+         "Standard_D4": 8, "Standard_D11": 2, "Standard_D12": 4,
+         "Standard_D13": 8, "Standard_D14": 16}
+
+
+def vm_cores(size):
+    """
+    :param size: VM size
+    :return: The number of cores of the size, 1 if unknown
+    """
+    return CORES.get(size, 1)
+
+
+class VariantParams(object):
+
+    """
+    Params of a mux variant, looked up like the avocado params of a test.
+    """
+
+    def __init__(self, leaves):
+        """
+        :param leaves: Leaf tree nodes of the variant
+        """
+        self.leaves = leaves
+
+    def get(self, key, path=None, default=None):
+        """
+        :param key: Name of the param
+        :param path: Pattern of the path of the node, e.g. '*/VMUser/*'
+        :param default: Value if no node matches
+        :return: The value of the first node of path having the param
+        """
+        for leaf in self.leaves:
+            if path is not None and \
+               not fnmatch.fnmatch(leaf.path + "/", path):
+                continue
+            environment = leaf.environment
+            if key in environment:
+                return environment[key]
+        return default
+
+    def __str__(self):
+        return ";".join(leaf.path for leaf in self.leaves)
+
+
+def variants(paths):
+    """
+    Resolve the variants of mux files.
+
+    :param paths: Paths of the mux files
+    :return: A list of VariantParams objects
+    """
+    root = tree.create_from_yaml(paths)
+    return [VariantParams(leaves) for leaves in multiplexer.MuxTree(root)]
+
+
+class CoreQuota(object):
+
+    """
+    Cores of the VMs being created, within a quota.
+    """
+
+    def __init__(self, cores=DEFAULT_CORE_QUOTA):
+        self.cores = cores
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, cores):
+        """
+        Wait for the quota to have room for cores.  A VM larger than the
+        whole quota waits for all the others and is created alone.
+        """
+        with self._cond:
+            while self.used and self.used + cores > self.cores:
+                self._cond.wait()
+            self.used += cores
+
+    def release(self, cores):
+        with self._cond:
+            self.used -= cores
+            self._cond.notify_all()
+
+
+class MatrixProvisioner(object):
+
+    """
+    Create the VMs of the variants in the VM pool concurrently.
+    """
+
+    def __init__(self, pool, max_parallel=DEFAULT_PARALLEL,
+                 core_quota=DEFAULT_CORE_QUOTA):
+        """
+        :param pool: VMPool object
+        :param max_parallel: Max number of VMs created at the same time
+        :param core_quota: Max number of cores of the VMs created at the
+                           same time
+        """
+        self.pool = pool
+        self.max_parallel = max_parallel
+        self.quota = CoreQuota(core_quota)
+
+    def _provision(self, params, mode):
+        cores = vm_cores(params.get("VMSize"))
+        self.quota.acquire(cores)
+        try:
+            return self.pool.provision(params, mode)
+        finally:
+            self.quota.release(cores)
+
+    def provision(self, variants, collect):
+        """
+        Create a VM for each variant without a ready VM in the pool.  The
+        variants with the same VM params share the VM.
+
+        :param variants: List of the params of the variants
+        :param collect: Function of the params of a variant returning a
+                        tuple of its VM params and azure mode, e.g. the
+                        collect_vm_params() of the test module
+        :return: A dict of the name of the created VM, or the error, by
+                 pool key
+        """
+        todo = {}
+        for params in variants:
+            vm_params, mode = collect(params)
+            key = azure_vm_pool.pool_key(vm_params, mode)
+            if key not in todo and not self.pool.ready(key):
+                todo[key] = (vm_params, mode)
+        modes = set(mode for _, mode in todo.values())
+        if len(modes) > 1:
+            # Each mode in its own cli config
+            azure_cli_common.enable_profiles()
+        for mode in modes:
+            azure_cli_common.set_config_mode(mode)
+        keys = sorted(todo)
+        logging.info("Create %d VMs for %d variants", len(keys),
+                     len(variants))
+        results = azure_cli_batch.run_batch(
+            [(self._provision, todo[key]) for key in keys],
+            max_workers=self.max_parallel, initial_workers=self.max_parallel)
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                logging.error("Failed to provision the pool %s: %s", key,
+                              result)
+            else:
+                logging.info("VM %s ready in the pool %s", result, key)
+        return dict(zip(keys, results))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Create the VMs of all the variants of a test in the "
+                    "VM pool")
+    parser.add_argument("test", help="Test module defining "
+                        "collect_vm_params()")
+    parser.add_argument("mux_files", nargs="+", metavar="yaml",
+                        help="Mux files of the test")
+    parser.add_argument("--parallel", type=int, default=DEFAULT_PARALLEL,
+                        help="Max number of VMs created at the same time")
+    parser.add_argument("--cores", type=int, default=DEFAULT_CORE_QUOTA,
+                        help="Core quota of the VMs created at the same "
+                             "time")
+    parser.add_argument("--rate", type=float,
+                        help="Max rate (commands/s) of the cli commands")
+    parser.add_argument("--pool", default=azure_vm_pool.DEFAULT_PATH,
+                        help="Registry file of the VM pool")
+    parser.add_argument("--queue", action="store_true",
+                        help="Write the queue of the tests and create the "
+                             "VMs of the first tests only")
+    parser.add_argument("--depth", type=int,
+                        default=azure_vm_lookahead.DEFAULT_DEPTH,
+                        help="Number of tests whose VM is created ahead")
+    parser.add_argument("--queue-file",
+                        default=azure_vm_lookahead.DEFAULT_PATH,
+                        help="Queue file of azure_vm_lookahead")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    name = os.path.splitext(os.path.basename(args.test))[0]
+    module = imp.load_source(name, args.test)
+    params = variants(args.mux_files)
+    if not params:
+        return 0
+    if args.rate:
+        azure_cli_limiter.enable(rate=args.rate)
+    azure_cli_common.ensure_login(
+        username=params[0].get('username', '*/AzureSub/*'),
+        password=params[0].get('password', '*/AzureSub/*'))
+    if args.queue:
+        queue = azure_vm_lookahead.build_queue(module, params)
+        azure_vm_lookahead.TestQueue(args.queue_file).write(queue)
+        logging.info("Wrote the queue of %d tests", len(queue))
+        # The first test method runs with every variant in turn
+        params = params[:args.depth + 1]
+    provisioner = MatrixProvisioner(azure_vm_pool.VMPool(path=args.pool),
+                                    args.parallel, args.cores)
+    results = provisioner.provision(params, module.collect_vm_params)
+    if any(isinstance(result, Exception) for result in results.values()):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
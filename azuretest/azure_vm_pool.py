@@ -0,0 +1,578 @@
+"""
+Pool of pre-provisioned VMs leased to the tests.
+
+Creating and starting a VM in every test setUp() costs minutes for a few
+seconds of test.  The pool keeps running VMs per (mode, image, size,
+location, user) and leases them to the tests as VMASM or VMARM objects:
+
+    vm = azure_vm_pool.lease(vm_params, "asm")
+    ...
+    azure_vm_pool.release(vm)
+
+The registry of the pool is a JSON file under a file lock, shared by the
+test processes of the host.  A released VM is started again if needed and
+returned to the pool; a VM released with recycle=True (e.g. after a
+destructive test) is deleted and replaced.  A maintainer process, started
+detached from the test process, resets and recycles the released VMs and
+provisions new ones up to the pool size, so the test process never waits
+for them.  It runs the cli in profiles of its own (see
+azure_cli_common.enable_profiles()), so it never switches the config mode
+of the test processes.  The VMs of the test processes which died holding them are
+recycled.
+
+The password of the VMs is not written to the registry, it is given to the
+maintainer in its environment.  The pool is disabled by default:
+
+    azure_vm_pool.enable(size=2)
+
+The idle VMs outlive the job, so that the next job leases them, and keep
+billing until they are deleted.  Drain the pools once the jobs are over, it
+waits for the maintainers and the VMs being provisioned, and deletes all the
+VMs no live process holds:
+
+    python -m azuretest.azure_vm_pool --drain
+
+:copyright: 2016 Red Hat Inc.
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import errno
+import string
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+
+from . import azure_asm_vm
+from . import azure_arm_vm
+from . import azure_vm
+from . import azure_cli_common
+from . import utils_misc
+
+
+DEFAULT_SIZE = 2
+DRAIN_TIMEOUT = 1800
+DRAIN_POLL_INTERVAL = 10
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(),
+                            "avocado-azure-vm-pool-%d.json" % os.getuid())
+
+# Params of the VMs of one pool
+KEY_PARAMS = ["Image", "VMSize", "Location", "username"]
+
+# States of the VMs in the registry
+PROVISIONING = "provisioning"
+IDLE = "idle"
+LEASED = "leased"
+RETURNED = "returned"
+DIRTY = "dirty"
+
+_PASSWORD_ENV = "AZURE_VM_POOL_PASSWORD"
+
+
+class VMPoolError(Exception):
+
+    def __init__(self, msg, key):
+        Exception.__init__(self, msg, key)
+        self.msg = msg
+        self.key = key
+
+    def __str__(self):
+        return "%s (pool %s)" % (self.msg, self.key)
+
+
+def pool_key(params, mode):
+    """
+    :param params: A dict containing VM params
+    :param mode: "asm" or "arm"
+    :return: The key of the pool of the VMs created with params
+    """
+    return "|".join([mode] + [str(params.get(name, ""))
+                              for name in KEY_PARAMS])
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def make_vm(mode, params):
+    """
+    :param mode: "asm" or "arm"
+    :param params: A dict containing VM params
+    :return: A VMASM or VMARM object
+    """
+    if mode == "asm":
+        return azure_asm_vm.VMASM(params["VMName"], params["VMSize"], params)
+    return azure_arm_vm.VMARM(params["VMName"], params["VMSize"], params)
+
+
+def create_vm(vm):
+    """
+    Create a VM and wait for it to run.
+
+    :param vm: A VMASM or VMARM object
+    :return: True if the VM failed to start
+    """
+    if vm.vm_create() or vm.start():
+        return True
+    try:
+        vm.wait_for_state(vm.RUNNING_STATES)
+    except (azure_vm.VMStateError, utils_misc.DeadlineExceededError), e:
+        logging.error("VM %s failed to start: %s", vm.name, e)
+        return True
+    return False
+
+
+class VMPool(object):
+
+    """
+    VMs of the pools and their leases, stored in a registry file.
+    """
+
+    def __init__(self, size=DEFAULT_SIZE, path=DEFAULT_PATH):
+        """
+        :param size: Number of idle VMs kept per pool
+        :param path: Path of the registry file
+        """
+        self.size = size
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _update(self, func):
+        # Run func(vms) -> result on the VMs of the registry, by name
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                content = os.read(fd, os.fstat(fd).st_size)
+                vms = {}
+                if content.strip():
+                    vms = json.loads(content)
+                self._reclaim(vms)
+                result = func(vms)
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, json.dumps(vms, indent=2, sort_keys=True))
+                return result
+            finally:
+                os.close(fd)
+
+    @staticmethod
+    def _reclaim(vms):
+        # The VMs of the dead processes are in an unknown state
+        for name, entry in vms.items():
+            if entry["state"] in (LEASED, PROVISIONING) and \
+               not _pid_alive(entry["pid"]):
+                logging.warning("Process %s died holding the VM %s, "
+                                "recycle it", entry["pid"], name)
+                entry["state"] = DIRTY
+
+    def _set_state(self, name, state):
+        def update(vms):
+            if name in vms:
+                vms[name].update(state=state, pid=os.getpid(),
+                                 since=time.time())
+        self._update(update)
+
+    @staticmethod
+    def _new_entry(vms, key, params, state, pid=None):
+        name = "%s-%s" % (params["VMName"],
+                          utils_misc.generate_random_string(
+                              6, ignore_str=string.punctuation +
+                              string.uppercase))
+        stored = dict((k, v) for k, v in params.items() if k != "password")
+        stored["VMName"] = name
+        stored["DNSName"] = name
+        vms[name] = {"key": key, "state": state, "pid": pid or os.getpid(),
+                     "since": time.time(), "params": stored}
+        return name
+
+    def lease(self, params, mode, holder=None):
+        """
+        Lease a running VM, created if the pool has no idle one.
+
+        :param params: A dict containing VM params; its VMName is the
+                       prefix of the names of the pool VMs
+        :param mode: "asm" or "arm"
+        :param holder: Pid of the process holding the lease, the VM is
+                       recycled once it is dead; the current process if None
+        :return: A VMASM or VMARM object
+        :raise VMPoolError: If a VM has to be created and fails to start
+        """
+        key = pool_key(params, mode)
+
+        def take(vms):
+            for name, entry in sorted(vms.items()):
+                if entry["key"] == key and entry["state"] == IDLE:
+                    entry.update(state=LEASED, pid=holder or os.getpid(),
+                                 since=time.time())
+                    return name, False, dict(entry["params"])
+            name = self._new_entry(vms, key, params, LEASED, holder)
+            return name, True, dict(vms[name]["params"])
+
+        name, create, vm_params = self._update(take)
+        vm_params["password"] = params.get("password")
+        vm = make_vm(mode, vm_params)
+        vm.pool_key = key
+        failed = False
+        if create:
+            logging.info("No idle VM in the pool %s, create %s", key, name)
+            failed = create_vm(vm)
+            if failed:
+                self._set_state(name, DIRTY)
+        else:
+            logging.info("Leased the VM %s of the pool %s", name, key)
+        self.maintain_in_background(key, mode, params.get("password"))
+        if failed:
+            raise VMPoolError("Failed to create the VM %s" % name, key)
+        return vm
+
+    def ready(self, key):
+        """
+        :param key: Key of a pool
+        :return: The number of idle VMs of the pool, and of the VMs being
+                 provisioned
+        """
+        return self._update(lambda vms: len(
+            [entry for entry in vms.values()
+             if entry["key"] == key and
+             entry["state"] in (IDLE, PROVISIONING)]))
+
+    def covered(self, key):
+        """
+        :param key: Key of a pool
+        :return: True if the pool has an idle VM, a VM being provisioned,
+                 or a VM held by another live process (e.g. the VM of a
+                 fixture, see azure_vm_fixture)
+        """
+        def find(vms):
+            for entry in vms.values():
+                if entry["key"] != key:
+                    continue
+                if entry["state"] in (IDLE, PROVISIONING):
+                    return True
+                if entry["state"] == LEASED and \
+                   entry["pid"] != os.getpid():
+                    return True
+            return False
+        return self._update(find)
+
+    def provision(self, params, mode):
+        """
+        Create a VM in the pool, idle once it runs.
+
+        :param params: A dict containing VM params, see lease()
+        :param mode: "asm" or "arm"
+        :return: The name of the VM
+        :raise VMPoolError: If the VM fails to start
+        """
+        key = pool_key(params, mode)
+
+        def add(vms):
+            name = self._new_entry(vms, key, params, PROVISIONING)
+            return name, dict(vms[name]["params"])
+
+        name, vm_params = self._update(add)
+        vm_params["password"] = params.get("password")
+        vm = make_vm(mode, vm_params)
+        logging.info("Create the VM %s in the pool %s", name, key)
+        failed = create_vm(vm)
+        if failed:
+            self._set_state(name, DIRTY)
+            raise VMPoolError("Failed to create the VM %s" % name, key)
+        self._set_state(name, IDLE)
+        return name
+
+    def release(self, vm, recycle=False):
+        """
+        Return a leased VM to the pool.
+
+        :param vm: VMASM or VMARM object returned by lease()
+        :param recycle: If True, the VM is deleted and replaced
+        """
+        state = DIRTY if recycle else RETURNED
+
+        def give_back(vms):
+            entry = vms.get(vm.name)
+            if entry is not None:
+                entry.update(state=state, pid=os.getpid(),
+                             since=time.time())
+            return entry
+
+        entry = self._update(give_back)
+        if entry is None:
+            logging.warning("VM %s is not in the pool", vm.name)
+            return
+        logging.info("Released the VM %s to the pool %s", vm.name,
+                     entry["key"])
+        mode = entry["key"].split("|", 1)[0]
+        self.maintain_in_background(entry["key"], mode,
+                                    vm.params.get("password"))
+
+    def _spawn(self, code, password=None):
+        # Run code in a detached python process, the VMs outlive the test
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(p for p in sys.path if p)
+        env[_PASSWORD_ENV] = password or ""
+        # The cli runs in profiles of the process, a config mode switch
+        # of the shared cli config would change the mode of the tests
+        code = ("import os, logging\n"
+                "logging.basicConfig(level=logging.INFO)\n"
+                "from azuretest import azure_cli_common, azure_vm_pool\n"
+                "azure_cli_common.enable_profiles()\n"
+                "pool = azure_vm_pool.VMPool(%d, %r)\n" %
+                (self.size, self.path)) + code
+        with open(os.devnull) as devnull:
+            with open("%s.log" % self.path, "a") as log_file:
+                subprocess.Popen([sys.executable, "-c", code], env=env,
+                                 stdin=devnull, stdout=log_file,
+                                 stderr=subprocess.STDOUT, close_fds=True,
+                                 preexec_fn=os.setsid)
+
+    def maintain_in_background(self, key, mode, password=None):
+        """
+        Start a detached process running maintain() for a pool.
+        """
+        self._spawn("pool.maintain(%r, %r)\n" % (key, mode), password)
+
+    def provision_in_background(self, params, mode):
+        """
+        Start a detached process running provision() for a VM.
+
+        :param params: A dict containing VM params, see lease()
+        :param mode: "asm" or "arm"
+        """
+        stored = dict((k, v) for k, v in params.items() if k != "password")
+        # The mode of the next test, not the one of the current test
+        code = ("params = dict(%r, password=os.environ[%r])\n"
+                "azure_cli_common.set_config_mode(%r)\n"
+                "pool.provision(params, %r)\n" %
+                (stored, _PASSWORD_ENV, mode, mode))
+        self._spawn(code, params.get("password"))
+
+    def _next_task(self, key):
+        # Pick the next VM of the pool to reset, recycle or create
+        def pick(vms):
+            entries = [(name, entry) for name, entry in sorted(vms.items())
+                       if entry["key"] == key]
+            for state in (RETURNED, DIRTY):
+                for name, entry in entries:
+                    if entry["state"] == state:
+                        entry.update(state=PROVISIONING, pid=os.getpid(),
+                                     since=time.time())
+                        return state, name, dict(entry["params"])
+            ready = [name for name, entry in entries
+                     if entry["state"] in (IDLE, PROVISIONING)]
+            if len(ready) < self.size and entries:
+                params = dict(entries[0][1]["params"])
+                params["VMName"] = params["VMName"].rsplit("-", 1)[0]
+                name = self._new_entry(vms, key, params, PROVISIONING)
+                return None, name, dict(vms[name]["params"])
+            return None
+        return self._update(pick)
+
+    def _maintain_lock(self, key, blocking=True):
+        # Lock of the maintainer of a pool, None if another process has it
+        lock_file = open("%s.%s.lock" % (self.path, key.replace("/", "_")),
+                         "w")
+        try:
+            fcntl.flock(lock_file,
+                        fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except IOError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def maintain(self, key, mode):
+        """
+        Reset the returned VMs, recycle the dirty ones and create VMs until
+        the pool has its size.  Only one process maintains a pool at once.
+
+        :param key: Key of the pool
+        :param mode: "asm" or "arm"
+        """
+        lock_file = self._maintain_lock(key, blocking=False)
+        if lock_file is None:
+            return
+        azure_cli_common.set_config_mode(mode)
+        password = os.environ.get(_PASSWORD_ENV)
+        failures = 0
+        while failures < 3:
+            task = self._next_task(key)
+            if task is None:
+                break
+            state, name, params = task
+            params["password"] = password
+            vm = make_vm(mode, params)
+            if state == DIRTY:
+                logging.info("Recycle the VM %s", name)
+                vm.delete()
+                self._update(lambda vms: vms.pop(name, None))
+                continue
+            if state == RETURNED and not vm.exists():
+                logging.info("VM %s is gone, drop it", name)
+                self._update(lambda vms: vms.pop(name, None))
+                continue
+            if state is None:
+                logging.info("Create the VM %s", name)
+                failed = vm.vm_create() or vm.start()
+            else:
+                logging.info("Reset the VM %s", name)
+                failed = vm.start()
+            if not failed:
+                try:
+                    vm.wait_for_state(vm.RUNNING_STATES)
+                except (azure_vm.VMStateError,
+                        utils_misc.DeadlineExceededError), e:
+                    logging.error("VM %s failed to start: %s", name, e)
+                    failed = True
+            if failed:
+                failures += 1
+                self._set_state(name, DIRTY)
+            else:
+                self._set_state(name, IDLE)
+        lock_file.close()
+
+    def drain(self, password=None, timeout=DRAIN_TIMEOUT):
+        """
+        Delete the VMs of all the pools no live process holds, e.g. once
+        the jobs are over.  The VMs being provisioned are deleted once
+        idle.
+
+        :param password: Password of the VMs
+        :param timeout: Time to wait for the VMs being provisioned
+        :return: The number of deleted VMs
+        """
+        def take(vms):
+            # The VMs held by the dead processes are dirty by now
+            done = [(name, entry) for name, entry in vms.items()
+                    if entry["state"] in (IDLE, RETURNED, DIRTY)]
+            for name, entry in done:
+                entry.update(state=PROVISIONING, pid=os.getpid(),
+                             since=time.time())
+            busy = [name for name, entry in vms.items()
+                    if entry["pid"] != os.getpid()]
+            return [(name, entry["key"].split("|", 1)[0],
+                     dict(entry["params"])) for name, entry in done], busy
+
+        # Wait for the running maintainers, and keep new ones from
+        # replacing the deleted VMs
+        keys = self._update(lambda vms: set(entry["key"]
+                                            for entry in vms.values()))
+        locks = [self._maintain_lock(key) for key in sorted(keys)]
+        deleted = 0
+        end_time = time.time() + timeout
+        while True:
+            done, busy = self._update(take)
+            for name, mode, params in done:
+                params["password"] = password
+                azure_cli_common.set_config_mode(mode)
+                logging.info("Delete the VM %s", name)
+                make_vm(mode, params).delete()
+                self._update(lambda vms: vms.pop(name, None))
+                deleted += 1
+            if not busy or time.time() > end_time:
+                break
+            if not done:
+                logging.info("Wait for the VMs %s", ", ".join(sorted(busy)))
+                time.sleep(DRAIN_POLL_INTERVAL)
+        for lock_file in locks:
+            lock_file.close()
+        if busy:
+            logging.warning("VMs still held after %ss: %s", timeout,
+                            ", ".join(sorted(busy)))
+        return deleted
+
+
+_pool = None
+
+
+def enable(size=DEFAULT_SIZE, path=DEFAULT_PATH):
+    """
+    Lease the VMs of the tests from a pool.
+
+    :param size: Number of idle VMs kept per pool
+    :param path: Path of the registry file
+    :return: The VMPool object
+    """
+    global _pool
+    _pool = VMPool(size, path)
+    return _pool
+
+
+def disable():
+    """
+    Create the VMs in the tests again.
+    """
+    global _pool
+    _pool = None
+
+
+def get_pool():
+    """
+    :return: The VMPool object, None if disabled
+    """
+    return _pool
+
+
+def lease(params, mode, holder=None):
+    """
+    Lease a VM from the pool, or create it if the pool is disabled.
+
+    :param params: A dict containing VM params
+    :param mode: "asm" or "arm"
+    :param holder: Pid of the process holding the lease, see VMPool.lease()
+    :return: A VMASM or VMARM object of a running VM
+    :raise VMPoolError: If a VM has to be created and fails to start
+    """
+    if _pool is not None:
+        return _pool.lease(params, mode, holder)
+    vm = make_vm(mode, params)
+    if create_vm(vm):
+        raise VMPoolError("Failed to create the VM %s" % vm.name,
+                          pool_key(params, mode))
+    return vm
+
+
+def release(vm, recycle=False):
+    """
+    Return a VM to the pool, nothing if the pool is disabled.
+
+    :param vm: VMASM or VMARM object returned by lease()
+    :param recycle: If True, the VM is deleted and replaced
+    """
+    if _pool is not None and getattr(vm, "pool_key", None) is not None:
+        _pool.release(vm, recycle)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the VM pool")
+    parser.add_argument("--drain", action="store_true",
+                        help="Delete the VMs of all the pools no live "
+                             "process holds")
+    parser.add_argument("--pool", default=DEFAULT_PATH,
+                        help="Registry file of the VM pool")
+    parser.add_argument("--timeout", type=int, default=DRAIN_TIMEOUT,
+                        help="Time to wait for the VMs being provisioned")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if not args.drain:
+        parser.error("Nothing to do, see --drain")
+    if not os.path.exists(args.pool):
+        return 0
+    azure_cli_common.enable_profiles()
+    VMPool(path=args.pool).drain(os.environ.get(_PASSWORD_ENV),
+                                 args.timeout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
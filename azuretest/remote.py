@@ -280,7 +280,7 @@ class AexpectIOWrapperOut(messenger.StdIOWrapperOutBase64):
 
 def wait_for_login(client, host, port, username, password, prompt,
                    linesep="\n", log_filename=None, timeout=240,
-                   internal_timeout=10, interface=None):
+                   internal_timeout=10, interface=None, deadline=None):
     """
     Make multiple attempts to log into a guest until one succeeds or timeouts.
 
@@ -290,24 +290,41 @@ def wait_for_login(client, host, port, username, password, prompt,
                              "Are you sure" prompt or the password prompt)
     :interface: The interface the neighbours attach to (only use when using ipv6
                 linklocal address.)
+    :param deadline: utils_misc.Deadline of the calling operation; the
+                     attempts stop when it passes, without the last attempt
+                     made once the timeout expired
     :see: remote_login()
     :raise: Whatever remote_login() raises
+    :raise DeadlineExceededError: If the deadline passed before any attempt
     :return: A ShellSession object.
     """
     logging.debug("Attempting to log into %s:%s using %s (timeout %ds)",
                   host, port, client, timeout)
-    end_time = time.time() + timeout
+    login_deadline = utils_misc.Deadline.within(deadline, timeout,
+                                                "login to %s" % host)
     verbose = False
-    while time.time() < end_time:
+    error = None
+    while not login_deadline.expired():
         try:
             return remote_login(client, host, port, username, password, prompt,
-                                linesep, log_filename, internal_timeout,
+                                linesep, log_filename,
+                                login_deadline.get_timeout(internal_timeout),
                                 interface, verbose=verbose)
         except LoginError, e:
             logging.debug(e)
             verbose = True
-        time.sleep(2)
+            error = e
+        except utils_misc.DeadlineExceededError:
+            break
+        login_deadline.sleep(2)
+    if deadline is not None and deadline.expired():
+        # The budget of the calling operation is spent
+        if error is not None:
+            raise error
+        login_deadline.check()
     # Timeout expired; try one more time but don't catch exceptions
+    if deadline is not None:
+        internal_timeout = deadline.get_timeout(internal_timeout)
     return remote_login(client, host, port, username, password, prompt,
                         linesep, log_filename, internal_timeout, interface)
 
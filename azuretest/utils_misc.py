@@ -26,6 +26,7 @@ import threading
 import platform
 import traceback
 import json
+import pipes
 
 from avocado.core import status
 from avocado.core import exceptions
@@ -92,6 +93,114 @@ def add_option(option, value, option_type=None):
     return ""
 
 
+def cmdline(cmd):
+    """
+    Get the command line of a command.
+
+    :param cmd: Command line, or list of the program and its arguments
+    :return: The command line, with the arguments quoted for the shell
+    """
+    if isinstance(cmd, basestring):
+        return cmd
+    return " ".join(pipes.quote(arg) for arg in cmd)
+
+
+class DeadlineExceededError(Exception):
+
+    def __init__(self, name, timeout):
+        Exception.__init__(self, name, timeout)
+        self.name = name
+        self.timeout = timeout
+
+    def __str__(self):
+        return "Deadline of %s (%ss) exceeded" % (self.name, self.timeout)
+
+
+class Deadline(object):
+
+    """
+    Time budget shared by an operation and the steps it is made of.
+
+    The steps get the remaining time as their timeout, so a composite
+    operation can't run longer than its budget, and fail fast once it is
+    spent.
+    """
+
+    def __init__(self, timeout=None, name="operation"):
+        """
+        :param timeout: Budget (seconds), None for no deadline
+        :param name: Name of the operation, for the error messages
+        """
+        self.name = name
+        self.timeout = timeout
+        self.end_time = None
+        if timeout is not None:
+            self.end_time = time.time() + timeout
+
+    @classmethod
+    def within(cls, deadline, timeout, name=None):
+        """
+        Get the deadline of a step.
+
+        :param deadline: Deadline of the whole operation, or None
+        :param timeout: Budget (seconds) of the step, or None
+        :param name: Name of the step
+        :return: A Deadline ending with the step budget or the operation
+                 one, whichever comes first
+        """
+        step = cls(timeout, name or getattr(deadline, "name", "operation"))
+        if deadline is not None and deadline.end_time is not None and \
+           (step.end_time is None or deadline.end_time < step.end_time):
+            step.end_time = deadline.end_time
+            step.timeout = deadline.timeout
+        return step
+
+    def remaining(self):
+        """
+        :return: Time (seconds) left, None if there is no deadline
+        """
+        if self.end_time is None:
+            return None
+        return max(0, self.end_time - time.time())
+
+    def expired(self):
+        return self.end_time is not None and time.time() >= self.end_time
+
+    def check(self):
+        """
+        :raise DeadlineExceededError: If the deadline has passed
+        """
+        if self.expired():
+            raise DeadlineExceededError(self.name, self.timeout)
+
+    def sleep(self, seconds):
+        """
+        Sleep, but not past the deadline.
+
+        :param seconds: Time (seconds) to sleep
+        """
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        time.sleep(seconds)
+
+    def get_timeout(self, timeout=None):
+        """
+        Get the timeout of a step.
+
+        :param timeout: Own timeout (seconds) of the step, or None
+        :return: The smaller of the timeout and the time left
+        :raise DeadlineExceededError: If the deadline has passed
+        """
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
+
+
 # An easy way to log lines to files when the logging system can't be used
 
 _open_log_files = {}
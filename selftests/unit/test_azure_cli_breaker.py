@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from avocado.utils import process
+
+from azuretest import azure_cli_breaker
+
+
+KEY = ("asm", "vm create", "East US")
+
+
+def result(exit_status=0, stderr=""):
+    return process.CmdResult("azure vm create", "", stderr, exit_status, 1)
+
+
+FAILED = result(1, "error: InternalServerError")
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="azure_cli_breaker_")
+        self.path = os.path.join(self.tmpdir, "circuits")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def breaker(self, cool_off=300):
+        return azure_cli_breaker.CircuitBreaker(min_calls=4, window=4,
+                                                cool_off=cool_off,
+                                                path=self.path)
+
+    def test_circuit_key(self):
+        self.assertEqual(azure_cli_breaker.circuit_key(
+            ["azure", "vm", "create", "--location", "East US"], "asm"), KEY)
+        self.assertEqual(azure_cli_breaker.circuit_key(
+            "azure vm create -l 'East US'", "asm"), KEY)
+        self.assertEqual(azure_cli_breaker.circuit_key(
+            ["azure", "vm", "show", "vm1"]), ("", "vm show", ""))
+
+    def test_user_errors_keep_closed(self):
+        breaker = self.breaker()
+        for _ in range(8):
+            breaker.before(KEY)
+            breaker.after(KEY, result(1, "error: ResourceNotFound"))
+        self.assertEqual(breaker.state(KEY), azure_cli_breaker.CLOSED)
+
+    def test_open(self):
+        breaker = self.breaker()
+        for _ in range(3):
+            breaker.before(KEY)
+            breaker.after(KEY, FAILED)
+        self.assertEqual(breaker.state(KEY), azure_cli_breaker.CLOSED)
+        breaker.before(KEY)
+        breaker.after(KEY, result())
+        self.assertEqual(breaker.state(KEY), azure_cli_breaker.OPEN)
+        self.assertRaises(azure_cli_breaker.CircuitOpenError,
+                          breaker.before, KEY)
+        self.assertEqual(breaker.short_circuited, 1)
+        # The other circuits are not affected
+        breaker.before(("asm", "vm create", "West US"))
+
+    def test_half_open_to_closed(self):
+        breaker = self.breaker(cool_off=0)
+        for _ in range(4):
+            breaker.before(KEY)
+            breaker.after(KEY, FAILED)
+        self.assertEqual(breaker.state(KEY), azure_cli_breaker.OPEN)
+        breaker.before(KEY)
+        self.assertEqual(breaker.state(KEY), azure_cli_breaker.HALF_OPEN)
+        breaker.after(KEY, result())
+        self.assertEqual(breaker.state(KEY), azure_cli_breaker.CLOSED)
+
+    def test_half_open_to_open(self):
+        breaker = self.breaker(cool_off=0)
+        for _ in range(4):
+            breaker.before(KEY)
+            breaker.after(KEY, FAILED)
+        breaker.before(KEY)
+        breaker.after(KEY, FAILED)
+        self.assertEqual(breaker.state(KEY), azure_cli_breaker.OPEN)
+
+    def test_one_probe(self):
+        breaker = self.breaker(cool_off=0)
+        for _ in range(4):
+            breaker.before(KEY)
+            breaker.after(KEY, FAILED)
+        breaker.cool_off = 300
+        breaker._update(KEY, lambda circuit, now: circuit.update(
+            since=now - 300))
+        breaker.before(KEY)
+        self.assertEqual(breaker.state(KEY), azure_cli_breaker.HALF_OPEN)
+        # The probe is running, the other commands wait for its outcome
+        self.assertRaises(azure_cli_breaker.CircuitOpenError,
+                          breaker.before, KEY)
+
+    def test_shared_state(self):
+        breaker = self.breaker()
+        for _ in range(4):
+            breaker.before(KEY)
+            breaker.after(KEY, FAILED)
+        other = self.breaker()
+        self.assertEqual(other.state(KEY), azure_cli_breaker.OPEN)
+        other.reset()
+        self.assertEqual(breaker.state(KEY), azure_cli_breaker.CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import time
+import unittest
+
+from avocado.utils import process
+
+from azuretest import azure_cli_cache
+from azuretest import azure_cli_common
+
+
+def result(stdout="{}"):
+    return process.CmdResult("azure", stdout, "", 0, 1)
+
+
+class CallKeyTest(unittest.TestCase):
+
+    def test_same_call(self):
+        self.assertEqual(
+            azure_cli_common.call_key("asm", "vm_show", ("vm1",),
+                                      {"timeout": 10, "azure_json": True}),
+            azure_cli_common.call_key("asm", "vm_show", ("vm1",),
+                                      {"azure_json": True, "timeout": 10}))
+
+    def test_ignored_kwargs(self):
+        self.assertEqual(
+            azure_cli_common.call_key("asm", "vm_show", ("vm1",), {}),
+            azure_cli_common.call_key("asm", "vm_show", ("vm1",),
+                                      {"debug": True, "priority": 1,
+                                       "deadline": object()}))
+
+    def test_different_calls(self):
+        key = azure_cli_common.call_key("asm", "vm_show", ("vm1",), {})
+        self.assertNotEqual(
+            key, azure_cli_common.call_key("arm", "vm_show", ("vm1",), {}))
+        self.assertNotEqual(
+            key, azure_cli_common.call_key("asm", "vm_show", ("vm2",), {}))
+        self.assertNotEqual(
+            key, azure_cli_common.call_key("asm", "vm_show", ("vm1",),
+                                           {"timeout": 10}))
+
+
+class CLICacheTest(unittest.TestCase):
+
+    def test_ttl(self):
+        cache = azure_cli_cache.CLICache({"container_show": 0.2})
+        key = ("asm", "container_show", "[]")
+        cache.put(key, "container", result(), cache.generation)
+        self.assertEqual(cache.get(key).stdout, "{}")
+        time.sleep(0.3)
+        self.assertEqual(cache.get(key), None)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_polled_not_cached(self):
+        cache = azure_cli_cache.CLICache()
+        for verb in ("vm_show", "vm_list", "blob_list", "blob_copy_show"):
+            key = ("asm", verb, "[]")
+            cache.put(key, "vm", result(), cache.generation)
+            self.assertEqual(cache.get(key), None, "%s cached" % verb)
+
+    def test_copy(self):
+        cache = azure_cli_cache.CLICache()
+        key = ("asm", "container_show", "[]")
+        cache.put(key, "container", result({"name": "vhds"}),
+                  cache.generation)
+        cache.get(key).stdout["name"] = "changed"
+        self.assertEqual(cache.get(key).stdout["name"], "vhds")
+
+    def test_invalidate(self):
+        cache = azure_cli_cache.CLICache()
+        container = ("asm", "container_show", "[]")
+        account = ("asm", "sto_acct_conn_show", "[]")
+        cache.put(container, "container", result(), cache.generation)
+        cache.put(account, "sto_acct", result(), cache.generation)
+        generation = cache.generation
+        cache.invalidate(("container", "blob"))
+        self.assertEqual(cache.get(container), None)
+        self.assertNotEqual(cache.get(account), None)
+        # A result read before the invalidation is not cached
+        cache.put(container, "container", result(), generation)
+        self.assertEqual(cache.get(container), None)
+
+    def test_wrappers(self):
+        calls = []
+
+        def container_show(name, **kwargs):
+            calls.append(name)
+            return result()
+
+        def container_delete(name, **kwargs):
+            return result()
+
+        namespace = {"container_show": container_show,
+                     "container_delete": container_delete}
+        azure_cli_cache.install(namespace, "asm")
+        azure_cli_cache.enable()
+        try:
+            namespace["container_show"]("vhds")
+            namespace["container_show"]("vhds", debug=True)
+            self.assertEqual(calls, ["vhds"])
+            namespace["container_delete"]("vhds")
+            namespace["container_show"]("vhds")
+            self.assertEqual(calls, ["vhds", "vhds"])
+        finally:
+            azure_cli_cache.disable()
+
+
+if __name__ == "__main__":
+    unittest.main()
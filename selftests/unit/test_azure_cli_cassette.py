@@ -0,0 +1,76 @@
+import json
+import unittest
+
+from azuretest import azure_cli_cassette
+
+
+CONNECTION_STRING = ("DefaultEndpointsProtocol=https;AccountName=walaauto;"
+                     "AccountKey=c2VjcmV0a2V5")
+SAS = "sv=2015-04-05&sr=c&sig=c2lnbmF0dXJl&se=2016-05-01"
+
+
+class ScrubTest(unittest.TestCase):
+
+    def test_argv(self):
+        argv = ["azure", "storage", "blob", "list", "--container", "vhds",
+                "--connection-string", CONNECTION_STRING, "--sas", SAS]
+        self.assertEqual(azure_cli_cassette.scrub(argv),
+                         ["azure", "storage", "blob", "list", "--container",
+                          "vhds", "--connection-string", "***", "--sas",
+                          "***"])
+        # The command itself is unchanged
+        self.assertEqual(argv[7], CONNECTION_STRING)
+
+    def test_command_line(self):
+        self.assertEqual(azure_cli_cassette.scrub(
+            "azure vm create svc img --password 'p w' --vm-size Small"),
+            "azure vm create svc img --password *** --vm-size Small")
+
+    def test_secret_arg(self):
+        argv = ["azure", "vm", "disk", "upload", "/tmp/disk.vhd",
+                "https://walaauto.blob.core.windows.net/vhds/disk.vhd",
+                "c2VjcmV0a2V5"]
+        self.assertEqual(azure_cli_cassette.scrub(argv)[6], "***")
+        self.assertEqual(azure_cli_cassette.scrub(" ".join(argv)),
+                         " ".join(argv[:6] + ["***"]))
+
+    def test_no_secret(self):
+        argv = ["azure", "vm", "show", "vm1", "--dns-name", "svc"]
+        self.assertEqual(azure_cli_cassette.scrub(argv), argv)
+
+
+class ScrubOutputTest(unittest.TestCase):
+
+    def test_json_fields(self):
+        stdout = json.dumps({"name": "walaauto",
+                             "primaryKey": "c2VjcmV0a2V5",
+                             "secondaryKey": "c2VjcmV0a2V5",
+                             "string": CONNECTION_STRING})
+        data = json.loads(azure_cli_cassette.scrub_output(stdout))
+        self.assertEqual(data, {"name": "walaauto", "primaryKey": "***",
+                                "secondaryKey": "***",
+                                "string": "DefaultEndpointsProtocol=https;"
+                                          "AccountName=walaauto;"
+                                          "AccountKey=***"})
+
+    def test_arm_keys(self):
+        keys = [{"keyName": "key1", "value": "c2VjcmV0a2V5",
+                 "permissions": "Full"}]
+        self.assertEqual(azure_cli_cassette.scrub_output(keys),
+                         [{"keyName": "key1", "value": "***",
+                           "permissions": "Full"}])
+
+    def test_text(self):
+        self.assertEqual(azure_cli_cassette.scrub_output(
+            "info:    sas: %s\n" % SAS),
+            "info:    sas: sv=2015-04-05&sr=c&sig=***&se=2016-05-01\n")
+
+    def test_no_secret(self):
+        self.assertEqual(azure_cli_cassette.scrub_output("info: ok\n"),
+                         "info: ok\n")
+        self.assertEqual(azure_cli_cassette.scrub_output({"value": 1}),
+                         {"value": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from azuretest import azure_cli_limiter
+from azuretest import azure_cli_priority
+
+
+class TokenBucketLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="azure_cli_limiter_")
+        self.path = os.path.join(self.tmpdir, "bucket")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_headroom_below_burst(self):
+        limiter = azure_cli_limiter.TokenBucketLimiter(
+            rate=5, burst=1, path=self.path, headroom=10)
+        self.assertEqual(limiter.headroom, 0)
+
+    def test_background_with_burst_one(self):
+        limiter = azure_cli_limiter.TokenBucketLimiter(rate=100, burst=1,
+                                                       path=self.path)
+        for _ in range(3):
+            wait = limiter.acquire(azure_cli_priority.BACKGROUND)
+            self.assertTrue(wait < 1, "Waited %ss for a token" % wait)
+
+    def test_background_keeps_headroom(self):
+        limiter = azure_cli_limiter.TokenBucketLimiter(rate=0.001, burst=4,
+                                                       path=self.path)
+        self.assertEqual(limiter.reserve_background(), 0)
+        self.assertEqual(limiter.reserve_background(), 0)
+        self.assertTrue(limiter.reserve_background() > 0)
+        # The FOREGROUND commands still get the headroom
+        self.assertEqual(limiter.reserve(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
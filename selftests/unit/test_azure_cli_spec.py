@@ -0,0 +1,97 @@
+import shlex
+import unittest
+
+from azuretest import azure_cli_asm
+from azuretest import azure_cli_arm
+from azuretest.utils_misc import add_option
+
+
+def old_argv(cmd, positionals):
+    """
+    Split a command line built like the former hand-written wrappers.
+
+    :param cmd: Command line
+    :param positionals: Number of the leading words kept in order, the
+                        options may come in any order
+    :return: A tuple (leading words, sorted options)
+    """
+    # add_option("", value) gave an empty word before the value
+    words = [word for word in shlex.split(cmd) if word]
+    return words[:positionals], sorted(words[positionals:])
+
+
+def new_argv(ret, positionals):
+    argv, _ = ret
+    return argv[:positionals], sorted(argv[positionals:])
+
+
+class CommandSpecTest(unittest.TestCase):
+
+    def test_vm_show(self):
+        params = {"DNSName": "svc"}
+        cmd = "azure vm show %s %s" % ("vm1", "")
+        cmd += add_option("--dns-name", params.get("DNSName", None))
+        for cli in (azure_cli_asm, azure_cli_arm):
+            ret = cli.vm_show("vm1", params, dry_run=True)
+            self.assertEqual(new_argv(ret, 4), old_argv(cmd, 4))
+            self.assertTrue(ret[1]["azure_json"])
+
+    def test_vm_create(self):
+        params = {"DNSName": "svc", "Image": "img", "VMName": "vm1",
+                  "username": "user", "password": "p w", "VMSize": "Small",
+                  "Location": "East US"}
+        cmd = "azure vm create"
+        cmd += add_option("", params.get("DNSName", None))
+        cmd += add_option("", params.get("Image", None))
+        cmd += add_option("--vm-name", params.get("VMName", None))
+        cmd += add_option("--userName", params.get("username", None))
+        cmd += add_option("--password", params.get("password", None))
+        cmd += add_option("--vm-size", params.get("VMSize", None))
+        cmd += add_option("--location", params.get("Location", None))
+        ret = azure_cli_asm.vm_create(params, dry_run=True)
+        self.assertEqual(new_argv(ret, 5), old_argv(cmd, 5))
+
+    def test_vm_delete(self):
+        params = {"DNSName": "svc", "blob_delete": True}
+        cmd = "azure vm delete %s %s --quiet" % ("vm1", "--extra x")
+        cmd += add_option("--dns-name", params.get("DNSName", None))
+        cmd += add_option("--blob-delete", params.get("blob_delete", None))
+        ret = azure_cli_asm.vm_delete("vm1", params, "--extra x",
+                                      dry_run=True)
+        self.assertEqual(new_argv(ret, 4), old_argv(cmd, 4))
+
+    def test_vm_disk_attach_new(self):
+        params = {"host_caching": "ReadOnly"}
+        cmd = "azure vm disk attach-new %s %s %s" % ("vm1", 10, "")
+        cmd += add_option("--host-caching", params.get("host_caching", None))
+        cmd += add_option("--dns-name", params.get("DNSName", None))
+        ret = azure_cli_asm.vm_disk_attach_new("vm1", 10, params,
+                                               dry_run=True)
+        self.assertEqual(new_argv(ret, 6), old_argv(cmd, 6))
+
+    def test_blob_copy_start(self):
+        params = {"source_container": "src", "source_blob": "a.vhd",
+                  "dest_container": "dst", "dest_blob": "b.vhd",
+                  "connection_string": "DefaultEndpointsProtocol=https"}
+        cmd = "azure storage blob copy start %s" % "--quiet"
+        for flag, key in [("--source-sas", "source_sas"),
+                          ("--source-uri", "source_uri"),
+                          ("--source-container", "source_container"),
+                          ("--source-blob", "source_blob"),
+                          ("--dest-connection-string",
+                           "dest_connection_string"),
+                          ("--dest-sas", "dest_sas"),
+                          ("--dest-container", "dest_container"),
+                          ("--dest-blob", "dest_blob"),
+                          ("--connection-string", "connection_string")]:
+            cmd += add_option(flag, params.get(key, None))
+        ret = azure_cli_asm.blob_copy_start(params, "--quiet", dry_run=True)
+        self.assertEqual(new_argv(ret, 5), old_argv(cmd, 5))
+
+    def test_no_params(self):
+        argv, _ = azure_cli_asm.vm_list(dry_run=True)
+        self.assertEqual(argv, ["azure", "vm", "list"])
+
+
+if __name__ == "__main__":
+    unittest.main()
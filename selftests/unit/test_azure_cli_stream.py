@@ -0,0 +1,58 @@
+import json
+import unittest
+
+from azuretest import azure_cli_stream
+
+
+ARRAY = [{"name": "a.vhd", "tags": ["x", "y]"], "size": 1},
+         {"name": "b \"quoted\" \\ [vhd]", "nested": {"k": [1, {"v": "}"}]}},
+         "text", 12, 3.5, True, None, [], {}]
+
+
+def decode(text, size):
+    decoder = azure_cli_stream.JSONArrayDecoder()
+    items = []
+    for start in range(0, len(text), size):
+        items.extend(decoder.feed(text[start:start + size]))
+    return decoder, items
+
+
+class JSONArrayDecoderTest(unittest.TestCase):
+
+    def test_whole(self):
+        decoder, items = decode(json.dumps(ARRAY), 65536)
+        self.assertEqual(items, ARRAY)
+        self.assertTrue(decoder.done)
+
+    def test_chunks(self):
+        text = json.dumps(ARRAY, indent=2)
+        for size in (1, 2, 3, 7, 16):
+            decoder, items = decode(text, size)
+            self.assertEqual(items, ARRAY, "Chunks of %d bytes" % size)
+            self.assertTrue(decoder.done)
+
+    def test_elements_as_they_complete(self):
+        decoder = azure_cli_stream.JSONArrayDecoder()
+        self.assertEqual(decoder.feed('[{"a": 1}, {"b"'), [{"a": 1}])
+        self.assertEqual(decoder.feed(': 2}'), [{"b": 2}])
+        self.assertFalse(decoder.done)
+        self.assertEqual(decoder.feed(']\n'), [])
+        self.assertTrue(decoder.done)
+
+    def test_leading_text(self):
+        # The cli may print a few lines before the JSON output
+        _, items = decode('\n  [1, 2]', 3)
+        self.assertEqual(items, [1, 2])
+
+    def test_empty(self):
+        decoder, items = decode("[]", 1)
+        self.assertEqual(items, [])
+        self.assertTrue(decoder.done)
+
+    def test_not_an_array(self):
+        decoder = azure_cli_stream.JSONArrayDecoder()
+        self.assertRaises(ValueError, decoder.feed, '{"a": 1}')
+
+
+if __name__ == "__main__":
+    unittest.main()
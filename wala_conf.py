@@ -1,43 +1,83 @@
+import os
 import time
 
 from avocado import Test
 from avocado import main
 
 from azuretest import azure_cli_common
-from azuretest import azure_asm_vm
+from azuretest import azure_cli_metrics
+from azuretest import azure_cli_accounting
 from azuretest import azure_image
+from azuretest import azure_tracker
+from azuretest import azure_vm_pool
+from azuretest import azure_vm_fixture
+from azuretest import azure_vm_lookahead
 
 
 def collect_vm_params(params):
-    return
+    """
+    :param params: avocado params of a variant of the test
+    :return: A tuple of the vm parameters and the azure mode of the variant
+    """
+    vm_params = dict()
+    vm_params["username"] = params.get('username', '*/VMUser/*')
+    vm_params["password"] = params.get('password', '*/VMUser/*')
+    vm_params["VMSize"] = params.get('vm_size', '*/wala_conf/*')
+    vm_params["VMName"] = params.get('vm_name', '*/wala_conf/*')
+    vm_params["DNSName"] = vm_params["VMName"]
+    vm_params["Image"] = params.get('name', '*/Image/*')
+    vm_params["Location"] = params.get('location', '*/Image/*')
+    return vm_params, "asm"
 
 
 class WALAConfTest(Test):
 
+    # The tests alter the vm, each of them gets its own
+    vm_fixture = azure_vm_fixture.VMFixture()
+
     def setUp(self):
+        # Count the cli calls of the test, within its budget if any
+        azure_cli_accounting.start(self.params.get('calls', '*/CliBudget/*'),
+                                   name=str(self.name))
+        # Lease the VMs from a warm pool if one is configured
+        pool_size = int(self.params.get('size', '*/VMPool/*', default=0))
+        if pool_size:
+            azure_vm_pool.enable(pool_size)
+        # Poll the pending VM states and blob copies in bulk
+        interval = int(self.params.get('interval', '*/Tracker/*', default=0))
+        if interval and azure_tracker.get_tracker() is None:
+            azure_tracker.enable(interval)
         # Login Azure and change the mode
         self.azure_username = self.params.get('username', '*/AzureSub/*')
         self.azure_password = self.params.get('password', '*/AzureSub/*')
-        azure_cli_common.login_azure(username=self.azure_username,
-                                     password=self.azure_password)
+        azure_cli_common.ensure_login(username=self.azure_username,
+                                      password=self.azure_password)
         azure_cli_common.set_config_mode("asm")
+        azure_cli_common.set_backend(
+            self.params.get('name', '*/Backend/*', default='cli'), "asm",
+            endpoint=self.params.get('endpoint', '*/Backend/*'),
+            subscription_id=self.params.get('subscription_id', '*/Backend/*'),
+            cert_file=self.params.get('cert_file', '*/Backend/*'),
+            key_file=self.params.get('key_file', '*/Backend/*'))
 
         # Prepare the vm parameters and create a vm
-        self.vm_params = dict()
-        self.vm_params["username"] = self.params.get('username', '*/VMUser/*')
-        self.vm_params["password"] = self.params.get('password', '*/VMUser/*')
-        self.vm_params["VMSize"] = self.params.get('vm_size', '*/wala_conf/*')
-        self.vm_params["VMName"] = self.params.get('vm_name', '*/wala_conf/*')
-        self.vm_params["DNSName"] = self.vm_params["VMName"]
-        self.vm_params["Image"] = self.params.get('name', '*/Image/*')
-        self.vm_params["Location"] = self.params.get('location', '*/Image/*')
-        self.vm_params["VMName"] = self.params.get('vm_name', '*/wala_conf/*')
-        self.vm_test01 = azure_asm_vm.VMASM(self.vm_params["VMName"],
-                                            self.vm_params["VMSize"],
-                                            self.vm_params)
-        self.log.debug("Create the vm %s", self.vm_params["VMName"])
-        self.vm_test01.vm_create()
-        self.vm_test01.start()
+        self.vm_params, _ = collect_vm_params(self.params)
+        self.log.debug("Get the vm %s", self.vm_params["VMName"])
+        self.vm_test01 = self.vm_fixture.acquire(self, self.vm_params, "asm")
+        # Create the vms of the next tests while this one runs
+        azure_vm_lookahead.advance(
+            self, self.vm_params, "asm",
+            int(self.params.get('depth', '*/LookAhead/*', default=1)))
+
+    def tearDown(self):
+        # Keep the vm for the next test of the class, or tear it down
+        self.vm_fixture.release(self, self.vm_test01)
+        # Report the cli calls of this test
+        azure_cli_accounting.stop(os.path.join(self.logdir,
+                                               "azure_cli_calls.json"))
+        # Add the cli metrics of this test to the ones of the job
+        azure_cli_metrics.dump(os.path.join(self.job.logdir,
+                                            "azure_cli_metrics.json"))
 
     def test_delete_root_passwd(self):
         """